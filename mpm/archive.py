@@ -0,0 +1,555 @@
+"""
+Local mod archive.
+
+The archive is the local catalog of the :class:`ModItem` collected by
+the repository spiders. It is stored in a directory holding the catalog
+itself and the lookup indexes that are rebuilt every time the catalog is
+committed, at the end of a sync. The mod descriptions and licenses are
+kept compressed in a :class:`textstore.TextStore` next to the catalog,
+and each commit appends what it changed to a :class:`changes.ChangeLog`.
+
+Each commit makes a new generation of the archive. The indexes are
+written per generation and the catalog is renamed in place last, so a
+reader always sees a complete catalog and the indexes that match it,
+without taking any lock. Writers commit under the archive lock and merge
+their changes with the commits made since they loaded the archive, see
+:mod:`locking`.
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+import os
+import re
+import json
+import errno
+import logging
+
+from datetime import date, datetime
+
+import six
+
+from .items import ModItem, ModFileItem
+from .index import TrigramIndex, SearchIndex, normalize_name, mod_slug, popularity
+from .locking import FileLock, atomic_path
+from .textstore import TextStore
+from .changes import ChangeLog
+from .dependencies import DependencyGraph
+
+__all__ = ("ModArchive",)
+
+logger = logging.getLogger(__name__)
+
+
+def item_to_record(item):
+    """
+    Convert a mod item to a json serializable record
+    :param item: the mod item
+    :type item: :class:`ModItem`
+    :return: the item record
+    :rtype: dict
+    """
+    record = {}
+    for key, value in item.items():
+        if isinstance(value, date):
+            value = value.isoformat()
+        elif isinstance(value, (set, frozenset)):
+            value = sorted(value)
+        record[key] = value
+    return record
+
+
+DATE_FIELDS = ("created", "updated", "uploaded")
+""" Record fields holding dates """
+
+VOLATILE_FIELDS = ("downloads", "popularity")
+""" Record fields changing at every sync, not reported in the change log """
+
+TEXT_FIELDS = ("description", "mod_license")
+""" Record fields kept in the text store, the record holds their hashes
+in its ``texts`` field """
+
+
+def _flat_texts(record):
+    """
+    Replace the ``texts`` field of a record by one field per text,
+    holding the text hash, to compare records field by field
+    """
+    record = dict(record)
+    record.update(record.pop("texts", None) or {})
+    return record
+
+
+def record_to_item(record, cls=ModItem):
+    """
+    Convert an archive record back to an item
+    :param record: the record
+    :type record: dict
+    :param cls: item class
+    :type cls: type
+    :return: the item
+    :rtype: :class:`ModItem` or :class:`ModFileItem`
+    """
+    item = cls()
+    for key, value in record.items():
+        if key in DATE_FIELDS and value:
+            value = datetime.strptime(value, "%Y-%m-%d").date()
+        item[key] = value
+    return item
+
+
+class ModArchive(object):
+    """
+    The local mod archive.
+
+    Mods are identified by their mod page url. The catalog is loaded
+    explicitly with :meth:`load`, changes made with :meth:`update` are
+    written to disk only by :meth:`commit`.
+    """
+
+    CATALOG = "catalog.json"
+    """ Catalog file name """
+
+    NAME_INDEX = "names.{0}.idx"
+    """ Fuzzy name index file name, for each generation """
+
+    SEARCH_INDEX = "search.{0}.idx"
+    """ Full text search index file name, for each generation """
+
+    LOCK = ".lock"
+    """ Archive lock file name, held by the writers """
+
+    KEEP_GENERATIONS = 2
+    """ Number of older index generations kept for the readers still
+    using an older catalog """
+
+    def __init__(self, path, compression="zlib"):
+        """
+        :param path: archive directory
+        :type path: str
+        :param compression: compression of the stored texts, see
+        :class:`textstore.TextStore`
+        :type compression: str
+        """
+        self.path = path
+        self.texts = TextStore(path, compression)
+        self.changelog = ChangeLog(path)
+
+        self.generation = 0
+        """ Number of commits made to the archive """
+
+        self._records = {}
+        self._files = {}
+        self._updated = set()
+        self._updated_files = set()
+        self._removed = set()
+        self._name_index = None
+        self._search_index = None
+        self._graph = None
+
+    @classmethod
+    def from_settings(cls, settings):
+        """
+        Create the archive configured in the mpm settings
+        :param settings: scrapy settings
+        :type settings: :class:`scrapy.settings.Settings`
+        """
+        return cls(os.path.expanduser(settings.get("MPM_ARCHIVE_DIR")),
+                   settings.get("MPM_TEXT_COMPRESSION"))
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def _read(self):
+        try:
+            with open(self._file(self.CATALOG), "rb") as fd:
+                catalog = json.loads(fd.read().decode("utf-8"))
+        except IOError as err:
+            if err.errno != errno.ENOENT:
+                raise
+            catalog = {"generation": 0, "mods": {}}
+        catalog.setdefault("files", {})
+        catalog.setdefault("texts", {})
+        return catalog
+
+    def load(self):
+        """
+        Load the catalog from the archive directory, an archive that has
+        never been committed is empty.
+        """
+        catalog = self._read()
+        self.generation = catalog["generation"]
+        self._records = catalog["mods"]
+        self._files = catalog["files"]
+        self.texts.load(catalog["texts"])
+        self._updated = set()
+        self._updated_files = set()
+        self._removed = set()
+        self._name_index = None
+        self._search_index = None
+        self._graph = None
+        return self
+
+    def __len__(self):
+        return len(self._records)
+
+    def __contains__(self, mod_url):
+        return mod_url in self._records
+
+    def __iter__(self):
+        for record in six.itervalues(self._records):
+            yield record_to_item(self._resolve(record))
+
+    def mods(self, texts=True):
+        """
+        Iterate the archived mods, sorted by mod url
+        :param texts: whether to read the mod descriptions and licenses
+        :type texts: bool
+        :return: iterator of :class:`ModItem`
+        :rtype: iterator
+        """
+        for mod_url in sorted(self._records):
+            yield record_to_item(self._resolve(self._records[mod_url], texts))
+
+    def _intern(self, record):
+        """
+        Move the text fields of a record to the text store
+        """
+        refs = record.get("texts") or {}
+        for field in TEXT_FIELDS:
+            text = record.pop(field, None)
+            if text:
+                refs[field] = self.texts.put(text)
+        if refs:
+            record["texts"] = refs
+        return record
+
+    def _resolve(self, record, texts=True):
+        """
+        Get a record with its text fields, the texts are decompressed
+        only here
+        """
+        if "texts" not in record:
+            return record
+        record = dict(record)
+        refs = record.pop("texts")
+        if texts:
+            for field, key in six.iteritems(refs):
+                record[field] = self.texts.get(key)
+        return record
+
+    def get(self, mod_url, texts=True):
+        """
+        Get a mod from the archive
+        :param mod_url: the mod page url
+        :type mod_url: str
+        :param texts: whether to read the mod description and license
+        :type texts: bool
+        :return: the mod item or None if the mod is not in the archive
+        :rtype: :class:`ModItem`
+        """
+        record = self._records.get(mod_url)
+        if record is None:
+            return None
+        return record_to_item(self._resolve(record, texts))
+
+    def update(self, items):
+        """
+        Add or replace mods in the archive, the popularity score of
+        each mod is computed here
+        :param items: iterable of :class:`ModItem`
+        :type items: iterable
+        """
+        for item in items:
+            record = self._intern(item_to_record(item))
+            record["popularity"] = popularity(item)
+            self._records[item["mod_url"]] = record
+            if self._graph is not None:
+                self._graph.add(item["mod_url"], record.get("dependencies"))
+            self._updated.add(item["mod_url"])
+            self._removed.discard(item["mod_url"])
+        self._name_index = None
+        self._search_index = None
+
+    def remove(self, mod_urls):
+        """
+        Remove mods and their files from the archive
+        :param mod_urls: iterable of mod page urls
+        :type mod_urls: iterable
+        """
+        for mod_url in mod_urls:
+            self._records.pop(mod_url, None)
+            self._files.pop(mod_url, None)
+            self._updated.discard(mod_url)
+            self._updated_files.discard(mod_url)
+            self._removed.add(mod_url)
+            if self._graph is not None:
+                self._graph.remove(mod_url)
+        self._name_index = None
+        self._search_index = None
+
+    def update_files(self, items):
+        """
+        Add or replace mod files in the archive
+        :param items: iterable of :class:`ModFileItem`
+        :type items: iterable
+        """
+        for item in items:
+            files = self._files.setdefault(item["mod_url"], {})
+            files[item["file_id"]] = item_to_record(item)
+            self._updated_files.add(item["mod_url"])
+
+    def files(self, mod_url):
+        """
+        Get the files released for a mod
+        :param mod_url: the mod page url
+        :type mod_url: str
+        :return: list of :class:`ModFileItem`, the most recent first
+        :rtype: list
+        """
+        records = sorted(six.itervalues(self._files.get(mod_url, {})),
+                         key=lambda record: (record.get("uploaded") or "",
+                                             int(record["file_id"])),
+                         reverse=True)
+        return [record_to_item(record, ModFileItem) for record in records]
+
+    def file_ids(self, mod_url):
+        """
+        Get the ids of the files known for a mod
+        :param mod_url: the mod page url
+        :type mod_url: str
+        :rtype: set
+        """
+        return set(self._files.get(mod_url, ()))
+
+    def _merge(self, catalog):
+        """
+        Apply the changes made since the archive was loaded to a catalog
+        committed meanwhile by another process
+        """
+        logger.info("Archive generation %d committed meanwhile, merging %d mods",
+                    catalog["generation"], len(self._updated))
+        records, files = catalog["mods"], catalog["files"]
+        for mod_url in self._updated:
+            records[mod_url] = self._records[mod_url]
+        for mod_url in self._updated_files:
+            files.setdefault(mod_url, {}).update(self._files[mod_url])
+        for mod_url in self._removed:
+            records.pop(mod_url, None)
+            files.pop(mod_url, None)
+        self._records, self._files = records, files
+        self._graph = None
+
+    def _diff(self, catalog):
+        """
+        Compute the changes made to the catalog on disk by this commit
+        :return: list of changes, see :class:`changes.ChangeLog`
+        :rtype: list
+        """
+        changes = []
+        old_records, old_files = catalog["mods"], catalog["files"]
+        for mod_url in sorted(self._updated | self._updated_files | self._removed):
+            old = old_records.get(mod_url)
+            if mod_url in self._removed:
+                if old is not None:
+                    changes.append({"mod_url": mod_url, "change": "removed", "fields": [],
+                                    "old_updated": old.get("updated"), "new_updated": None})
+                continue
+            new = self._records.get(mod_url)
+            if new is None and old is None:
+                continue
+            fields = set()
+            if mod_url in self._updated:
+                old_fields, new_fields = _flat_texts(old or {}), _flat_texts(new)
+                for field in set(new_fields) | set(old_fields):
+                    if field not in VOLATILE_FIELDS and \
+                       old_fields.get(field) != new_fields.get(field):
+                        fields.add(field)
+            if set(self._files.get(mod_url, ())) - set(old_files.get(mod_url, ())):
+                fields.add("files")
+            if fields:
+                changes.append({"mod_url": mod_url,
+                                "change": "updated" if old is not None else "added",
+                                "fields": sorted(fields),
+                                "old_updated": (old or {}).get("updated"),
+                                "new_updated": (new or old).get("updated")})
+        return changes
+
+    def _collect(self):
+        """
+        Remove the index generations no reader should need anymore
+        """
+        for name in os.listdir(self.path):
+            match = re.match(r"^(?:names|search)\.(\d+)\.idx$", name)
+            if match and int(match.group(1)) <= self.generation - self.KEEP_GENERATIONS:
+                try:
+                    os.remove(self._file(name))
+                except OSError as err:
+                    if err.errno != errno.ENOENT:
+                        raise
+
+    def commit(self):
+        """
+        Write the catalog and rebuild the archive indexes as a new
+        generation of the archive.
+
+        The commit is made under the archive lock; if another process
+        committed since the archive was loaded, the changes made here are
+        merged with its commit. The indexes of the new generation are
+        written first and the catalog is atomically replaced last, so
+        that readers never see a partial generation. What the commit
+        changed in the catalog on disk is appended to the change log.
+        Nothing is written when nothing changed since the archive was
+        loaded, the generation stays the same.
+        :return: whether a new generation was committed
+        :rtype: bool
+        """
+        if not (self._updated or self._updated_files or self._removed):
+            return False
+        with FileLock(self._file(self.LOCK)):
+            catalog = self._read()
+            changes = self._diff(catalog)
+            previous = None
+            if catalog["generation"] != self.generation:
+                self._merge(catalog)
+            elif self._search_index is not None:
+                previous = self._search_index
+            else:
+                previous = self._read_search_index()
+            self.generation = catalog["generation"] + 1
+            for record in six.itervalues(self._records):
+                self._intern(record)
+            texts = self.texts.flush(catalog["texts"])
+            self.changelog.append(self.generation, changes)
+            name_index = TrigramIndex.build(six.itervalues(self._records))
+            search_index = SearchIndex.build(six.itervalues(self._records), self._resolve,
+                                             previous, self._updated)
+            for name, index in ((self.NAME_INDEX, name_index),
+                                (self.SEARCH_INDEX, search_index)):
+                with atomic_path(self._file(name.format(self.generation))) as tmp_path:
+                    index.save(tmp_path)
+            data = json.dumps({"generation": self.generation, "mods": self._records,
+                               "files": self._files, "texts": texts})
+            with atomic_path(self._file(self.CATALOG)) as tmp_path:
+                with open(tmp_path, "wb") as fd:
+                    fd.write(data.encode("utf-8"))
+            self._collect()
+        self._updated = set()
+        self._updated_files = set()
+        self._removed = set()
+        self._name_index = name_index
+        self._search_index = search_index
+        return True
+
+    def changes(self, since=0):
+        """
+        Get the changes committed after a generation, up to the loaded one
+        :param since: archive generation
+        :type since: int
+        :return: list of changes, oldest first, see :class:`changes.ChangeLog`
+        :rtype: list
+        """
+        return self.changelog.since(since, self.generation)
+
+    @property
+    def dependency_graph(self):
+        """
+        The dependencies between the archived mods, see
+        :class:`dependencies.DependencyGraph`; built on first use and kept
+        up to date by :meth:`update` and :meth:`remove`
+        """
+        if self._graph is None:
+            self._graph = DependencyGraph()
+            for mod_url, record in six.iteritems(self._records):
+                if record.get("dependencies"):
+                    self._graph.add(mod_url, record["dependencies"])
+        return self._graph
+
+    def dependents(self, mod_url):
+        """
+        Get the archived mods requiring a mod, directly or transitively
+        :param mod_url: the mod page url
+        :type mod_url: str
+        :return: the dependent mod urls
+        :rtype: set
+        """
+        return self.dependency_graph.dependents([mod_url])
+
+    @property
+    def name_index(self):
+        """
+        The fuzzy name index of the archive, see :class:`index.TrigramIndex`
+        """
+        if self._name_index is None:
+            try:
+                self._name_index = TrigramIndex.load(
+                    self._file(self.NAME_INDEX.format(self.generation)))
+            except IOError as err:
+                if err.errno != errno.ENOENT:
+                    raise
+                self._name_index = TrigramIndex.build(six.itervalues(self._records))
+        return self._name_index
+
+    @property
+    def search_index(self):
+        """
+        The full text search index of the archive, see :class:`index.SearchIndex`
+        """
+        if self._search_index is None:
+            self._search_index = self._read_search_index()
+        if self._search_index is None:
+            self._search_index = SearchIndex.build(six.itervalues(self._records),
+                                                   self._resolve)
+        return self._search_index
+
+    def _read_search_index(self):
+        """
+        Read the search index of the loaded generation, None if not built
+        """
+        try:
+            return SearchIndex.load(self._file(self.SEARCH_INDEX.format(self.generation)))
+        except IOError as err:
+            if err.errno != errno.ENOENT:
+                raise
+            return None
+
+    def search(self, query, limit=20, offset=0):
+        """
+        Search mods by name, category and description, the results are
+        ranked by relevance and popularity
+        :param query: search query
+        :type query: str
+        :param limit: number of results
+        :type limit: int
+        :param offset: number of results to skip
+        :type offset: int
+        :return: list of (score, :class:`ModItem`)
+        :rtype: list
+        """
+        return [(score, self.get(mod_url, texts=False)) for score, mod_url in
+                self.search_index.search(query, limit, offset)
+                if mod_url in self._records]
+
+    def find(self, name, limit=10):
+        """
+        Find mods by name, tolerating typos.
+        A mod whose name or slug matches exactly is always the first
+        candidate, the others are ranked by similarity.
+        :param name: mod name or slug
+        :type name: str
+        :param limit: maximum number of candidates
+        :type limit: int
+        :return: list of (similarity, :class:`ModItem`)
+        :rtype: list
+        """
+        candidates = []
+        key = normalize_name(name)
+        for score, mod_url in self.name_index.lookup(name, limit):
+            record = self._records.get(mod_url)
+            if record is None:
+                continue
+            slug = (mod_slug(mod_url) or "").replace("-", " ")
+            if key in (normalize_name(record.get("name") or ""), slug):
+                score = 1.0
+            candidates.append((score, record_to_item(self._resolve(record))))
+        candidates.sort(key=lambda candidate: candidate[0], reverse=True)
+        return candidates
@@ -0,0 +1,116 @@
+"""
+Archive change log.
+
+Every commit of the archive appends the mods it added, updated and
+removed to a change log, so that the changes since a given generation
+are read without comparing whole catalogs. The log is newline delimited
+json, one change per line::
+
+    {"generation": 12, "mod_url": "...", "change": "updated",
+     "fields": ["files", "updated"], "old_updated": "2015-05-10",
+     "new_updated": "2015-06-01"}
+
+A small binary index maps each generation to the range of the log its
+changes were written to, so reading the changes since generation N costs
+a lookup in the index and the read of the changes themselves.
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+import os
+import json
+import errno
+import struct
+import bisect
+
+__all__ = ("ChangeLog",)
+
+ENTRY = struct.Struct("<QQQ")
+""" Index entry: generation, start and end offset of its changes """
+
+
+class ChangeLog(object):
+    """
+    Append only log of the archive changes.
+
+    The log is written under the archive lock by
+    :meth:`archive.ModArchive.commit`, before the new catalog is renamed
+    in place; the entries left by a commit that did not complete are
+    dropped by the next one.
+    """
+
+    LOG = "changes.ndjson"
+    """ Change log file name """
+
+    INDEX = "changes.idx"
+    """ Generation index file name """
+
+    def __init__(self, path):
+        """
+        :param path: archive directory
+        :type path: str
+        """
+        self.path = path
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def _entries(self):
+        try:
+            with open(self._file(self.INDEX), "rb") as fd:
+                data = fd.read()
+        except IOError as err:
+            if err.errno != errno.ENOENT:
+                raise
+            return []
+        count = len(data) // ENTRY.size
+        return [ENTRY.unpack_from(data, n * ENTRY.size) for n in range(count)]
+
+    def append(self, generation, changes):
+        """
+        Write the changes of a generation
+        :param generation: the generation being committed
+        :type generation: int
+        :param changes: list of change dicts, the generation is added here
+        :type changes: list
+        """
+        entries = [entry for entry in self._entries() if entry[0] < generation]
+        end = entries[-1][2] if entries else 0
+        with open(self._file(self.LOG), "ab") as fd:
+            fd.truncate(end)
+            fd.seek(end)
+            for change in changes:
+                change = dict(change, generation=generation)
+                fd.write(json.dumps(change, sort_keys=True).encode("utf-8") + b"\n")
+            fd.flush()
+            os.fsync(fd.fileno())
+            entries.append((generation, end, fd.tell()))
+        with open(self._file(self.INDEX), "ab") as fd:
+            fd.truncate((len(entries) - 1) * ENTRY.size)
+            fd.seek(0, os.SEEK_END)
+            fd.write(ENTRY.pack(*entries[-1]))
+            fd.flush()
+            os.fsync(fd.fileno())
+
+    def since(self, generation, until=None):
+        """
+        Read the changes made after a generation
+        :param generation: changes of later generations are returned
+        :type generation: int
+        :param until: last generation to read, the generation of the
+        loaded catalog, later ones are ignored
+        :type until: int
+        :return: list of changes, oldest first
+        :rtype: list
+        """
+        entries = self._entries()
+        if until is not None:
+            entries = [entry for entry in entries if entry[0] <= until]
+        first = bisect.bisect_right([entry[0] for entry in entries], generation)
+        if first == len(entries):
+            return []
+        start, end = entries[first][1], entries[-1][2]
+        with open(self._file(self.LOG), "rb") as fd:
+            fd.seek(start)
+            data = fd.read(end - start)
+        return [json.loads(line) for line in data.decode("utf-8").splitlines() if line]
@@ -1,9 +1,328 @@
 # -*- coding: utf-8 -*-
 
+from __future__ import absolute_import
+
+import os
+import sys
+import json
 import argparse
 import six
 
+from scrapy.settings import Settings
+from scrapy.crawler import CrawlerProcess
+
+from mpm.archive import ModArchive
+from mpm.index import normalize_name, mod_slug
+from mpm.scanner import ModScanner
+from mpm.modpack import ModpackIndex, ModpackRegistry
+from mpm.verify import Verifier
+from mpm.fetch import refresh_mods
+from mpm.install import Installer
+from mpm.serverpack import ServerPackBuilder
+from mpm.columnar import export_columns
+from mpm.query import QueryEngine
+from mpm.querycache import QueryCache
+from mpm.daemon import MpmDaemon, DaemonClient
+from mpm.spiders.modinfo import repository_crawlers
+
+
+def get_settings(args):
+    """
+    Build the mpm settings for a command, the options given on the
+    command line override the ones in :mod:`mpm.settings`
+    """
+    settings = Settings()
+    settings.setmodule("mpm.settings", priority="project")
+    if args.archive:
+        settings.set("MPM_ARCHIVE_DIR", args.archive, priority="cmdline")
+    return settings
+
+
+def get_archive(args):
+    """
+    Load the local mod archive
+    """
+    return ModArchive.from_settings(get_settings(args)).load()
+
+
+def print_item(item):
+    """
+    Print the informations of a mod
+    """
+    for field in ("name", "mod_url", "authors", "categories", "created",
+                  "updated", "downloads", "source_url", "donation_url",
+                  "description"):
+        value = item.get(field)
+        if value is None:
+            continue
+        if isinstance(value, (list, tuple, set)):
+            value = ", ".join(sorted(value))
+        six.print_("{0}: {1}".format(field, value))
+
+
+def sync(args):
+    """
+    Sync the archive with the mod repositories, all the repositories
+    are crawled concurrently
+    """
+    settings = get_settings(args)
+    if args.export:
+        settings.set("MPM_EXPORT_PATH", args.export, priority="cmdline")
+    if args.shallow:
+        settings.set("MPM_SYNC_SHALLOW", True, priority="cmdline")
+    if args.discovery:
+        settings.set("MPM_SYNC_DISCOVERY", args.discovery, priority="cmdline")
+    if args.modpack:
+        settings.set("MPM_PRIORITY_MODPACKS", args.modpack, priority="cmdline")
+    process = CrawlerProcess(settings)
+    for crawler in repository_crawlers(settings, args.repositories):
+        process.crawl(crawler)
+    process.start()
+    return 0
+
+
+def run_query(args, command, **query_args):
+    """
+    Run a query on the daemon, or on the local archive when no daemon
+    is running
+    """
+    settings = get_settings(args)
+    if not args.standalone:
+        client = DaemonClient(settings.get("MPM_DAEMON_SOCKET"))
+        result = client.query(command, **query_args)
+        if result is not None:
+            return result
+    archive = ModArchive.from_settings(settings).load()
+    cache = None
+    if settings.getint("MPM_QUERY_CACHE_SIZE"):
+        cache = QueryCache.from_settings(settings).load()
+    result = QueryEngine(archive, cache).run(command, query_args)
+    if cache is not None:
+        cache.save()
+    return result
+
+
+def show(args):
+    """
+    Show a mod, the best fuzzy match is shown if no mod has exactly
+    the given name
+    """
+    candidates = run_query(args, "show", name=args.name)
+    if not candidates:
+        six.print_("No mod matching {0}".format(args.name))
+        return 1
+    if candidates[0]["score"] < 1.0:
+        six.print_("No mod named {0}, showing the closest match".format(args.name))
+    print_item(candidates[0]["mod"])
+    if len(candidates) > 1:
+        six.print_("Similar mods: {0}".format(
+            ", ".join(other["mod"]["name"] for other in candidates[1:])))
+    return 0
+
+
+def search(args):
+    """
+    Search mods, the most relevant and popular come first. When nothing
+    matches the search falls back to fuzzy name matching.
+    """
+    results = run_query(args, "search", query=" ".join(args.terms),
+                        limit=args.limit, page=args.page)
+    for result in results:
+        six.print_("{0} - {1}".format(result["mod"]["name"], result["mod"]["mod_url"]))
+    return 0
+
+
+def update(args):
+    """
+    List the mods of a modpack updated since they were installed
+    """
+    if args.refresh:
+        errors = refresh_mods(get_settings(args), get_archive(args),
+                              ModpackIndex(args.modpack).load())
+        for url, error in errors:
+            six.print_("{0}: {1}".format(url, error))
+        # the daemon only reloads the archive after its own syncs
+        args.standalone = True
+    outdated = run_query(args, "update", modpack=os.path.abspath(args.modpack),
+                         since=args.since)
+    for result in outdated:
+        six.print_("{0}: {1} -> {2}".format(result["mod"]["name"],
+                                            result["installed"].get("updated"),
+                                            result["mod"]["updated"]))
+    return 0
+
+
+def changes(args):
+    """
+    Print the archive changes after a generation as json lines, the
+    last line gives the current archive generation
+    """
+    result = run_query(args, "changes", since=args.since)
+    for change in result["changes"]:
+        six.print_(json.dumps(change, sort_keys=True))
+    six.print_(json.dumps({"generation": result["generation"]}))
+    return 0
+
+
+def install(args):
+    """
+    Install mods in a modpack, or the mods pinned in the modpack lockfile
+    """
+    settings = get_settings(args)
+    installer = Installer.from_settings(settings, args.modpack)
+    if args.locked:
+        if args.mods:
+            six.print_("Mods can not be given with --locked")
+            return 2
+        errors = installer.install_locked()
+    else:
+        archive = get_archive(args)
+        mod_urls = []
+        for name in args.mods:
+            if name in archive or (args.refresh and "://" in name):
+                mod_urls.append(name)
+                continue
+            candidates = archive.find(name, 1)
+            if not candidates or candidates[0][0] < 1.0:
+                six.print_("No mod named {0}{1}".format(name, ", did you mean {0}?".format(
+                    candidates[0][1]["name"]) if candidates else ""))
+                return 1
+            mod_urls.append(candidates[0][1]["mod_url"])
+        if args.refresh:
+            refresh_errors = refresh_mods(settings, archive, mod_urls)
+            if refresh_errors:
+                for url, error in refresh_errors:
+                    six.print_("{0}: {1}".format(url, error))
+                return 1
+        errors = installer.install(archive, mod_urls, explicit=not args.as_dependency)
+    if len(installer.index):
+        ModpackRegistry.from_settings(settings).register(args.modpack)
+    for mod_url, error in errors:
+        six.print_("{0}: {1}".format(mod_url, error))
+    return 1 if errors else 0
+
+
+def remove(args):
+    """
+    Remove mods from a modpack. The removal is refused when other
+    installed mods require the removed ones, the libraries only the
+    removed mods needed are reported or removed with them.
+    """
+    installer = Installer(args.modpack)
+    index = installer.index
+    mod_urls = []
+    for name in args.mods:
+        if name in index:
+            mod_urls.append(name)
+            continue
+        matches = [mod_url for mod_url in index
+                   if normalize_name(mod_slug(mod_url) or "") == normalize_name(name)]
+        if len(matches) != 1:
+            six.print_("No installed mod named {0}".format(name))
+            return 1
+        mod_urls.append(matches[0])
+    dependents = index.dependents(mod_urls)
+    if dependents and not args.force:
+        six.print_("Required by installed mods:")
+        for mod_url in sorted(dependents):
+            six.print_("  {0}".format(mod_url))
+        return 1
+    orphans = index.orphans(mod_urls)
+    if args.orphans:
+        mod_urls.extend(sorted(orphans))
+    installer.remove(mod_urls)
+    for mod_url in mod_urls:
+        six.print_("Removed {0}".format(mod_url))
+    if orphans and not args.orphans:
+        six.print_("No longer required:")
+        for mod_url in sorted(orphans):
+            six.print_("  {0}".format(mod_url))
+    return 0
+
+
+def server_pack(args):
+    """
+    Build the server pack of a modpack
+    """
+    settings = get_settings(args)
+    builder = ServerPackBuilder(ModpackIndex(args.modpack).load(), get_archive(args),
+                                settings.getint("MPM_SERVER_PACK_WORKERS"))
+    try:
+        result = builder.build(args.output)
+    except (ValueError, IOError, OSError) as err:
+        six.print_("{0}: {1}".format(args.output, err))
+        return 1
+    if result["written"]:
+        six.print_("{0}: {1} files, {2} staged, {3} removed".format(
+            args.output, len(result["files"]), len(result["staged"]),
+            len(result["removed"])))
+    else:
+        six.print_("{0}: up to date".format(args.output))
+    for mod_url in result["missing"]:
+        six.print_("{0}: installed file missing, left out".format(mod_url))
+    return 1 if result["missing"] else 0
+
+
+def export_catalog(args):
+    """
+    Export the archive catalog as numpy columns
+    """
+    settings = get_settings(args)
+    path = os.path.expanduser(args.output or settings.get("MPM_COLUMNS_DIR"))
+    count = export_columns(get_archive(args), path)
+    six.print_("Exported {0} mods to {1}".format(count, path))
+    return 0
+
+
+def daemon(args):
+    """
+    Run the mpm daemon
+    """
+    MpmDaemon(get_settings(args)).run()
+    return 0
+
+
+def scan(args):
+    """
+    List the mods installed in a mods folder
+    """
+    settings = get_settings(args)
+    archive = get_archive(args)
+    cache_dir = os.path.expanduser(settings.get("MPM_CACHE_DIR"))
+    scanner = ModScanner(os.path.join(cache_dir, "scan.json"),
+                         settings.getint("MPM_SCAN_WORKERS"))
+    results = scanner.scan(args.mods_dir)
+    matched = scanner.match(results, archive)
+    for path in sorted(results):
+        mods = results[path]
+        name = mods[0].get("name") if mods else "?"
+        version = mods[0].get("version") if mods else "?"
+        item = matched[path]
+        six.print_("{0} {1} {2} - {3}".format(
+            os.path.basename(path), name, version,
+            item["mod_url"] if item else "not in archive"))
+    return 0
+
+
+def verify(args):
+    """
+    Verify the integrity of the mods installed in a modpack
+    """
+    settings = get_settings(args)
+    verifier = Verifier(ModpackIndex(args.modpack).load(),
+                        settings.getint("MPM_VERIFY_WORKERS"),
+                        settings.get("MPM_GPG"))
+    failures = verifier.verify(signatures=not args.no_signatures,
+                               fail_fast=args.fail_fast)
+    for path, error in failures:
+        six.print_("{0}: {1}".format(path, error))
+    return 1 if failures else 0
+
+
 parser = argparse.ArgumentParser(description="Minecraft Package Manager")
+parser.add_argument("--archive", help="local mod archive directory")
+parser.add_argument("--standalone", action="store_true",
+                    help="do not use the mpm daemon")
 
 sub = parser.add_subparsers(help="command help")
 
@@ -11,21 +330,117 @@ sub = parser.add_subparsers(help="command help")
 sync_parser = sub.add_parser("sync",
                              description="Synchronize local mod archive.",
                              help="sync --help")
+sync_parser.add_argument("repositories", nargs="*",
+                         help="repositories to sync, all by default")
+sync_parser.add_argument("--export",
+                         help="stream synced mods as json lines to this file, "
+                         "%%(name)s is replaced by the repository name")
+sync_parser.add_argument("--shallow", action="store_true",
+                         help="fill mods from the mod lists, only fetch the "
+                         "pages of new or updated mods")
+sync_parser.add_argument("--discovery", choices=["pages", "sitemap"],
+                         help="find the mod pages from the mod lists or from "
+                         "the repository sitemaps")
+sync_parser.add_argument("-m", "--modpack", action="append",
+                         help="refresh the mods of this modpack first, in addition "
+                         "to the modpacks mpm installed mods in")
+sync_parser.set_defaults(func=sync)
 show_parser = sub.add_parser("show",
                              description="Show mod informations.",
                              help="show --help")
+show_parser.add_argument("name", help="mod name, typos are tolerated")
+show_parser.set_defaults(func=show)
 search_parser = sub.add_parser("search",
                                description="Search mod archive.",
                                help="search --help")
+search_parser.add_argument("terms", nargs="+", help="search terms")
+search_parser.add_argument("-n", "--limit", type=int, default=20,
+                           help="number of results per page")
+search_parser.add_argument("-p", "--page", type=int, default=1,
+                           help="results page")
+search_parser.set_defaults(func=search)
 update_parser = sub.add_parser("update",
                                description="Update mods.",
                                help="update --help")
+update_parser.add_argument("modpack", nargs="?", default=".",
+                           help="modpack directory")
+update_parser.add_argument("--since", type=int,
+                           help="only check the mods changed after this "
+                           "archive generation")
+update_parser.add_argument("--refresh", action="store_true",
+                           help="fetch the pages of the modpack mods first, "
+                           "without a full sync")
+update_parser.set_defaults(func=update)
+changes_parser = sub.add_parser("changes",
+                                description="List the archive changes.",
+                                help="changes --help")
+changes_parser.add_argument("--since", type=int, default=0,
+                            help="list the changes after this archive generation")
+changes_parser.set_defaults(func=changes)
 install_parser = sub.add_parser("install",
                                 description="Install mods.",
                                 help="install --help")
+install_parser.add_argument("mods", nargs="*", help="mod names or urls")
+install_parser.add_argument("-m", "--modpack", default=".",
+                            help="modpack directory")
+install_parser.add_argument("--locked", action="store_true",
+                            help="install the files pinned in the modpack lockfile")
+install_parser.add_argument("--refresh", action="store_true",
+                            help="fetch the pages of the mods before installing, "
+                            "without a full sync")
+install_parser.add_argument("--as-dependency", action="store_true",
+                            help="install the mods as dependencies, removed by "
+                            "remove --orphans once no installed mod requires them")
+install_parser.set_defaults(func=install)
+server_pack_parser = sub.add_parser("server-pack",
+                                    description="Build a modpack server pack.",
+                                    help="server-pack --help")
+server_pack_parser.add_argument("output",
+                                help="server pack path, .zip, .tar, .tar.gz or .tar.zst")
+server_pack_parser.add_argument("-m", "--modpack", default=".",
+                                help="modpack directory")
+server_pack_parser.set_defaults(func=server_pack)
 remove_parser = sub.add_parser("remove",
                                description="Remove mods.",
                                help="remove --help")
+remove_parser.add_argument("mods", nargs="+", help="installed mod urls or names")
+remove_parser.add_argument("-m", "--modpack", default=".",
+                           help="modpack directory")
+remove_parser.add_argument("--force", action="store_true",
+                           help="remove the mods even if other mods require them")
+remove_parser.add_argument("--orphans", action="store_true",
+                           help="also remove the dependencies only the removed mods "
+                           "required")
+remove_parser.set_defaults(func=remove)
+
+scan_parser = sub.add_parser("scan",
+                             description="List the mods in a mods folder.",
+                             help="scan --help")
+scan_parser.add_argument("mods_dir", help="mods folder")
+scan_parser.set_defaults(func=scan)
+
+verify_parser = sub.add_parser("verify",
+                               description="Verify installed mods.",
+                               help="verify --help")
+verify_parser.add_argument("modpack", nargs="?", default=".",
+                           help="modpack directory")
+verify_parser.add_argument("--fail-fast", action="store_true",
+                           help="stop at the first failure")
+verify_parser.add_argument("--no-signatures", action="store_true",
+                           help="do not check signatures")
+verify_parser.set_defaults(func=verify)
+
+export_parser = sub.add_parser("export-columns",
+                               description="Export the catalog as numpy arrays.",
+                               help="export-columns --help")
+export_parser.add_argument("output", nargs="?",
+                           help="export directory, MPM_COLUMNS_DIR by default")
+export_parser.set_defaults(func=export_catalog)
+
+daemon_parser = sub.add_parser("daemon",
+                               description="Run the mpm daemon.",
+                               help="daemon --help")
+daemon_parser.set_defaults(func=daemon)
 
 # repo commands
 repo_add_parser = sub.add_parser("addrepo",
@@ -42,4 +457,6 @@ repo_show_parser = sub.add_parser("lsrepo",
 
 if __name__ == "__main__":
     cmd = parser.parse_args()
+    if hasattr(cmd, "func"):
+        sys.exit(cmd.func(cmd))
     six.print_("Done")
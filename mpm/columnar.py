@@ -0,0 +1,305 @@
+"""
+Columnar catalog export.
+
+Analytics over the whole archive, such as download trends or update
+frequency by category, are slow when every mod is read as an item. The
+catalog is exported here as one numpy array per field, saved as ``.npy``
+files in a directory, which are mapped in memory when loaded: queries
+run vectorized over the arrays without reading or copying them.
+
+The exported columns are:
+
+- ``downloads``: int64, -1 when unknown
+- ``popularity``: float64
+- ``created`` and ``updated``: int32 day ordinals, 0 when unknown
+- ``categories`` and ``authors``: dictionary encoded lists, an int32
+  array of ``codes`` into the sorted values and an int64 array of
+  ``offsets``, the codes of mod ``i`` are ``codes[offsets[i]:offsets[i + 1]]``
+
+The mod urls and names, in row order, and the dictionaries are saved in
+``columns.json``. Every export names its arrays with a new export id,
+``<column>.<id>.npy``, and ``columns.json`` references that id: it is
+replaced atomically once all the arrays are written, which switches the
+readers to the new export at once. The arrays of the previous export are
+kept for the readers that loaded it before the switch, older ones are
+removed. The ``numpy`` package is needed.
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+import os
+import re
+import json
+import uuid
+import errno
+import bisect
+
+import six
+
+from .locking import FileLock, atomic_path, makedirs
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+__all__ = ("export_columns", "load_columns", "CatalogColumns")
+
+META = "columns.json"
+""" Export metadata file name """
+
+LOCK = "lock"
+""" Lock file held by the exports """
+
+ARRAY_FILE = re.compile(r"^.+\.(?P<id>\d+-[0-9a-f]{8})\.npy$")
+""" Array file names, with the id of their export """
+
+LIST_FIELDS = ("categories", "authors")
+""" Dictionary encoded list fields """
+
+
+def _require_numpy():
+    if numpy is None:
+        raise ImportError("numpy is needed for the columnar catalog export")
+
+
+def _array_file(name, export_id):
+    return "{0}.{1}.npy".format(name, export_id)
+
+
+def _save(path, name, export_id, array):
+    with atomic_path(os.path.join(path, _array_file(name, export_id))) as tmp_path:
+        with open(tmp_path, "wb") as fd:
+            numpy.save(fd, array)
+
+
+def _read_meta(path):
+    with open(os.path.join(path, META), "rb") as fd:
+        return json.loads(fd.read().decode("utf-8"))
+
+
+def _collect(path, keep):
+    """
+    Remove the arrays of the exports not in keep
+    """
+    for name in os.listdir(path):
+        match = ARRAY_FILE.match(name)
+        if match and match.group("id") not in keep:
+            try:
+                os.remove(os.path.join(path, name))
+            except OSError as err:
+                if err.errno != errno.ENOENT:
+                    raise
+
+
+def _ordinal(value):
+    return value.toordinal() if value else 0
+
+
+def export_columns(archive, path):
+    """
+    Export the archive catalog as columns
+    :param archive: the loaded mod archive
+    :type archive: :class:`archive.ModArchive`
+    :param path: export directory
+    :type path: str
+    :return: number of exported mods
+    :rtype: int
+    """
+    _require_numpy()
+    makedirs(path)
+    with FileLock(os.path.join(path, LOCK)):
+        return _export(archive, path)
+
+
+def _export(archive, path):
+    try:
+        previous = _read_meta(path).get("id")
+    except (IOError, ValueError):
+        previous = None
+    export_id = "{0}-{1}".format(archive.generation, uuid.uuid4().hex[:8])
+    count = len(archive)
+    mod_urls = []
+    names = []
+    downloads = numpy.full(count, -1, dtype=numpy.int64)
+    popularity = numpy.zeros(count, dtype=numpy.float64)
+    created = numpy.zeros(count, dtype=numpy.int32)
+    updated = numpy.zeros(count, dtype=numpy.int32)
+    lists = dict((field, ([], [0])) for field in LIST_FIELDS)
+
+    for row, item in enumerate(archive.mods(texts=False)):
+        mod_urls.append(item["mod_url"])
+        names.append(item.get("name"))
+        if item.get("downloads") is not None:
+            downloads[row] = item["downloads"]
+        popularity[row] = item.get("popularity") or 0.0
+        created[row] = _ordinal(item.get("created"))
+        updated[row] = _ordinal(item.get("updated"))
+        for field, (values, offsets) in six.iteritems(lists):
+            values.extend(sorted(item.get(field) or ()))
+            offsets.append(len(values))
+
+    meta = {"id": export_id, "generation": archive.generation, "count": count,
+            "mod_urls": mod_urls, "names": names}
+    for field, (values, offsets) in six.iteritems(lists):
+        dictionary = sorted(set(values))
+        codes = dict((value, code) for code, value in enumerate(dictionary))
+        _save(path, field + ".codes", export_id,
+              numpy.array([codes[value] for value in values], dtype=numpy.int32))
+        _save(path, field + ".offsets", export_id, numpy.array(offsets, dtype=numpy.int64))
+        meta[field] = dictionary
+    for name, array in (("downloads", downloads), ("popularity", popularity),
+                        ("created", created), ("updated", updated)):
+        _save(path, name, export_id, array)
+    with atomic_path(os.path.join(path, META)) as tmp_path:
+        with open(tmp_path, "wb") as fd:
+            fd.write(json.dumps(meta).encode("utf-8"))
+    _collect(path, (export_id, previous))
+    return count
+
+
+class CatalogColumns(object):
+    """
+    Columnar catalog export mapped in memory.
+
+    The arrays are read only views of the files, see
+    :func:`export_columns` for their layout.
+    """
+
+    def __init__(self, path, mmap_mode="r"):
+        """
+        :param path: export directory
+        :type path: str
+        :param mmap_mode: numpy memory map mode, None reads the arrays in
+        memory
+        :type mmap_mode: str
+        :raise IOError: if the directory holds no export
+        """
+        _require_numpy()
+        self.path = path
+        meta = _read_meta(path)
+        self.export_id = meta["id"]
+        self.generation = meta["generation"]
+        self.mod_urls = meta["mod_urls"]
+        self.names = meta["names"]
+        self.dictionaries = dict((field, meta[field]) for field in LIST_FIELDS)
+        self._mmap_mode = mmap_mode
+        self._arrays = {}
+
+    @classmethod
+    def from_settings(cls, settings):
+        """
+        Load the export configured in the mpm settings
+        :param settings: scrapy settings
+        :type settings: :class:`scrapy.settings.Settings`
+        """
+        return cls(os.path.expanduser(settings.get("MPM_COLUMNS_DIR")))
+
+    def __len__(self):
+        return len(self.mod_urls)
+
+    def array(self, name):
+        """
+        Get a column array, the file is mapped on first use
+        :param name: column name, such as ``downloads`` or ``authors.codes``
+        :type name: str
+        :rtype: :class:`numpy.ndarray`
+        """
+        array = self._arrays.get(name)
+        if array is None:
+            array = numpy.load(os.path.join(self.path, _array_file(name, self.export_id)),
+                               mmap_mode=self._mmap_mode)
+            self._arrays[name] = array
+        return array
+
+    @property
+    def downloads(self):
+        return self.array("downloads")
+
+    @property
+    def popularity(self):
+        return self.array("popularity")
+
+    @property
+    def created(self):
+        return self.array("created")
+
+    @property
+    def updated(self):
+        return self.array("updated")
+
+    def rows(self, field):
+        """
+        The row of each code of a list field, to group the codes by mod
+        :param field: "categories" or "authors"
+        :type field: str
+        :return: int64 array as long as the codes
+        :rtype: :class:`numpy.ndarray`
+        """
+        offsets = self.array(field + ".offsets")
+        return numpy.repeat(numpy.arange(len(offsets) - 1), numpy.diff(offsets))
+
+    def code(self, field, value):
+        """
+        Code of a value of a list field
+        :raise KeyError: if no mod has the value
+        """
+        dictionary = self.dictionaries[field]
+        position = bisect.bisect_left(dictionary, value)
+        if position == len(dictionary) or dictionary[position] != value:
+            raise KeyError(value)
+        return int(position)
+
+    def mask(self, field, value):
+        """
+        Select the mods having a value in a list field
+        :param field: "categories" or "authors"
+        :type field: str
+        :param value: category or author
+        :type value: str
+        :return: boolean array, one entry per mod
+        :rtype: :class:`numpy.ndarray`
+        """
+        selected = numpy.zeros(len(self), dtype=bool)
+        try:
+            code = self.code(field, value)
+        except KeyError:
+            return selected
+        selected[self.rows(field)[self.array(field + ".codes") == code]] = True
+        return selected
+
+    def counts(self, field, weights=None):
+        """
+        Count the mods, or sum a column, by value of a list field
+        :param field: "categories" or "authors"
+        :type field: str
+        :param weights: array summed instead of counting the mods, such
+        as :attr:`downloads`; unknown downloads are -1 and should be
+        clipped first
+        :type weights: :class:`numpy.ndarray`
+        :return: value to count or sum
+        :rtype: dict
+        """
+        if not self.dictionaries[field]:
+            # no mod has a value, numpy < 1.8 rejects a zero minlength
+            return {}
+        codes = self.array(field + ".codes")
+        if weights is not None:
+            weights = numpy.asarray(weights)[self.rows(field)]
+        totals = numpy.bincount(codes, weights=weights,
+                                minlength=len(self.dictionaries[field]))
+        return dict(zip(self.dictionaries[field], totals.tolist()))
+
+
+def load_columns(path, mmap_mode="r"):
+    """
+    Load a columnar export, see :class:`CatalogColumns`
+    :return: the export or None if the directory holds none
+    :rtype: :class:`CatalogColumns`
+    """
+    try:
+        return CatalogColumns(path, mmap_mode)
+    except IOError as err:
+        if err.errno != errno.ENOENT:
+            raise
+        return None
@@ -0,0 +1,216 @@
+"""
+mpm daemon.
+
+The daemon keeps the archive and its indexes loaded, runs the repository
+syncs on a schedule in its reactor and answers the cli queries over a
+unix domain socket. The protocol is one json request per line, answered
+by one json line::
+
+    {"command": "search", "args": {"query": "magic"}}
+    {"ok": true, "result": [...]}
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+import os
+import json
+import errno
+import socket
+import logging
+
+from twisted.internet import reactor, task, defer
+from twisted.internet.protocol import Factory
+from twisted.protocols.basic import LineReceiver
+from scrapy.crawler import CrawlerRunner
+from scrapy.utils.log import configure_logging
+
+from .archive import ModArchive
+from .query import QueryEngine
+from .querycache import QueryCache
+from .spiders.modinfo import repository_crawlers
+
+__all__ = ("MpmDaemon", "DaemonClient")
+
+logger = logging.getLogger(__name__)
+
+
+class QueryProtocol(LineReceiver):
+    """
+    Answer json queries, one per line
+    """
+
+    delimiter = b"\n"
+    MAX_LENGTH = 1024 * 1024
+
+    def lineReceived(self, line):
+        try:
+            request = json.loads(line.decode("utf-8"))
+            result = self.factory.daemon.query(request["command"],
+                                               request.get("args", {}))
+            response = {"ok": True, "result": result}
+        except Exception as err:
+            logger.exception("Query failed: %r", line)
+            response = {"ok": False, "error": "{0}".format(err)}
+        self.sendLine(json.dumps(response).encode("utf-8"))
+
+
+class QueryFactory(Factory):
+
+    protocol = QueryProtocol
+
+    def __init__(self, daemon):
+        self.daemon = daemon
+
+
+class MpmDaemon(object):
+    """
+    Long running mpm process.
+
+    The archive is loaded once and reloaded after each sync, queries
+    are answered from memory.
+    """
+
+    def __init__(self, settings):
+        """
+        :param settings: mpm settings
+        :type settings: :class:`scrapy.settings.Settings`
+        """
+        self.settings = settings
+        self.socket_path = os.path.expanduser(settings.get("MPM_DAEMON_SOCKET"))
+        self.sync_interval = settings.getfloat("MPM_DAEMON_SYNC_INTERVAL")
+        self.runner = CrawlerRunner(settings)
+        self.archive = ModArchive.from_settings(settings).load()
+        cache = None
+        if settings.getint("MPM_QUERY_CACHE_SIZE"):
+            cache = QueryCache(size=settings.getint("MPM_QUERY_CACHE_SIZE"))
+        self.engine = QueryEngine(self.archive, cache)
+        self.syncing = None
+
+    def query(self, command, args):
+        """
+        Answer a query, see :class:`query.QueryEngine`
+        """
+        if command == "status":
+            return {"generation": self.archive.generation,
+                    "mods": len(self.archive),
+                    "syncing": self.syncing is not None}
+        if command == "sync":
+            self.sync()
+            return {"generation": self.archive.generation}
+        return self.engine.run(command, dict((str(key), value)
+                                             for key, value in args.items()))
+
+    def sync(self):
+        """
+        Sync all the repositories concurrently, unless a sync is
+        already running
+        :return: deferred fired when the sync is done
+        :rtype: :class:`twisted.internet.defer.Deferred`
+        """
+        if self.syncing is not None:
+            return self.syncing
+        logger.info("Starting sync, archive generation %d", self.archive.generation)
+        crawls = [self.runner.crawl(crawler)
+                  for crawler in repository_crawlers(self.settings)]
+        self.syncing = defer.DeferredList(crawls, consumeErrors=True)
+        self.syncing.addCallback(self._synced)
+        self.syncing.addErrback(self._sync_failed)
+        return self.syncing
+
+    def _synced(self, results):
+        for success, failure in results:
+            if not success:
+                logger.error("Sync failed: %s", failure.getErrorMessage())
+        self.archive.load()
+        self.syncing = None
+        logger.info("Sync done, archive generation %d", self.archive.generation)
+
+    def _sync_failed(self, failure):
+        logger.error("Sync failed, keeping archive generation %d: %s",
+                     self.archive.generation, failure.getTraceback())
+        self.syncing = None
+
+    def _scheduled_sync(self):
+        # a failed sync must not stop the schedule
+        return defer.maybeDeferred(self.sync).addErrback(self._sync_failed)
+
+    def listen(self):
+        try:
+            os.makedirs(os.path.dirname(self.socket_path))
+        except OSError as err:
+            if err.errno != errno.EEXIST:
+                raise
+        if os.path.exists(self.socket_path):
+            if DaemonClient(self.socket_path).ping():
+                raise RuntimeError("A daemon is already listening on "
+                                   "{0}".format(self.socket_path))
+            os.remove(self.socket_path)
+        return reactor.listenUNIX(self.socket_path, QueryFactory(self), mode=0o600)
+
+    def run(self):
+        """
+        Run the daemon until the reactor is stopped
+        """
+        configure_logging(self.settings)
+        port = self.listen()
+        if self.sync_interval:
+            scheduler = task.LoopingCall(self._scheduled_sync)
+            scheduler.start(self.sync_interval, now=True)
+        reactor.addSystemEventTrigger("before", "shutdown", port.stopListening)
+        reactor.run()
+
+
+class DaemonClient(object):
+    """
+    Blocking client for the daemon socket, used by the cli so that
+    queries do not have to start a reactor.
+    """
+
+    def __init__(self, socket_path, timeout=30):
+        self.socket_path = os.path.expanduser(socket_path)
+        self.timeout = timeout
+
+    def query(self, command, **args):
+        """
+        Send a query to the daemon
+        :return: the query result, or None if no daemon answered: none is
+        running, or it timed out, closed the connection or sent an
+        invalid response
+        :raise RuntimeError: if the daemon could not answer the query
+        """
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.socket_path)
+            request = json.dumps({"command": command, "args": args})
+            sock.sendall(request.encode("utf-8") + b"\n")
+            data = b""
+            while not data.endswith(b"\n"):
+                chunk = sock.recv(65536)
+                if not chunk:
+                    break
+                data += chunk
+        except socket.error as err:
+            if err.errno not in (errno.ENOENT, errno.ECONNREFUSED):
+                logger.warning("Mpm daemon did not answer: %s", err)
+            return None
+        finally:
+            sock.close()
+        try:
+            response = json.loads(data.decode("utf-8"))
+            ok = response["ok"]
+        except (ValueError, KeyError, TypeError):
+            logger.warning("Invalid mpm daemon response %r", data[:100])
+            return None
+        if not ok:
+            raise RuntimeError(response.get("error"))
+        return response["result"]
+
+    def ping(self):
+        """
+        Check whether a daemon is running
+        """
+        try:
+            return self.query("status") is not None
+        except RuntimeError:
+            return False
@@ -0,0 +1,176 @@
+"""
+Mod dependency graph.
+
+Mods depend on other mods either by mod url, when the repository lists
+the required mods, or by mod id, when the ``mcmod.info`` of the jar lists
+the ``requiredMods`` and ``dependencies`` of the mod; mod ids are resolved
+to the mods providing them. The graph keeps the reverse links, so the
+mods depending on a mod are found without walking the dependencies of
+every mod, and it is updated one mod at a time as mods are added and
+removed.
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+from collections import defaultdict
+
+import six
+
+__all__ = ("DependencyGraph", "mod_requirements")
+
+IMPLICIT_MODIDS = frozenset(["forge", "fml", "mcp", "minecraft", "minecraftforge"])
+""" Mod ids provided by the game and the mod loader """
+
+
+def mod_requirements(mods):
+    """
+    Mod ids provided and required by the mods of a jar
+    :param mods: mod metadata dicts, see :func:`scanner.read_mod_info`
+    :type mods: list
+    :return: (provided mod ids, required mod ids), sorted lists; version
+    ranges such as ``Mantle@[0.3.2,)`` are dropped
+    :rtype: tuple
+    """
+    provides = set()
+    requires = set()
+    for mod in mods:
+        if mod.get("modid"):
+            provides.add(six.text_type(mod["modid"]).lower())
+        for key in ("requiredMods", "dependencies"):
+            for modid in mod.get(key) or []:
+                modid = six.text_type(modid).split("@")[0].strip().lower()
+                if modid and modid not in IMPLICIT_MODIDS:
+                    requires.add(modid)
+    return sorted(provides), sorted(requires - provides)
+
+
+class DependencyGraph(object):
+    """
+    Dependencies between mods, with their reverse links.
+    """
+
+    def __init__(self):
+        self._links = {}
+        """ Mod url to (required mod urls, required mod ids) """
+
+        self._dependents = defaultdict(set)
+        """ Mod url to the mods requiring it by url """
+
+        self._requirers = defaultdict(set)
+        """ Mod id to the mods requiring it """
+
+        self._provides = {}
+        """ Mod url to the mod ids it provides """
+
+        self._providers = defaultdict(set)
+        """ Mod id to the mods providing it """
+
+    def __contains__(self, mod_url):
+        return mod_url in self._links
+
+    def add(self, mod_url, dependencies=(), provides=(), requires=()):
+        """
+        Add a mod or replace its dependencies
+        :param mod_url: mod page url
+        :type mod_url: str
+        :param dependencies: urls of the required mods
+        :type dependencies: iterable
+        :param provides: mod ids provided by the mod
+        :type provides: iterable
+        :param requires: mod ids required by the mod
+        :type requires: iterable
+        """
+        self.remove(mod_url)
+        dependencies = frozenset(dependencies or ()) - frozenset([mod_url])
+        requires = frozenset(requires or ())
+        self._links[mod_url] = (dependencies, requires)
+        for dependency in dependencies:
+            self._dependents[dependency].add(mod_url)
+        for modid in requires:
+            self._requirers[modid].add(mod_url)
+        self._provides[mod_url] = frozenset(provides or ())
+        for modid in self._provides[mod_url]:
+            self._providers[modid].add(mod_url)
+
+    def remove(self, mod_url):
+        """
+        Remove a mod, the links of the mods requiring it are kept
+        :param mod_url: mod page url
+        :type mod_url: str
+        """
+        dependencies, requires = self._links.pop(mod_url, ((), ()))
+        for dependency in dependencies:
+            self._dependents[dependency].discard(mod_url)
+        for modid in requires:
+            self._requirers[modid].discard(mod_url)
+        for modid in self._provides.pop(mod_url, ()):
+            self._providers[modid].discard(mod_url)
+
+    def dependencies(self, mod_url):
+        """
+        The mods directly required by a mod
+        :rtype: set
+        """
+        dependencies, requires = self._links.get(mod_url, ((), ()))
+        result = set(dependencies)
+        for modid in requires:
+            result.update(self._providers.get(modid, ()))
+        result.discard(mod_url)
+        return result
+
+    def direct_dependents(self, mod_url):
+        """
+        The mods directly requiring a mod
+        :rtype: set
+        """
+        result = set(self._dependents.get(mod_url, ()))
+        for modid in self._provides.get(mod_url, ()):
+            result.update(self._requirers.get(modid, ()))
+        result.discard(mod_url)
+        return result
+
+    def _closure(self, mod_urls, step):
+        seen = set(mod_urls)
+        pending = list(seen)
+        while pending:
+            for other in step(pending.pop()):
+                if other not in seen:
+                    seen.add(other)
+                    pending.append(other)
+        return seen - set(mod_urls)
+
+    def dependents(self, mod_urls):
+        """
+        The mods requiring some mods, directly or transitively
+        :param mod_urls: mod page urls
+        :type mod_urls: iterable
+        :return: the dependent mods, not including the given ones
+        :rtype: set
+        """
+        return self._closure(mod_urls, self.direct_dependents)
+
+    def orphans(self, mod_urls, keep=()):
+        """
+        The mods left unneeded once some mods are removed: the mods they
+        require, directly or transitively, that nothing else requires
+        :param mod_urls: the removed mod urls
+        :type mod_urls: iterable
+        :param keep: mods wanted on their own, never orphaned, so the mods
+        they require stay needed
+        :type keep: iterable
+        :return: the orphaned mods
+        :rtype: set
+        """
+        removed = set(mod_urls)
+        keep = frozenset(keep)
+        candidates = self._closure(removed, self.dependencies)
+        orphans = set()
+        changed = True
+        while changed:
+            changed = False
+            for mod_url in candidates - orphans - keep:
+                if mod_url in self._links and \
+                   self.direct_dependents(mod_url) <= removed | orphans:
+                    orphans.add(mod_url)
+                    changed = True
+        return orphans
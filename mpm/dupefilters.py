@@ -0,0 +1,258 @@
+"""
+Duplicate request filters for the mpm crawls.
+
+The same mod is listed under many categories, so the mod list pages keep
+yielding requests for mod pages that were already scheduled. The
+:class:`BloomDupeFilter` drops them without keeping every request
+fingerprint in memory.
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+import os
+import math
+import shutil
+import sqlite3
+import logging
+import tempfile
+
+from six.moves import cPickle as pickle
+
+from scrapy.dupefilters import BaseDupeFilter
+from scrapy.utils.job import job_dir
+from scrapy.utils.request import request_fingerprint
+
+from .locking import atomic_path
+
+__all__ = ("BloomFilter", "ScalableBloomFilter", "BloomDupeFilter")
+
+
+class BloomFilter(object):
+    """
+    Fixed size bloom filter over hex digests.
+
+    The bit positions are derived from the digest itself by double
+    hashing, so no extra hashing is done on lookup.
+    """
+
+    def __init__(self, capacity, error_rate, bits=None, count=0):
+        """
+        :param capacity: number of keys the filter is sized for
+        :type capacity: int
+        :param error_rate: false positive rate when the filter is full
+        :type error_rate: float
+        """
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.count = count
+        self.size = int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, int(round(self.size / float(capacity) * math.log(2))))
+        if bits is None:
+            bits = bytearray((self.size + 7) // 8)
+        self.bits = bits
+
+    def _positions(self, digest):
+        first = int(digest[:16], 16)
+        second = int(digest[16:32], 16) | 1
+        for i in range(self.hashes):
+            yield (first + i * second) % self.size
+
+    def __contains__(self, digest):
+        for pos in self._positions(digest):
+            if not self.bits[pos >> 3] & (1 << (pos & 7)):
+                return False
+        return True
+
+    def add(self, digest):
+        """
+        Add a hex digest to the filter
+        :param digest: hex digest of at least 32 characters
+        :type digest: str
+        """
+        for pos in self._positions(digest):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    @property
+    def full(self):
+        return self.count >= self.capacity
+
+
+class ScalableBloomFilter(object):
+    """
+    Bloom filter that grows as keys are added.
+
+    A new filter with larger capacity and tighter error rate is stacked
+    on top when the last one is full, which keeps the overall false
+    positive rate bounded whatever the number of keys.
+    """
+
+    GROWTH = 4
+    TIGHTENING = 0.8
+
+    def __init__(self, capacity=100000, error_rate=0.001):
+        """
+        :param capacity: capacity of the first filter
+        :type capacity: int
+        :param error_rate: overall false positive rate
+        :type error_rate: float
+        """
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.filters = []
+
+    def __contains__(self, digest):
+        return any(digest in bloom for bloom in self.filters)
+
+    def __len__(self):
+        return sum(bloom.count for bloom in self.filters)
+
+    @property
+    def nbytes(self):
+        """ Memory used by the filter bits """
+        return sum(len(bloom.bits) for bloom in self.filters)
+
+    def add(self, digest):
+        """
+        Add a hex digest to the filter
+        :param digest: hex digest of at least 32 characters
+        :type digest: str
+        """
+        if not self.filters or self.filters[-1].full:
+            level = len(self.filters)
+            self.filters.append(BloomFilter(
+                self.capacity * self.GROWTH ** level,
+                self.error_rate * (1 - self.TIGHTENING) * self.TIGHTENING ** level))
+        self.filters[-1].add(digest)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load a filter saved with :meth:`save`
+        :param path: file path
+        :type path: str
+        """
+        with open(path, "rb") as fd:
+            capacity, error_rate, filters = pickle.load(fd)
+        scalable = cls(capacity, error_rate)
+        scalable.filters = [BloomFilter(size, rate, bits, count)
+                            for size, rate, count, bits in filters]
+        return scalable
+
+    def save(self, path):
+        """
+        Save the filter to a file
+        :param path: file path
+        :type path: str
+        """
+        filters = [(bloom.capacity, bloom.error_rate, bloom.count, bloom.bits)
+                   for bloom in self.filters]
+        with atomic_path(path) as tmp_path:
+            with open(tmp_path, "wb") as fd:
+                pickle.dump((self.capacity, self.error_rate, filters), fd,
+                            pickle.HIGHEST_PROTOCOL)
+
+
+class BloomDupeFilter(BaseDupeFilter):
+    """
+    Request fingerprint duplicates filter backed by a bloom filter.
+
+    Fingerprints are checked against a :class:`ScalableBloomFilter`, a hit
+    is confirmed against the exact set of fingerprints kept in a sqlite
+    database so that false positives never drop a request. Only the bloom
+    filter is held in memory; sqlite is used rather than dbm since the
+    fallback dbm backend of python keeps its whole index in memory.
+
+    As for the default scrapy filter, the seen requests are persisted in
+    the ``JOBDIR`` so that a paused crawl resumes where it stopped; they
+    are discarded once the crawl finishes. The bloom filter is saved when
+    the crawl is paused, after a crash it is rebuilt from the database.
+    """
+
+    BLOOM_FILE = "requests.bloom"
+    SEEN_FILE = "requests.seen.sqlite"
+
+    COMMIT_INTERVAL = 1000
+    """ Fingerprints added between two commits of the database """
+
+    def __init__(self, path=None, capacity=100000, error_rate=0.001, debug=False):
+        """
+        :param path: directory used to persist the filter, a temporary
+        one is used if not given
+        :type path: str
+        """
+        self.persistent = path is not None
+        self.path = path or tempfile.mkdtemp(prefix="mpm-seen-")
+        self.debug = debug
+        self.logdupes = True
+        self.false_positives = 0
+        self.logger = logging.getLogger(__name__)
+        self.seen = sqlite3.connect(os.path.join(self.path, self.SEEN_FILE))
+        self.seen.execute("PRAGMA synchronous = OFF")
+        self.seen.execute("CREATE TABLE IF NOT EXISTS seen (fp TEXT PRIMARY KEY)")
+        self.pending = 0
+        bloom_path = os.path.join(self.path, self.BLOOM_FILE)
+        if os.path.exists(bloom_path):
+            # the saved filter only matches the database until the next
+            # commit, without it a crashed crawl rebuilds the filter
+            self.bloom = ScalableBloomFilter.load(bloom_path)
+            os.remove(bloom_path)
+        else:
+            self.bloom = ScalableBloomFilter(capacity, error_rate)
+            for fp, in self.seen.execute("SELECT fp FROM seen"):
+                self.bloom.add(fp)
+
+    @classmethod
+    def from_settings(cls, settings):
+        return cls(job_dir(settings),
+                   settings.getint("MPM_DUPEFILTER_CAPACITY"),
+                   settings.getfloat("MPM_DUPEFILTER_ERROR_RATE"),
+                   settings.getbool("DUPEFILTER_DEBUG"))
+
+    def request_seen(self, request):
+        fp = request_fingerprint(request)
+        if fp in self.bloom:
+            if self.seen.execute("SELECT 1 FROM seen WHERE fp = ?", (fp,)).fetchone():
+                return True
+            self.false_positives += 1
+        self.bloom.add(fp)
+        self.seen.execute("INSERT OR IGNORE INTO seen VALUES (?)", (fp,))
+        self.pending += 1
+        if self.pending >= self.COMMIT_INTERVAL:
+            self.seen.commit()
+            self.pending = 0
+        return False
+
+    def memory_usage(self):
+        """
+        Memory held by the filter, the exact fingerprints are on disk
+        :rtype: int
+        """
+        return self.bloom.nbytes
+
+    def close(self, reason):
+        self.seen.commit()
+        self.seen.close()
+        if self.persistent and reason != "finished":
+            self.bloom.save(os.path.join(self.path, self.BLOOM_FILE))
+            return
+        for name in os.listdir(self.path):
+            if name.startswith((self.BLOOM_FILE, self.SEEN_FILE)):
+                os.remove(os.path.join(self.path, name))
+        if not self.persistent:
+            shutil.rmtree(self.path, ignore_errors=True)
+
+    def log(self, request, spider):
+        if self.debug:
+            msg = "Filtered duplicate request: %(request)s"
+            self.logger.debug(msg, {'request': request}, extra={'spider': spider})
+        elif self.logdupes:
+            msg = ("Filtered duplicate request: %(request)s"
+                   " - no more duplicates will be shown"
+                   " (see DUPEFILTER_DEBUG to show all duplicates)")
+            self.logger.debug(msg, {'request': request}, extra={'spider': spider})
+            self.logdupes = False
+
+        spider.crawler.stats.inc_value('dupefilter/filtered', spider=spider)
+        spider.crawler.stats.set_value('dupefilter/bloom_false_positives',
+                                       self.false_positives, spider=spider)
@@ -0,0 +1,250 @@
+"""
+Crawl extensions.
+
+:class:`MemoryAccounting` breaks down the memory of long crawls by crawl
+stage, to tell whether pending requests, items carried in the request
+meta, response bodies or the duplicates filter are growing.
+"""
+
+from __future__ import absolute_import, division, unicode_literals
+
+import os
+import sys
+import logging
+import resource
+
+from collections import defaultdict
+
+import six
+
+from twisted.internet import task
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from scrapy.http import Request, Response
+from scrapy.item import BaseItem
+from scrapy.utils.trackref import live_refs
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+__all__ = ("MemoryAccounting",)
+
+logger = logging.getLogger(__name__)
+
+MPM_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def current_rss():
+    """
+    Resident memory of the process in bytes, the peak resident memory
+    where the current one is not available
+    """
+    try:
+        with open("/proc/self/statm") as fd:
+            return int(fd.read().split()[1]) * resource.getpagesize()
+    except (IOError, IndexError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def callback_name(request):
+    """
+    Name of the spider callback of a request
+    """
+    callback = request.callback
+    if callback is None:
+        return "parse"
+    return getattr(callback, "__name__", repr(callback))
+
+
+def approximate_size(value):
+    """
+    Approximate size of a value in bytes, the elements of containers are
+    counted one level deep
+    """
+    size = sys.getsizeof(value)
+    if isinstance(value, dict) or hasattr(value, "fields"):
+        size += sum(sys.getsizeof(element) for element in six.itervalues(value))
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(sys.getsizeof(element) for element in value)
+    return size
+
+
+def request_size(request):
+    """
+    Approximate memory held by a request: its url, its body and the items
+    carried in its meta
+    """
+    size = sys.getsizeof(request.url) + len(request.body)
+    for key in ("item", "listing"):
+        if request.meta.get(key) is not None:
+            size += approximate_size(request.meta[key])
+    return size
+
+
+def live_objects(cls):
+    """
+    Live instances of a class and its subclasses tracked by scrapy
+    """
+    for tracked, refs in list(six.iteritems(live_refs)):
+        if issubclass(tracked, cls):
+            for obj in list(refs.keys()):
+                yield obj
+
+
+class MemoryAccounting(object):
+    """
+    Periodic memory accounting of a crawl.
+
+    Every ``MPM_MEMACCT_INTERVAL`` seconds the extension records in the
+    crawl stats and logs:
+
+    - the live :class:`ModItem` and other items, the live requests by
+      spider callback, the requests carrying an item in their meta, and
+      the live responses with the size of their bodies, from the scrapy
+      live object tracking
+    - the approximate memory held for each spider callback: the urls,
+      bodies and meta items of the requests waiting for it and the bodies
+      of the responses it is parsing
+    - the memory of the duplicates filter
+    - the memory allocated by each mpm module, only when ``tracemalloc``
+      is available, which is python 3
+    - the resident memory of the process
+
+    When ``MPM_MEMACCT_BUDGET_MB`` is set, the spider is closed cleanly
+    with the ``memusage_exceeded`` reason once the resident memory
+    exceeds the budget, so the pipelines still commit what was crawled.
+    """
+
+    def __init__(self, crawler, interval, budget, top=10):
+        """
+        :param crawler: the crawler
+        :param interval: seconds between two snapshots
+        :param budget: resident memory budget in bytes, 0 for no budget
+        :param top: number of mpm allocation sites logged
+        """
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.interval = interval
+        self.budget = budget
+        self.top = top
+        self.task = None
+        self.spider = None
+        self._tracing = False
+        crawler.signals.connect(self.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(self.spider_closed, signal=signals.spider_closed)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        if not settings.getbool("MPM_MEMACCT_ENABLED"):
+            raise NotConfigured
+        return cls(crawler, settings.getfloat("MPM_MEMACCT_INTERVAL"),
+                   settings.getint("MPM_MEMACCT_BUDGET_MB") * 1024 * 1024)
+
+    def spider_opened(self, spider):
+        self.spider = spider
+        if tracemalloc is not None and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._tracing = True
+        self.task = task.LoopingCall(self.snapshot)
+        self.task.start(self.interval, now=False)
+
+    def spider_closed(self, spider, reason):
+        if self.task is not None and self.task.running:
+            self.task.stop()
+        self.snapshot()
+        if self._tracing:
+            tracemalloc.stop()
+            self._tracing = False
+
+    def _dupefilter(self):
+        slot = getattr(self.crawler.engine, "slot", None)
+        dupefilter = getattr(getattr(slot, "scheduler", None), "df", None)
+        memory_usage = getattr(dupefilter, "memory_usage", None)
+        return memory_usage() if memory_usage is not None else None
+
+    def _traced(self):
+        """
+        Memory allocated by each mpm module, and the top allocation sites
+        """
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            [tracemalloc.Filter(True, os.path.join(MPM_DIR, "*"))])
+        modules = defaultdict(int)
+        for stat in snapshot.statistics("filename"):
+            name = os.path.relpath(stat.traceback[0].filename, MPM_DIR)
+            modules[name] += stat.size
+        return modules, snapshot.statistics("lineno")[:self.top]
+
+    def snapshot(self):
+        """
+        Record a memory snapshot in the stats and in the log
+        :return: the recorded values
+        :rtype: dict
+        """
+        values = {}
+        items = [item for item in live_objects(BaseItem)]
+        values["memory/live/items"] = len(items)
+        values["memory/live/ModItem"] = len([item for item in items
+                                             if type(item).__name__ == "ModItem"])
+
+        requests = list(live_objects(Request))
+        values["memory/live/requests"] = len(requests)
+        by_callback = defaultdict(int)
+        callback_bytes = defaultdict(int)
+        with_item = 0
+        for request in requests:
+            name = callback_name(request)
+            by_callback[name] += 1
+            callback_bytes[name] += request_size(request)
+            if "item" in request.meta or "listing" in request.meta:
+                with_item += 1
+        for name, count in six.iteritems(by_callback):
+            values["memory/requests/{0}".format(name)] = count
+        values["memory/requests/with_item"] = with_item
+
+        responses = list(live_objects(Response))
+        values["memory/live/responses"] = len(responses)
+        values["memory/responses/body_bytes"] = sum(len(response.body) for response in responses)
+        for response in responses:
+            if response.request is not None:
+                callback_bytes[callback_name(response.request)] += len(response.body)
+        for name, size in six.iteritems(callback_bytes):
+            values["memory/callbacks/{0}_bytes".format(name)] = size
+
+        dupefilter = self._dupefilter()
+        if dupefilter is not None:
+            values["memory/dupefilter_bytes"] = dupefilter
+
+        sites = []
+        if self._tracing:
+            modules, sites = self._traced()
+            for name, size in six.iteritems(modules):
+                values["memory/traced/{0}".format(name)] = size
+
+        rss = current_rss()
+        values["memory/rss"] = rss
+        for key, value in six.iteritems(values):
+            self.stats.set_value(key, value, spider=self.spider)
+        self.stats.max_value("memory/rss_max", rss, spider=self.spider)
+
+        logger.info("Memory %.1f MiB: %d items, %d requests (%s), %d responses "
+                    "(%.1f MiB of bodies), dupefilter %s",
+                    rss / 1024 ** 2, values["memory/live/items"], len(requests),
+                    ", ".join("{0}: {1}, {2:.1f} KiB".format(name, count,
+                                                             callback_bytes[name] / 1024)
+                              for name, count in sorted(six.iteritems(by_callback))),
+                    len(responses), values["memory/responses/body_bytes"] / 1024 ** 2,
+                    "{0:.1f} MiB".format(dupefilter / 1024 ** 2)
+                    if dupefilter is not None else "n/a")
+        for stat in sites:
+            logger.info("Memory allocated at %s: %.1f KiB", stat.traceback, stat.size / 1024)
+
+        if self.budget and rss > self.budget and self.spider is not None:
+            logger.error("Memory budget of %.1f MiB exceeded, closing spider %s",
+                         self.budget / 1024 ** 2, self.spider.name)
+            self.stats.set_value("memory/budget_exceeded", True, spider=self.spider)
+            self.crawler.engine.close_spider(self.spider, "memusage_exceeded")
+            self.budget = 0
+        return values
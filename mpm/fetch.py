@@ -0,0 +1,302 @@
+"""
+Direct page fetching for targeted operations.
+
+Syncing a whole repository goes through scrapy, but refreshing the few
+mods of a modpack before an update or an install does not need a crawler
+process, its reactor and middlewares: starting them costs more than the
+requests themselves. This module fetches the pages with a small pool of
+keep-alive http connections and runs the callbacks of the repository
+spider on them, so the mods are extracted exactly as in a sync.
+
+The pages of all the mods are fetched concurrently, then the pages they
+link to (files, license), and so on until the callbacks request nothing
+more. There is no throttling: this is meant for a handful of mods, full
+catalog crawls keep using scrapy.
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+import gzip
+import socket
+import logging
+import threading
+
+from io import BytesIO
+from multiprocessing.pool import ThreadPool
+
+import six
+from six.moves import http_client
+from six.moves.urllib.parse import urljoin, urlsplit, urlunsplit
+
+from scrapy.http import Request
+from scrapy.responsetypes import responsetypes
+from scrapy.utils.request import request_fingerprint
+from scrapy.utils.spider import iterate_spider_output
+
+from .items import ModItem, ModFileItem
+from .spiders.modinfo import load_repositories
+
+__all__ = ("ConnectionPool", "DirectCrawl", "refresh_mods")
+
+logger = logging.getLogger(__name__)
+
+REDIRECTS = (301, 302, 303, 307, 308)
+
+
+class ConnectionPool(object):
+    """
+    Keep-alive http connections, one per host and per thread.
+
+    A connection closed by the server between two requests is reopened
+    and the request sent again once.
+    """
+
+    def __init__(self, timeout=60, user_agent="mpm", max_redirects=5):
+        """
+        :param timeout: connection and read timeout in seconds
+        :param user_agent: user agent header of the requests
+        :param max_redirects: redirects followed before giving up
+        """
+        self.timeout = timeout
+        self.user_agent = user_agent
+        self.max_redirects = max_redirects
+        self._local = threading.local()
+        self._all = []
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls, settings):
+        """
+        Create a connection pool configured in the mpm settings
+        :param settings: scrapy settings
+        :type settings: :class:`scrapy.settings.Settings`
+        """
+        return cls(settings.getfloat("DOWNLOAD_TIMEOUT"), settings.get("USER_AGENT"),
+                   settings.getint("REDIRECT_MAX_TIMES"))
+
+    def _connections(self):
+        connections = getattr(self._local, "connections", None)
+        if connections is None:
+            connections = self._local.connections = {}
+        return connections
+
+    def _connection(self, scheme, netloc):
+        connections = self._connections()
+        connection = connections.get((scheme, netloc))
+        if connection is None:
+            cls = http_client.HTTPSConnection if scheme == "https" else http_client.HTTPConnection
+            connection = cls(netloc, timeout=self.timeout)
+            connections[(scheme, netloc)] = connection
+            with self._lock:
+                self._all.append(connection)
+        return connection
+
+    def _drop(self, scheme, netloc):
+        connection = self._connections().pop((scheme, netloc), None)
+        if connection is not None:
+            connection.close()
+
+    def _send(self, scheme, netloc, path):
+        headers = {"User-Agent": self.user_agent, "Accept-Encoding": "gzip"}
+        for attempt in range(2):
+            connection = self._connection(scheme, netloc)
+            try:
+                connection.request("GET", path, headers=headers)
+                response = connection.getresponse()
+                body = response.read()
+            except (http_client.HTTPException, socket.error):
+                self._drop(scheme, netloc)
+                if attempt:
+                    raise
+                continue
+            if response.will_close:
+                self._drop(scheme, netloc)
+            response_headers = dict((name.lower(), value)
+                                    for name, value in response.getheaders())
+            if response_headers.get("content-encoding", "").lower() == "gzip":
+                body = gzip.GzipFile(fileobj=BytesIO(body)).read()
+                response_headers.pop("content-encoding")
+            return response.status, response_headers, body
+
+    def get(self, url):
+        """
+        Fetch a page, following redirects
+        :param url: page url
+        :type url: str
+        :return: (final url, status, headers, body)
+        :rtype: tuple
+        :raise IOError: on too many redirects
+        """
+        for _ in range(self.max_redirects + 1):
+            scheme, netloc, path, query, _ = urlsplit(url)
+            status, headers, body = self._send(scheme, netloc,
+                                               urlunsplit(("", "", path or "/", query, "")))
+            location = headers.get("location")
+            if status in REDIRECTS and location:
+                url = urljoin(url, location)
+                continue
+            return url, status, headers, body
+        raise IOError("Too many redirects fetching {0}".format(url))
+
+    def close(self):
+        """
+        Close the connections of all the threads
+        """
+        with self._lock:
+            for connection in self._all:
+                connection.close()
+            self._all = []
+        self._local = threading.local()
+
+
+class DirectCrawl(object):
+    """
+    Run the callbacks of a spider on pages fetched by a
+    :class:`ConnectionPool`, without a crawler.
+
+    Requests are fetched concurrently, a wave at a time: the requests
+    returned by the callbacks of one wave are fetched in the next one.
+    Duplicate requests are dropped as by the scrapy dupefilter, the
+    callbacks run in the calling thread.
+    """
+
+    def __init__(self, spider, pool, workers=8):
+        """
+        :param spider: the spider whose callbacks extract the pages, see
+        :meth:`spiders.modinfo.RepositorySpider.from_archive`
+        :param pool: connection pool
+        :type pool: :class:`ConnectionPool`
+        :param workers: number of pages fetched in parallel
+        :type workers: int
+        """
+        self.spider = spider
+        self.pool = pool
+        self.workers = workers
+
+    def _fetch(self, request):
+        try:
+            url, status, headers, body = self.pool.get(request.url)
+        except Exception as err:
+            return request, None, err
+        if status >= 400:
+            return request, None, IOError("HTTP status {0} for {1}".format(status, url))
+        cls = responsetypes.from_args(headers=headers, url=url, body=body)
+        return request, cls(url=url, status=status, headers=headers, body=body,
+                            request=request), None
+
+    def crawl(self, requests):
+        """
+        Fetch pages and run the spider callbacks on them
+        :param requests: start requests
+        :type requests: list of :class:`scrapy.http.Request`
+        :return: (items, errors); the items returned by the callbacks and
+        a list of (url, error) for the pages that could not be fetched
+        or whose callback failed
+        :rtype: tuple
+        """
+        seen = set()
+        items = []
+        errors = []
+
+        def new(requests):
+            for request in requests:
+                fingerprint = request_fingerprint(request)
+                if request.dont_filter or fingerprint not in seen:
+                    seen.add(fingerprint)
+                    yield request
+
+        pending = list(new(requests))
+        pool = ThreadPool(self.workers)
+        try:
+            while pending:
+                wave, pending = pending, []
+                for request, response, error in pool.imap_unordered(self._fetch, wave):
+                    if error is not None:
+                        logger.error("Can not fetch %s: %s", request.url, error)
+                        errors.append((request.url, error))
+                        continue
+                    callback = request.callback or self.spider.parse
+                    try:
+                        for result in iterate_spider_output(callback(response)):
+                            if isinstance(result, Request):
+                                pending.extend(new([result]))
+                            elif result is not None:
+                                items.append(result)
+                    except Exception as err:
+                        logger.exception("Can not parse %s", request.url)
+                        errors.append((request.url, err))
+        finally:
+            pool.close()
+            pool.join()
+        return items, errors
+
+
+def repository_for(url, repositories):
+    """
+    Find the repository spider serving a mod url
+    :param url: mod page url
+    :type url: str
+    :param repositories: repository name to spider class
+    :type repositories: dict
+    :return: the spider class or None
+    """
+    for _, spidercls in sorted(six.iteritems(repositories)):
+        if spidercls.serves(url):
+            return spidercls
+    return None
+
+
+def refresh_mods(settings, archive, mod_urls, pool=None):
+    """
+    Fetch the pages of some mods and update them in the archive
+    :param settings: scrapy settings
+    :type settings: :class:`scrapy.settings.Settings`
+    :param archive: the loaded mod archive, committed here
+    :type archive: :class:`archive.ModArchive`
+    :param mod_urls: mods to refresh
+    :type mod_urls: iterable
+    :param pool: connection pool, created from the settings if not given
+    :type pool: :class:`ConnectionPool`
+    :return: list of (url, error) for the pages not fetched
+    :rtype: list
+    """
+    repositories = load_repositories(settings)
+    by_spider = {}
+    errors = []
+    for mod_url in mod_urls:
+        spidercls = repository_for(mod_url, repositories)
+        if spidercls is None:
+            errors.append((mod_url, LookupError("No repository serves {0}".format(mod_url))))
+            continue
+        by_spider.setdefault(spidercls, []).append(mod_url)
+    own_pool = pool is None
+    if own_pool:
+        pool = ConnectionPool.from_settings(settings)
+    items = []
+    try:
+        for spidercls, urls in six.iteritems(by_spider):
+            spider = spidercls.from_archive(archive)
+            crawl = DirectCrawl(spider, pool, settings.getint("MPM_FETCH_WORKERS"))
+            requests = []
+            for url in urls:
+                request = spider.mod_request(url)
+                if request is None:
+                    errors.append((url, LookupError("Repository {0} can not refresh single mods"
+                                                    .format(spider.name))))
+                else:
+                    requests.append(request)
+            found, failed = crawl.crawl(requests)
+            items.extend(found)
+            errors.extend(failed)
+    finally:
+        if own_pool:
+            pool.close()
+    mods = dict((item["mod_url"], item) for item in items if isinstance(item, ModItem))
+    files = [item for item in items if isinstance(item, ModFileItem)]
+    if not mods and not files:
+        return errors
+    archive.update(six.itervalues(mods))
+    archive.update_files(files)
+    archive.commit()
+    logger.info("Refreshed %d mods, archive generation %d", len(mods), archive.generation)
+    return errors
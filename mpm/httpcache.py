@@ -0,0 +1,49 @@
+"""
+HTTP cache policy and storage for the mpm crawls.
+
+Most repository pages do not change between two syncs. The responses are
+kept in a compressed on-disk cache and revalidated on every crawl with a
+conditional request, an unchanged page then costs a 304 response and the
+body is served from the cache.
+"""
+
+from __future__ import absolute_import
+
+import os
+
+from scrapy.extensions.httpcache import RFC2616Policy, FilesystemCacheStorage
+
+__all__ = ("RevalidatePolicy", "CacheStorage")
+
+
+class RevalidatePolicy(RFC2616Policy):
+    """
+    Cache policy that always revalidates.
+
+    Only responses carrying an ``ETag`` or ``Last-Modified`` validator
+    are stored, a cached response is never considered fresh: the request
+    is always sent with ``If-None-Match`` and ``If-Modified-Since`` and
+    the cached response is used when the server answers 304.
+    """
+
+    def should_cache_response(self, response, request):
+        if response.status != 200:
+            return False
+        if "no-store" in self._parse_cachecontrol(response):
+            return False
+        return "ETag" in response.headers or "Last-Modified" in response.headers
+
+    def is_cached_response_fresh(self, cachedresponse, request):
+        self._set_conditional_validators(request, cachedresponse)
+        return False
+
+
+class CacheStorage(FilesystemCacheStorage):
+    """
+    Filesystem cache storage whose ``HTTPCACHE_DIR`` may be relative to
+    the user home.
+    """
+
+    def __init__(self, settings):
+        super(CacheStorage, self).__init__(settings)
+        self.cachedir = os.path.expanduser(settings["HTTPCACHE_DIR"])
@@ -0,0 +1,360 @@
+"""
+Lookup indexes for the local mod archive.
+
+The indexes are built from the :class:`ModItem` stored in the archive at
+sync time and saved next to it, so that the cli commands only need to
+load them.
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+import re
+import math
+import heapq
+
+import six
+from six.moves import cPickle as pickle
+from six.moves.urllib.parse import urlparse
+
+__all__ = ("TrigramIndex", "SearchIndex", "trigrams", "mod_slug", "popularity")
+
+
+def normalize_name(value):
+    """
+    Normalize a mod name for lookup, the name is lowercased and
+    everything that is not a letter or a digit is turned into a single
+    space.
+    :param value: name to normalize
+    :type value: str
+    :return: the normalized name
+    :rtype: str
+    """
+    return re.sub(r"[\W_]+", " ", value.lower(), flags=re.UNICODE).strip()
+
+
+def tokenize(value):
+    """
+    Split a text in normalized search tokens
+    :param value: text to split
+    :type value: str
+    :return: list of tokens
+    :rtype: list
+    """
+    return normalize_name(value).split()
+
+
+def popularity(item):
+    """
+    Compute the popularity score of a mod from its downloads.
+    The score grows with the order of magnitude of the downloads so that
+    the few very popular mods do not shadow everything else.
+    :param item: the mod
+    :type item: :class:`ModItem`
+    :return: the popularity score
+    :rtype: float
+    """
+    return math.log10(1 + (item.get("downloads") or 0))
+
+
+def trigrams(value):
+    """
+    Split a name in the set of its trigrams.
+    Each word is padded with two leading blanks and one trailing blank,
+    so that short words and word boundaries have trigrams of their own.
+    :param value: the name to split
+    :type value: str
+    :return: set of trigrams
+    :rtype: set
+    """
+    grams = set()
+    for word in normalize_name(value).split():
+        padded = "  " + word + " "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def mod_slug(mod_url):
+    """
+    Extract the mod slug from a mod page url.
+    The slug is the last path component without the numeric project id,
+    e.g. ``/mc-mods/74072-tinkers-construct`` gives ``tinkers-construct``.
+    :param mod_url: mod page url
+    :type mod_url: str
+    :return: the mod slug or None
+    :rtype: str
+    """
+    path = urlparse(mod_url).path.rstrip("/")
+    match = re.match(r"^(?:\d+-)?([\w-]+)$", path.split("/")[-1], re.UNICODE)
+    if match:
+        return match.group(1)
+    return None
+
+
+class TrigramIndex(object):
+    """
+    Trigram index over mod names and slugs.
+
+    Each mod is indexed by the trigrams of its name and of the slug taken
+    from the mod url. Lookups only score the names that share at least one
+    trigram with the query, the similarity is the jaccard index of the
+    trigram sets so small typos still give a high score.
+    """
+
+    def __init__(self):
+        self._postings = {}
+        """ Trigram to list of term ids """
+
+        self._terms = []
+        """ Term id to (mod url, number of trigrams) """
+
+    @classmethod
+    def build(cls, items):
+        """
+        Build the index from an iterable of mod items
+        :param items: iterable of :class:`ModItem`
+        :type items: iterable
+        :return: the new index
+        :rtype: :class:`TrigramIndex`
+        """
+        index = cls()
+        for item in items:
+            index.add(item)
+        return index
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load an index saved with :meth:`save`
+        :param path: index file path
+        :type path: str
+        :return: the loaded index
+        :rtype: :class:`TrigramIndex`
+        """
+        index = cls()
+        with open(path, "rb") as fd:
+            index._postings, index._terms = pickle.load(fd)
+        return index
+
+    def save(self, path):
+        """
+        Save the index to a file
+        :param path: index file path
+        :type path: str
+        """
+        with open(path, "wb") as fd:
+            pickle.dump((self._postings, self._terms), fd,
+                        pickle.HIGHEST_PROTOCOL)
+
+    def add(self, item):
+        """
+        Index the name and slug of a mod
+        :param item: mod to index
+        :type item: :class:`ModItem`
+        """
+        names = set([item.get("name") or "",
+                     (mod_slug(item["mod_url"]) or "").replace("-", " ")])
+        for name in names:
+            grams = trigrams(name)
+            if not grams:
+                continue
+            term_id = len(self._terms)
+            self._terms.append((item["mod_url"], len(grams)))
+            for gram in grams:
+                self._postings.setdefault(gram, []).append(term_id)
+
+    def lookup(self, name, limit=10, threshold=0.3):
+        """
+        Find the mods with a name similar to the given one
+        :param name: name to look for
+        :type name: str
+        :param limit: maximum number of candidates returned
+        :type limit: int
+        :param threshold: minimum similarity of a candidate
+        :type threshold: float
+        :return: list of (similarity, mod url) sorted by decreasing similarity
+        :rtype: list
+        """
+        grams = trigrams(name)
+        if not grams:
+            return []
+        shared = {}
+        for gram in grams:
+            for term_id in self._postings.get(gram, ()):
+                shared[term_id] = shared.get(term_id, 0) + 1
+        scores = {}
+        for term_id, count in shared.items():
+            mod_url, size = self._terms[term_id]
+            score = float(count) / (len(grams) + size - count)
+            if score >= threshold and score > scores.get(mod_url, 0):
+                scores[mod_url] = score
+        best = heapq.nlargest(limit, scores.items(),
+                              key=lambda entry: (entry[1], entry[0]))
+        return [(score, mod_url) for mod_url, score in best]
+
+    def __len__(self):
+        return len(set(mod_url for mod_url, size in self._terms))
+
+
+class SearchIndex(object):
+    """
+    Inverted index for full text search of mods.
+
+    Mods are numbered by decreasing popularity, so every posting list is
+    sorted by popularity as well. The score of a match is its popularity
+    weighted by the relevance of the matched fields, which is at most 1;
+    a query walks the shortest posting list and stops as soon as the
+    popularity of the next mod can not beat the k-th best score, so broad
+    queries never score the whole match set.
+    """
+
+    FIELD_WEIGHTS = (("name", 3), ("categories", 2), ("summary", 1), ("description", 1))
+    """ Relevance weight of each indexed field """
+
+    MAX_WEIGHT = 3
+
+    def __init__(self):
+        self._postings = {}
+        """ Token to {doc id: weight}, doc ids sorted by popularity """
+
+        self._sorted = {}
+        """ Token to the sorted list of doc ids """
+
+        self._docs = []
+        """ Doc id to (mod url, popularity) """
+
+    @classmethod
+    def record_terms(cls, record):
+        """
+        The tokens of a record with the weight of their best field
+        :rtype: dict
+        """
+        terms = {}
+        for field, weight in cls.FIELD_WEIGHTS:
+            value = record.get(field) or ""
+            if isinstance(value, (list, tuple, set)):
+                value = " ".join(value)
+            for token in tokenize(value):
+                terms[token] = max(weight, terms.get(token, 0))
+        return terms
+
+    def doc_terms(self):
+        """
+        The indexed tokens of each mod, the postings turned inside out
+        :return: mod url to {token: weight}
+        :rtype: dict
+        """
+        terms = [{} for _ in self._docs]
+        for token, postings in six.iteritems(self._postings):
+            for doc_id, weight in six.iteritems(postings):
+                terms[doc_id][token] = weight
+        return dict((mod_url, terms[doc_id])
+                    for doc_id, (mod_url, _) in enumerate(self._docs))
+
+    @classmethod
+    def build(cls, records, resolve=None, previous=None, changed=()):
+        """
+        Build the index from archive records
+        :param records: iterable of records with a popularity field,
+        see :meth:`archive.ModArchive.update`
+        :type records: iterable
+        :param resolve: function returning a record with its stored
+        texts, called once per record while indexing it
+        :type resolve: callable
+        :param previous: index of an earlier version of the records, the
+        tokens of the records it holds are taken from it instead of
+        resolving and tokenizing the records again
+        :type previous: :class:`SearchIndex`
+        :param changed: mod urls of the records changed since the
+        previous index was built
+        :type changed: iterable
+        :return: the new index
+        :rtype: :class:`SearchIndex`
+        """
+        index = cls()
+        reused = previous.doc_terms() if previous is not None else {}
+        changed = frozenset(changed)
+        records = sorted(records, key=lambda record: record.get("popularity") or 0,
+                         reverse=True)
+        for doc_id, record in enumerate(records):
+            terms = None if record["mod_url"] in changed else reused.get(record["mod_url"])
+            if terms is None:
+                if resolve is not None:
+                    record = resolve(record)
+                terms = cls.record_terms(record)
+            index._docs.append((record["mod_url"], record.get("popularity") or 0))
+            for token, weight in six.iteritems(terms):
+                index._postings.setdefault(token, {})[doc_id] = weight
+        for token, postings in index._postings.items():
+            index._sorted[token] = sorted(postings)
+        return index
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load an index saved with :meth:`save`
+        :param path: index file path
+        :type path: str
+        :return: the loaded index
+        :rtype: :class:`SearchIndex`
+        """
+        index = cls()
+        with open(path, "rb") as fd:
+            index._postings, index._docs = pickle.load(fd)
+        for token, postings in index._postings.items():
+            index._sorted[token] = sorted(postings)
+        return index
+
+    def save(self, path):
+        """
+        Save the index to a file
+        :param path: index file path
+        :type path: str
+        """
+        with open(path, "wb") as fd:
+            pickle.dump((self._postings, self._docs), fd,
+                        pickle.HIGHEST_PROTOCOL)
+
+    def search(self, query, limit=20, offset=0):
+        """
+        Find the mods matching all the terms in a query
+        :param query: search query
+        :type query: str
+        :param limit: number of results
+        :type limit: int
+        :param offset: number of best results to skip, for paging
+        :type offset: int
+        :return: list of (score, mod url) sorted by decreasing score
+        :rtype: list
+        """
+        tokens = set(tokenize(query))
+        if not tokens or any(token not in self._postings for token in tokens):
+            return []
+        tokens = sorted(tokens, key=lambda token: len(self._postings[token]))
+        postings = [self._postings[token] for token in tokens]
+        wanted = offset + limit
+        max_relevance = float(self.MAX_WEIGHT * len(tokens))
+        best = []
+        for doc_id in self._sorted[tokens[0]]:
+            mod_url, doc_popularity = self._docs[doc_id]
+            if len(best) == wanted and doc_popularity <= best[0][0]:
+                # the posting list is sorted by popularity, nothing
+                # after this can get a better score
+                break
+            relevance = 0
+            for posting in postings:
+                weight = posting.get(doc_id)
+                if weight is None:
+                    break
+                relevance += weight
+            else:
+                score = doc_popularity * relevance / max_relevance
+                entry = (score, -doc_id, mod_url)
+                if len(best) < wanted:
+                    heapq.heappush(best, entry)
+                elif entry > best[0]:
+                    heapq.heapreplace(best, entry)
+        best.sort(reverse=True)
+        return [(score, mod_url) for score, _, mod_url in best[offset:]]
+
+    def __len__(self):
+        return len(self._docs)
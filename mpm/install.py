@@ -0,0 +1,283 @@
+"""
+Mod installation.
+
+Installing a mod picks its latest file from the archive, resolves the
+download url with the :class:`resolver.UrlResolver`, downloads and hashes
+the file and records it both in the modpack index and in the modpack
+:class:`lockfile.Lockfile`.
+
+A locked install skips all of this: the direct urls and hashes in the
+lockfile are downloaded and verified in parallel, files already installed
+with the right hash are kept.
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+import os
+import errno
+import hashlib
+import logging
+import posixpath
+
+from multiprocessing.pool import ThreadPool
+
+import six
+from six.moves.urllib.parse import urlparse, unquote
+from six.moves.urllib.request import build_opener, Request
+
+from .archive import item_to_record
+from .locking import atomic_path
+from .lockfile import Lockfile
+from .modpack import ModpackIndex
+from .resolver import UrlResolver
+from .verify import hash_file
+from .scanner import read_mod_info
+from .dependencies import mod_requirements
+
+__all__ = ("Installer",)
+
+logger = logging.getLogger(__name__)
+
+BUFFER_SIZE = 64 * 1024
+
+MODS_DIR = "mods"
+""" Directory of the modpack the mod files are installed in """
+
+
+def file_name(url, entry):
+    """
+    Name of the installed file, taken from the direct download url
+    """
+    name = posixpath.basename(unquote(urlparse(url).path))
+    if not name:
+        name = "{0}.jar".format(entry["file_id"])
+    return name
+
+
+class Installer(object):
+    """
+    Install mods in a modpack.
+    """
+
+    def __init__(self, modpack, resolver=None, workers=4, timeout=60, user_agent="mpm"):
+        """
+        :param modpack: modpack directory
+        :type modpack: str
+        :param resolver: download url resolver, only needed to install
+        mods that are not locked
+        :type resolver: :class:`resolver.UrlResolver`
+        :param workers: number of files downloaded in parallel
+        :param timeout: download timeout in seconds
+        """
+        self.index = ModpackIndex(modpack).load()
+        self.lockfile = Lockfile(modpack).load()
+        self.resolver = resolver
+        self.workers = workers
+        self.timeout = timeout
+        self.user_agent = user_agent
+        self.opener = build_opener()
+
+    @classmethod
+    def from_settings(cls, settings, modpack):
+        """
+        Create an installer configured in the mpm settings
+        :param settings: scrapy settings
+        :type settings: :class:`scrapy.settings.Settings`
+        :param modpack: modpack directory
+        :type modpack: str
+        """
+        return cls(modpack, UrlResolver.from_settings(settings),
+                   settings.getint("MPM_INSTALL_WORKERS"),
+                   settings.getfloat("DOWNLOAD_TIMEOUT"),
+                   settings.get("USER_AGENT"))
+
+    def lock(self, archive, mod_urls):
+        """
+        Pick the file to install for each mod and resolve its download url
+        :param archive: the loaded mod archive
+        :type archive: :class:`archive.ModArchive`
+        :param mod_urls: mods to install
+        :type mod_urls: iterable
+        :return: (mod url to lock entry without the file hashes, list of
+        (mod url, error) for the mods with no downloadable file in the
+        archive or whose download url can not be resolved)
+        :rtype: tuple
+        """
+        entries = {}
+        errors = []
+        for mod_url in mod_urls:
+            files = [item for item in archive.files(mod_url) if item.get("download_url")]
+            releases = [item for item in files if item.get("release_type") == "release"]
+            if not files:
+                errors.append((mod_url, LookupError(
+                    "No file known for mod {0}, sync the archive".format(mod_url))))
+                continue
+            latest = item_to_record((releases or files)[0])
+            mod = archive.get(mod_url)
+            entries[mod_url] = {
+                "file_id": latest["file_id"],
+                "version": latest.get("name"),
+                "game_version": latest.get("game_version"),
+                "download_url": latest["download_url"],
+                "updated": item_to_record(mod).get("updated") if mod else None,
+                "dependencies": sorted(mod.get("dependencies") or []) if mod else [],
+            }
+        resolved, failed = self.resolver.resolve_all(
+            entry["download_url"] for entry in six.itervalues(entries))
+        failed = dict(failed)
+        for mod_url, entry in list(six.iteritems(entries)):
+            if entry["download_url"] in failed:
+                errors.append((mod_url, IOError("Can not resolve {0}: {1}".format(
+                    entry["download_url"], failed[entry["download_url"]]))))
+                del entries[mod_url]
+                continue
+            entry["url"] = resolved[entry["download_url"]]
+            entry["file"] = posixpath.join(MODS_DIR, file_name(entry["url"], entry))
+        return entries, errors
+
+    def download(self, entry):
+        """
+        Download a file to its place in the modpack, hashing it on the way.
+        The file is written to a temporary file and renamed once complete.
+        :param entry: lock entry
+        :type entry: dict
+        :return: (sha256, size) of the downloaded file
+        :rtype: tuple
+        :raise IOError: if the content does not match the locked hash
+        """
+        path = os.path.join(self.index.path, entry["file"])
+        digest = hashlib.sha256()
+        size = 0
+        request = Request(entry["url"], headers={"User-Agent": self.user_agent})
+        with atomic_path(path) as tmp_path:
+            response = self.opener.open(request, timeout=self.timeout)
+            try:
+                with open(tmp_path, "wb") as fd:
+                    for chunk in iter(lambda: response.read(BUFFER_SIZE), b""):
+                        digest.update(chunk)
+                        fd.write(chunk)
+                        size += len(chunk)
+            finally:
+                response.close()
+            sha256 = digest.hexdigest()
+            if entry.get("sha256") and entry["sha256"] != sha256:
+                raise IOError("Hash mismatch for {0}: expected {1}, got {2}".format(
+                    entry["url"], entry["sha256"], sha256))
+        return sha256, size
+
+    def _fetch(self, args):
+        mod_url, entry = args
+        path = os.path.join(self.index.path, entry["file"])
+        try:
+            if entry.get("sha256") and os.path.exists(path) and \
+               hash_file(path) == entry["sha256"]:
+                return mod_url, (entry["sha256"], os.path.getsize(path)), None
+            return mod_url, self.download(entry), None
+        except Exception as err:
+            return mod_url, None, err
+
+    def fetch(self, entries):
+        """
+        Download the files of many lock entries in parallel, the sha256
+        and size of each entry are set from the downloaded content
+        :param entries: mod url to lock entry
+        :type entries: dict
+        :return: list of (mod url, error) for the failed downloads
+        :rtype: list
+        """
+        if not entries:
+            return []
+        errors = []
+        pool = ThreadPool(min(self.workers, len(entries)))
+        try:
+            for mod_url, result, error in pool.imap_unordered(self._fetch,
+                                                              six.iteritems(entries)):
+                if error is not None:
+                    logger.error("Can not install %s: %s", mod_url, error)
+                    errors.append((mod_url, error))
+                    continue
+                entries[mod_url]["sha256"], entries[mod_url]["size"] = result
+        finally:
+            pool.close()
+            pool.join()
+        return errors
+
+    def _installed(self, entries, errors):
+        failed = set(mod_url for mod_url, _ in errors)
+        for mod_url, entry in six.iteritems(entries):
+            if mod_url in failed:
+                continue
+            previous = self.index.get(mod_url)
+            if previous and previous["file"] != entry["file"]:
+                try:
+                    os.remove(os.path.join(self.index.path, previous["file"]))
+                except OSError as err:
+                    if err.errno != errno.ENOENT:
+                        raise
+            provides, requires = mod_requirements(
+                read_mod_info(os.path.join(self.index.path, entry["file"])))
+            self.index.add(mod_url, {"file": entry["file"], "sha256": entry["sha256"],
+                                     "size": entry["size"], "file_id": entry["file_id"],
+                                     "updated": entry.get("updated"),
+                                     "dependencies": entry.get("dependencies") or [],
+                                     "modids": provides, "requires": requires,
+                                     "explicit": entry.get("explicit", True)})
+        self.index.save()
+
+    def install(self, archive, mod_urls, explicit=True):
+        """
+        Install the latest file of some mods and lock them
+        :param archive: the loaded mod archive
+        :type archive: :class:`archive.ModArchive`
+        :param mod_urls: mods to install
+        :type mod_urls: iterable
+        :param explicit: False to install the mods as dependencies, which
+        are removed with the last mod requiring them, see
+        :meth:`modpack.ModpackIndex.orphans`
+        :type explicit: bool
+        :return: list of (mod url, error) for the mods not installed
+        :rtype: list
+        """
+        entries, errors = self.lock(archive, mod_urls)
+        for entry in six.itervalues(entries):
+            entry["explicit"] = explicit
+        errors.extend(self.fetch(entries))
+        self._installed(entries, errors)
+        failed = set(mod_url for mod_url, _ in errors)
+        for mod_url, entry in six.iteritems(entries):
+            if mod_url not in failed:
+                self.lockfile.add(mod_url, entry)
+        self.lockfile.save()
+        return errors
+
+    def install_locked(self):
+        """
+        Install the files pinned in the lockfile, nothing is resolved
+        :return: list of (mod url, error) for the mods not installed
+        :rtype: list
+        """
+        entries = dict((mod_url, dict(entry))
+                       for mod_url, entry in self.lockfile.entries())
+        errors = self.fetch(entries)
+        self._installed(entries, errors)
+        return errors
+
+    def remove(self, mod_urls):
+        """
+        Remove installed mods, their files and their lockfile entries.
+        The mods requiring them are not checked here, see
+        :meth:`modpack.ModpackIndex.dependents`.
+        :param mod_urls: mods to remove
+        :type mod_urls: iterable
+        """
+        for mod_url in mod_urls:
+            entry = self.index.remove(mod_url)
+            try:
+                os.remove(os.path.join(self.index.path, entry["file"]))
+            except OSError as err:
+                if err.errno != errno.ENOENT:
+                    raise
+            if self.lockfile.get(mod_url) is not None:
+                self.lockfile.remove(mod_url)
+        self.index.save()
+        self.lockfile.save()
@@ -22,6 +22,9 @@ class ModItem(scrapy.Item):
     description = scrapy.Field()
     """ Mod description """
 
+    summary = scrapy.Field()
+    """ One line mod summary, as shown in the mod lists """
+
     authors = scrapy.Field()
     """ Mod author(s) """
 
@@ -31,6 +34,10 @@ class ModItem(scrapy.Item):
     updated = scrapy.Field()
     """ Last update date """
 
+    updated_epoch = scrapy.Field()
+    """ Last update time in seconds since the epoch, when the repository
+    gives it """
+
     downloads = scrapy.Field()
     """ Number of downloads """
 
@@ -51,3 +58,45 @@ class ModItem(scrapy.Item):
 
     smp = scrapy.Field()
     """ The mod supports multiplayer and must be included in the server build """
+
+    dependencies = scrapy.Field()
+    """ Urls of the mods required by the mod """
+
+    popularity = scrapy.Field()
+    """ Popularity score computed by the archive at sync time """
+
+
+class ModFileItem(scrapy.Item):
+    """
+    Define the informations for a file released for a mod
+
+    Each mod has a list of released files, one for each version of
+    the mod and of the game.
+    """
+
+    mod_url = scrapy.Field()
+    """ Page url of the mod the file belongs to """
+
+    file_id = scrapy.Field()
+    """ File id in the repository """
+
+    name = scrapy.Field()
+    """ File name """
+
+    release_type = scrapy.Field()
+    """ Release type: release, beta or alpha """
+
+    game_version = scrapy.Field()
+    """ Minecraft version(s) supported by the file """
+
+    size = scrapy.Field()
+    """ File size in bytes """
+
+    uploaded = scrapy.Field()
+    """ Upload date """
+
+    downloads = scrapy.Field()
+    """ Number of downloads """
+
+    download_url = scrapy.Field()
+    """ Download url of the file """
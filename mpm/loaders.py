@@ -17,7 +17,7 @@ from w3lib.html import remove_tags
 from scrapy.loader import ItemLoader
 from scrapy.loader.processors import TakeFirst, Join, Compose, Identity
 
-__all__ = ("ModItemLoader",)
+__all__ = ("ModItemLoader", "ModFileItemLoader")
 
 def normalize_blanks(value):
     """
@@ -88,6 +88,25 @@ def normalize_int(value):
     return map(_int, value)
         
 
+def normalize_size(value):
+    """
+    Parse file size strings such as ``1.71 MB`` into a number of bytes
+    :param value: list of strings to parse
+    :type value: list
+    :return: list of either integers or None
+    :rtype: list
+    """
+    units = {"b": 1, "kb": 1024, "mb": 1024 ** 2, "gb": 1024 ** 3}
+    def _size(item):
+        match = re.match("^\s*([\d.,]+)\s*([kmg]?b)\s*$", item, re.I)
+        if not match:
+            return None
+        number = float(match.group(1).replace(",", ""))
+        return int(number * units[match.group(2).lower()])
+
+    return map(_size, value)
+
+
 class substring(object):
     """
     Callable filter that extracts substrings from the loader data
@@ -178,6 +197,8 @@ class ModItemLoader(ItemLoader):
     
     updated_in = Compose(normalize_date)
 
+    updated_epoch_in = Compose(normalize_int)
+
     downloads_in = Compose(normalize_int)
 
     categories_in = Compose(substring(".*/([\w-]+)$"), split("-"), set)
@@ -186,4 +207,29 @@ class ModItemLoader(ItemLoader):
     authors_in = Identity()
     authors_out = Identity()
 
+    summary_in = Compose(normalize_blanks)
+    summary_out = Compose(Join(""), string.strip)
+
     mod_license_in = Compose(partial(map, remove_tags), partial(map, string.strip))
+
+
+class ModFileItemLoader(ItemLoader):
+    """
+    Loader for :class:`items.ModFileItem` objects from the rows of
+    a mod files page
+    """
+
+    default_output_processor = TakeFirst()
+    default_input_processor = Compose(normalize_blanks)
+
+    file_id_in = Compose(substring(".*/files/(\d+)$"))
+
+    release_type_in = Compose(normalize_blanks, partial(map, string.lower))
+
+    game_version_out = Identity()
+
+    size_in = Compose(normalize_blanks, normalize_size)
+
+    uploaded_in = Compose(normalize_blanks, normalize_date)
+
+    downloads_in = Compose(normalize_blanks, normalize_int)
@@ -0,0 +1,140 @@
+"""
+Modpack lockfile.
+
+The lockfile pins every mod of a modpack to an exact file: the repository
+file id, the direct download url it resolved to and the hash of its
+content. It lives at the root of the modpack, next to the mods, so that
+it can be shipped with the modpack; installing from the lockfile needs
+neither the archive nor the repositories.
+
+Like the modpack index, the lockfile is saved under the modpack lock by
+applying the changes made since it was loaded, see :mod:`locking`.
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+import os
+import json
+import errno
+
+import six
+
+from .locking import atomic_path
+from .modpack import ModpackIndex
+
+__all__ = ("Lockfile",)
+
+
+class Lockfile(object):
+    """
+    Exact files installed in a modpack.
+
+    Each entry maps a mod url to a dict holding the ``file_id`` and
+    ``version`` of the file, its direct download ``url``, the ``file``
+    path relative to the modpack directory and its ``sha256`` and ``size``;
+    ``explicit`` is False for the mods installed as dependencies.
+    """
+
+    NAME = "mpm.lock"
+    """ Lockfile name, in the modpack directory """
+
+    VERSION = 1
+    """ Lockfile format version """
+
+    def __init__(self, path):
+        """
+        :param path: modpack directory
+        :type path: str
+        """
+        self.path = os.path.abspath(path)
+        self.mods = {}
+        self._changes = {}
+
+    @property
+    def lock_path(self):
+        return os.path.join(self.path, self.NAME)
+
+    def exists(self):
+        return os.path.exists(self.lock_path)
+
+    def _read(self):
+        try:
+            with open(self.lock_path, "rb") as fd:
+                data = json.loads(fd.read().decode("utf-8"))
+        except IOError as err:
+            if err.errno != errno.ENOENT:
+                raise
+            return {}
+        if data["version"] > self.VERSION:
+            raise ValueError("Unsupported lockfile version {0} in {1}".format(
+                data["version"], self.lock_path))
+        return data["mods"]
+
+    def load(self):
+        """
+        Load the lockfile, a modpack without lockfile has no locked mods
+        """
+        self.mods = self._read()
+        self._changes = {}
+        return self
+
+    def save(self):
+        """
+        Write the lockfile under the modpack lock, keeping the mods locked
+        meanwhile by other processes; the file is replaced atomically
+        """
+        with ModpackIndex(self.path).lock():
+            mods = self._read()
+            for mod_url, entry in six.iteritems(self._changes):
+                if entry is None:
+                    mods.pop(mod_url, None)
+                else:
+                    mods[mod_url] = entry
+            data = json.dumps({"version": self.VERSION, "mods": mods},
+                              indent=2, sort_keys=True)
+            with atomic_path(self.lock_path) as tmp_path:
+                with open(tmp_path, "wb") as fd:
+                    fd.write(data.encode("utf-8"))
+        self.mods = mods
+        self._changes = {}
+
+    def __len__(self):
+        return len(self.mods)
+
+    def __contains__(self, mod_url):
+        return mod_url in self.mods
+
+    def __iter__(self):
+        return iter(self.mods)
+
+    def get(self, mod_url):
+        return self.mods.get(mod_url)
+
+    def add(self, mod_url, entry):
+        """
+        Pin a mod to a file
+        :param mod_url: mod page url
+        :type mod_url: str
+        :param entry: locked file informations
+        :type entry: dict
+        """
+        self.mods[mod_url] = entry
+        self._changes[mod_url] = entry
+
+    def remove(self, mod_url):
+        """
+        Unpin a mod
+        :return: the removed entry
+        :rtype: dict
+        """
+        entry = self.mods.pop(mod_url)
+        self._changes[mod_url] = None
+        return entry
+
+    def entries(self):
+        """
+        Iterate the locked mods
+        :return: iterator of (mod url, entry)
+        :rtype: iterator
+        """
+        return six.iteritems(self.mods)
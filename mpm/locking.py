@@ -0,0 +1,118 @@
+"""
+Concurrent access to the mpm state files.
+
+Many mpm processes may work on the same archive and modpacks at once.
+Readers never lock: every state file is replaced atomically by renaming
+a fully written and synced temporary file over it, so a reader sees
+either the old or the new version. Writers take an exclusive lock on the
+resource they modify, one lock per archive and per modpack, re-read the
+current state under the lock and apply their own changes on top of it
+before replacing the file.
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+import os
+import fcntl
+import errno
+import tempfile
+
+from contextlib import contextmanager
+
+__all__ = ("FileLock", "atomic_path", "makedirs")
+
+
+def makedirs(path):
+    """
+    Create a directory and its parents, if missing
+    """
+    try:
+        os.makedirs(path)
+    except OSError as err:
+        if err.errno != errno.EEXIST:
+            raise
+
+
+def fsync_dir(path):
+    """
+    Sync a directory so that the renames made in it are durable
+    """
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+@contextmanager
+def atomic_path(path):
+    """
+    Write a file atomically.
+
+    Yield a unique temporary path next to ``path``; once the caller wrote
+    it, the temporary file is synced and renamed over ``path``. The
+    temporary file is removed if the caller fails.
+    :param path: path of the file to replace
+    :type path: str
+    """
+    directory = os.path.dirname(path)
+    makedirs(directory)
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + ".",
+                                    suffix=".tmp", dir=directory)
+    os.close(fd)
+    os.chmod(tmp_path, 0o644)
+    try:
+        yield tmp_path
+        fd = os.open(tmp_path, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        os.rename(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+    fsync_dir(directory)
+
+
+class FileLock(object):
+    """
+    Exclusive lock between processes on a lock file.
+
+    The lock is an advisory ``flock``, released by the kernel if the
+    process dies, so a crashed writer never leaves a stale lock.
+    """
+
+    def __init__(self, path):
+        """
+        :param path: lock file path, created if missing
+        :type path: str
+        """
+        self.path = path
+        self._fd = None
+
+    def acquire(self):
+        makedirs(os.path.dirname(self.path))
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        except BaseException:
+            os.close(fd)
+            raise
+        self._fd = fd
+
+    def release(self):
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
@@ -0,0 +1,134 @@
+"""
+Spider middlewares.
+
+:class:`ModpackPriorityMiddleware` makes a sync refresh the mods used in
+the local modpacks first: their pages are requested at the start of the
+crawl with a high priority, ahead of the catalog walk, and the rest of
+the catalog is backfilled at a low priority.
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+import os
+import logging
+
+from six.moves.urllib.parse import urlparse
+from scrapy.http import Request
+
+from .index import mod_slug
+from .modpack import ModpackIndex, ModpackRegistry
+from .spiders.modinfo import RepositorySpider
+
+__all__ = ("ModpackPriorityMiddleware",)
+
+logger = logging.getLogger(__name__)
+
+MOD_CALLBACKS = ("parse_mod_page", "parse_mod_files", "parse_mod_license")
+""" Spider callbacks extracting a single mod """
+
+
+def request_mod_url(request):
+    """
+    The mod a request extracts, None for the other requests
+    :param request: a request built by a repository spider
+    :type request: :class:`scrapy.http.Request`
+    :rtype: str
+    """
+    name = getattr(request.callback, "__name__", None)
+    if name not in MOD_CALLBACKS:
+        return None
+    for key in ("item", "listing"):
+        item = request.meta.get(key)
+        if item is not None and item.get("mod_url"):
+            return item["mod_url"]
+    return request.url
+
+
+def mod_key(mod_url):
+    """
+    Key identifying a mod page whatever the scheme, the ``www`` prefix,
+    the project id or a trailing slash of its url
+    :param mod_url: mod page url
+    :type mod_url: str
+    :return: (host, slug), or the url itself if it has no slug
+    :rtype: tuple
+    """
+    slug = mod_slug(mod_url)
+    if slug is None:
+        return mod_url
+    host = (urlparse(mod_url).hostname or "").lower()
+    if host.startswith("www."):
+        host = host[4:]
+    return host, slug.lower()
+
+
+class ModpackPriorityMiddleware(object):
+    """
+    Prioritize the mods installed in the local modpacks.
+
+    The modpacks are the ones in the ``MPM_PRIORITY_MODPACKS`` setting and
+    the ones recorded in the modpack registry by ``mpm install``. Their
+    mod, files and license pages get ``MPM_PRIORITY_BOOST`` added to
+    their priority, the pages of the other mods are lowered below the
+    mod lists so the catalog is still discovered while they wait. Mods
+    are matched by :func:`mod_key`, and a mod page redirected from a
+    modpack mod is boosted under its new url as well.
+    """
+
+    def __init__(self, modpacks, boost=100):
+        """
+        :param modpacks: modpack directories, the ones whose index can
+        not be read are skipped
+        :type modpacks: list
+        :param boost: priority added to the requests of the modpack mods
+        :type boost: int
+        """
+        self.boost = boost
+        self.mod_urls = set()
+        for path in modpacks:
+            try:
+                self.mod_urls.update(ModpackIndex(path).load())
+            except (IOError, ValueError, KeyError) as err:
+                logger.warning("Can not read the index of modpack %s: %s", path, err)
+        self.mod_keys = set(mod_key(mod_url) for mod_url in self.mod_urls)
+        logger.info("Prioritizing %d mods of %d modpacks", len(self.mod_urls), len(modpacks))
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        modpacks = [os.path.abspath(os.path.expanduser(path))
+                    for path in settings.getlist("MPM_PRIORITY_MODPACKS")]
+        for path in ModpackRegistry.from_settings(settings).modpacks():
+            if path not in modpacks:
+                modpacks.append(path)
+        return cls(modpacks, settings.getint("MPM_PRIORITY_BOOST"))
+
+    def _prioritize(self, request):
+        mod_url = request_mod_url(request)
+        if mod_url is None:
+            return request
+        if mod_key(mod_url) in self.mod_keys:
+            return request.replace(priority=request.priority + self.boost)
+        return request.replace(priority=request.priority - 1)
+
+    def process_start_requests(self, start_requests, spider):
+        if isinstance(spider, RepositorySpider):
+            for mod_url in sorted(self.mod_urls):
+                if not spider.serves(mod_url):
+                    continue
+                request = spider.mod_request(mod_url)
+                if request is None:
+                    break
+                yield self._prioritize(request)
+        for request in start_requests:
+            yield self._prioritize(request)
+
+    def process_spider_output(self, response, result, spider):
+        if response is not None and \
+           any(mod_key(url) in self.mod_keys
+               for url in response.meta.get("redirect_urls") or ()):
+            self.mod_keys.add(mod_key(response.url))
+        for element in result:
+            if isinstance(element, Request):
+                element = self._prioritize(element)
+            yield element
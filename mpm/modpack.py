@@ -0,0 +1,272 @@
+"""
+Modpack index.
+
+Each modpack keeps its own index of the installed mods in the ``.mpm``
+directory of the modpack. The index maps the mod url of each installed
+mod to the file that was installed for it.
+
+The index keeps the dependency graph of the installed mods, see
+:class:`dependencies.DependencyGraph`, to find the mods affected by a
+removal.
+
+Several mpm processes may install in the same modpack at once, see
+:mod:`locking`: the index is saved under the modpack lock by applying
+the changes made since it was loaded to the current index on disk.
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+import os
+import json
+import errno
+
+import six
+
+from .locking import FileLock, atomic_path
+from .dependencies import DependencyGraph
+
+__all__ = ("ModpackIndex", "ModpackRegistry")
+
+
+class ModpackIndex(object):
+    """
+    Index of the mods installed in a modpack.
+
+    Each entry is a dict holding at least the ``file`` installed, relative
+    to the modpack directory, and its ``sha256`` and ``size``. The
+    ``dependencies`` (mod urls), ``modids`` and ``requires`` (mod ids)
+    of an entry link it to the other installed mods; ``explicit`` is
+    False for the mods installed only as the dependency of others.
+    """
+
+    DIR = ".mpm"
+    """ Modpack metadata directory """
+
+    INDEX = "index.json"
+    """ Index file name """
+
+    LOCK = "lock"
+    """ Modpack lock file name, held by the writers of the modpack state """
+
+    def __init__(self, path):
+        """
+        :param path: modpack directory
+        :type path: str
+        """
+        self.path = os.path.abspath(path)
+        self.mods = {}
+        self._changes = {}
+        """ Entries added or removed (None) since the index was loaded """
+
+        self.graph = DependencyGraph()
+        """ Dependencies of the installed mods """
+
+    def meta_path(self, *names):
+        """
+        Path of a file in the modpack metadata directory
+        """
+        return os.path.join(self.path, self.DIR, *names)
+
+    @property
+    def index_path(self):
+        return self.meta_path(self.INDEX)
+
+    def lock(self):
+        """
+        The modpack write lock
+        :rtype: :class:`locking.FileLock`
+        """
+        return FileLock(self.meta_path(self.LOCK))
+
+    def _read(self):
+        try:
+            with open(self.index_path, "rb") as fd:
+                return json.loads(fd.read().decode("utf-8"))["mods"]
+        except IOError as err:
+            if err.errno != errno.ENOENT:
+                raise
+            return {}
+
+    def load(self):
+        """
+        Load the index, a modpack without index has no mods installed.
+        Loading never waits for the writers.
+        """
+        self.mods = self._read()
+        self._changes = {}
+        self._build_graph()
+        return self
+
+    def save(self):
+        """
+        Write the index. The changes made since the index was loaded are
+        applied to the index on disk under the modpack lock, so the mods
+        installed meanwhile by other processes are kept; the file is
+        replaced atomically. Only the mods changed by the other processes
+        are relinked in the dependency graph.
+        """
+        with self.lock():
+            mods = self._read()
+            for mod_url, entry in six.iteritems(self._changes):
+                if entry is None:
+                    mods.pop(mod_url, None)
+                else:
+                    mods[mod_url] = entry
+            data = json.dumps({"mods": mods}, indent=2, sort_keys=True)
+            with atomic_path(self.index_path) as tmp_path:
+                with open(tmp_path, "wb") as fd:
+                    fd.write(data.encode("utf-8"))
+        for mod_url in set(mods) | set(self.mods):
+            entry = mods.get(mod_url)
+            if entry is None:
+                self.graph.remove(mod_url)
+            elif entry != self.mods.get(mod_url):
+                self._link(mod_url, entry)
+        self.mods = mods
+        self._changes = {}
+
+    def _link(self, mod_url, entry):
+        self.graph.add(mod_url, entry.get("dependencies"),
+                       entry.get("modids"), entry.get("requires"))
+
+    def _build_graph(self):
+        self.graph = DependencyGraph()
+        for mod_url, entry in six.iteritems(self.mods):
+            self._link(mod_url, entry)
+
+    def __len__(self):
+        return len(self.mods)
+
+    def __contains__(self, mod_url):
+        return mod_url in self.mods
+
+    def __iter__(self):
+        return iter(self.mods)
+
+    def get(self, mod_url):
+        return self.mods.get(mod_url)
+
+    def add(self, mod_url, entry):
+        """
+        Record an installed mod
+        :param mod_url: mod page url
+        :type mod_url: str
+        :param entry: installed file informations
+        :type entry: dict
+        """
+        self.mods[mod_url] = entry
+        self._changes[mod_url] = entry
+        self._link(mod_url, entry)
+
+    def remove(self, mod_url):
+        """
+        Forget an installed mod
+        :param mod_url: mod page url
+        :type mod_url: str
+        :return: the removed entry
+        :rtype: dict
+        """
+        entry = self.mods.pop(mod_url)
+        self._changes[mod_url] = None
+        self.graph.remove(mod_url)
+        return entry
+
+    def dependents(self, mod_urls):
+        """
+        The installed mods requiring some mods, directly or transitively
+        :param mod_urls: mod page urls
+        :type mod_urls: iterable
+        :rtype: set
+        """
+        return self.graph.dependents(mod_urls)
+
+    def explicit(self, mod_url):
+        """
+        Whether a mod was installed on its own rather than as the
+        dependency of other mods, the mods installed before this was
+        recorded are explicit
+        :param mod_url: mod page url
+        :type mod_url: str
+        :rtype: bool
+        """
+        return self.mods[mod_url].get("explicit", True)
+
+    def orphans(self, mod_urls):
+        """
+        The installed dependencies only needed by some mods, the mods
+        installed explicitly are never orphans
+        :param mod_urls: mod page urls
+        :type mod_urls: iterable
+        :rtype: set
+        """
+        return self.graph.orphans(mod_urls, [mod_url for mod_url in self.mods
+                                             if self.explicit(mod_url)])
+
+    def files(self):
+        """
+        Iterate the installed files
+        :return: iterator of (absolute file path, entry)
+        :rtype: iterator
+        """
+        for entry in six.itervalues(self.mods):
+            yield os.path.join(self.path, entry["file"]), entry
+
+
+class ModpackRegistry(object):
+    """
+    Registry of the local modpacks.
+
+    The modpacks mpm installed mods in are recorded here, so that a sync
+    knows which mods are used locally and can refresh them first.
+    """
+
+    def __init__(self, path):
+        """
+        :param path: registry file
+        :type path: str
+        """
+        self.path = path
+
+    @classmethod
+    def from_settings(cls, settings):
+        """
+        Create the registry configured in the mpm settings
+        :param settings: scrapy settings
+        :type settings: :class:`scrapy.settings.Settings`
+        """
+        return cls(os.path.expanduser(settings.get("MPM_MODPACK_REGISTRY")))
+
+    def _read(self):
+        try:
+            with open(self.path, "rb") as fd:
+                return json.loads(fd.read().decode("utf-8"))["modpacks"]
+        except IOError as err:
+            if err.errno != errno.ENOENT:
+                raise
+            return []
+
+    def modpacks(self):
+        """
+        The registered modpacks that still exist
+        :return: list of modpack directories
+        :rtype: list
+        """
+        return [path for path in self._read()
+                if os.path.isdir(os.path.join(path, ModpackIndex.DIR))]
+
+    def register(self, path):
+        """
+        Record a modpack, the modpacks that no longer exist are forgotten
+        :param path: modpack directory
+        :type path: str
+        """
+        path = os.path.abspath(path)
+        with FileLock(self.path + ".lock"):
+            modpacks = self.modpacks()
+            if path in modpacks:
+                return
+            modpacks.append(path)
+            data = json.dumps({"modpacks": sorted(modpacks)}, indent=2)
+            with atomic_path(self.path) as tmp_path:
+                with open(tmp_path, "wb") as fd:
+                    fd.write(data.encode("utf-8"))
@@ -5,7 +5,141 @@
 # Don't forget to add your pipeline to the ITEM_PIPELINES setting
 # See: http://doc.scrapy.org/en/latest/topics/item-pipeline.html
 
+from __future__ import absolute_import
+
+import os
+import sys
+import gzip
+import json
+import errno
+
+from twisted.internet import task
+from scrapy.exceptions import NotConfigured
+
+from .archive import ModArchive, item_to_record
+from .items import ModItem, ModFileItem
+
 
 class MpmPipeline(object):
     def process_item(self, item, spider):
         return item
+
+
+class ArchivePipeline(object):
+    """
+    Store the scraped :class:`ModItem` in the local mod archive.
+
+    The items are merged in the archive when the spider is closed, the
+    archive indexes are rebuilt on commit so they are always in sync with
+    the catalog. :class:`ModFileItem` are stored with the mod they belong to.
+    """
+
+    def __init__(self, archive):
+        self.archive = archive
+        self.items = {}
+        self.files = []
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(ModArchive.from_settings(crawler.settings))
+
+    def open_spider(self, spider):
+        self.items = {}
+        self.files = []
+
+    def process_item(self, item, spider):
+        if isinstance(item, ModItem):
+            self.items[item["mod_url"]] = item
+        elif isinstance(item, ModFileItem):
+            self.files.append(item)
+        return item
+
+    def close_spider(self, spider):
+        self.archive.load()
+        self.archive.update(self.items.values())
+        self.archive.update_files(self.files)
+        self.archive.commit()
+        spider.logger.info("Archived {0} mods, archive generation {1}".format(
+            len(self.items), self.archive.generation))
+
+
+class NdjsonExportPipeline(object):
+    """
+    Stream the scraped :class:`ModItem` as newline delimited json.
+
+    Each item is written as soon as it is scraped, one record per line.
+    The output is flushed and synced to disk every
+    ``MPM_EXPORT_FLUSH_ITEMS`` items and every
+    ``MPM_EXPORT_FLUSH_INTERVAL`` seconds, so the file can be tailed
+    during the crawl and a crash only loses the last unflushed records.
+    Paths ending in ``.gz`` are compressed on the fly, the compressor is
+    sync-flushed as well so the data written so far can be decompressed.
+    A path of ``-`` writes to the standard output.
+    """
+
+    def __init__(self, path, flush_items, flush_interval):
+        self.path = path
+        self.flush_items = flush_items
+        self.flush_interval = flush_interval
+        self.file = None
+        self.pending = 0
+        self.timer = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        path = crawler.settings.get("MPM_EXPORT_PATH")
+        if not path:
+            raise NotConfigured
+        return cls(path,
+                   crawler.settings.getint("MPM_EXPORT_FLUSH_ITEMS"),
+                   crawler.settings.getfloat("MPM_EXPORT_FLUSH_INTERVAL"))
+
+    def open_spider(self, spider):
+        if self.path == "-":
+            self.stream = getattr(sys.stdout, "buffer", sys.stdout)
+            self.file = self.stream
+        else:
+            path = os.path.expanduser(self.path % {"name": spider.name})
+            self.stream = open(path, "ab")
+            if path.endswith(".gz"):
+                self.file = gzip.GzipFile(fileobj=self.stream, mode="ab")
+            else:
+                self.file = self.stream
+        if self.flush_interval:
+            self.timer = task.LoopingCall(self.flush)
+            self.timer.start(self.flush_interval, now=False)
+
+    def process_item(self, item, spider):
+        if isinstance(item, ModItem):
+            line = json.dumps(item_to_record(item), sort_keys=True) + "\n"
+            self.file.write(line.encode("utf-8"))
+            self.pending += 1
+            if self.flush_items and self.pending >= self.flush_items:
+                self.flush()
+        return item
+
+    def flush(self):
+        """
+        Flush the records written so far and sync them to disk
+        """
+        if not self.pending:
+            return
+        self.file.flush()
+        if self.file is not self.stream:
+            self.stream.flush()
+        try:
+            os.fsync(self.stream.fileno())
+        except OSError as err:
+            # pipes and terminals can not be synced
+            if err.errno != errno.EINVAL:
+                raise
+        self.pending = 0
+
+    def close_spider(self, spider):
+        if self.timer and self.timer.running:
+            self.timer.stop()
+        self.flush()
+        if self.stream is not self.file:
+            self.file.close()
+        if self.path != "-":
+            self.stream.close()
@@ -0,0 +1,135 @@
+"""
+Archive queries.
+
+The queries answered by the cli commands. The results are plain json
+serializable data so that the same queries can be answered by a running
+:mod:`daemon` or locally.
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+from .archive import item_to_record
+from .index import normalize_name, tokenize
+from .modpack import ModpackIndex
+
+__all__ = ("QueryEngine",)
+
+
+class QueryEngine(object):
+    """
+    Answer queries on a loaded archive.
+    """
+
+    COMMANDS = ("show", "search", "update", "changes")
+    """ Queries that can be run with :meth:`run` """
+
+    def __init__(self, archive, cache=None):
+        """
+        :param archive: the loaded mod archive
+        :type archive: :class:`archive.ModArchive`
+        :param cache: cache of the show and search results
+        :type cache: :class:`querycache.QueryCache`
+        """
+        self.archive = archive
+        self.cache = cache
+
+    def _cached(self, key, query, texts):
+        """
+        Run a query returning (score, item) through the cache
+        """
+        if self.cache is None:
+            return query()
+        ids = self.cache.get(key, self.archive.generation)
+        if ids is None:
+            results = query()
+            self.cache.put(key, self.archive.generation,
+                           [[score, item["mod_url"]] for score, item in results])
+            return results
+        results = []
+        for score, mod_url in ids:
+            item = self.archive.get(mod_url, texts)
+            if item is not None:
+                results.append((score, item))
+        return results
+
+    def run(self, command, args):
+        """
+        Run a query by name
+        :param command: query name, one of :attr:`COMMANDS`
+        :type command: str
+        :param args: query arguments
+        :type args: dict
+        """
+        if command not in self.COMMANDS:
+            raise ValueError("Unknown query {0}".format(command))
+        return getattr(self, command)(**args)
+
+    def show(self, name, limit=5):
+        """
+        Find a mod by name, tolerating typos
+        :return: list of {"score", "mod"} with the best match first
+        :rtype: list
+        """
+        key = "show\0{0}\0{1}".format(normalize_name(name), limit)
+        results = self._cached(key, lambda: self.archive.find(name, limit), True)
+        return [{"score": score, "mod": item_to_record(item)}
+                for score, item in results]
+
+    def search(self, query, limit=20, page=1):
+        """
+        Search mods, ranked by relevance and popularity; when nothing
+        matches, the mods with a similar name are returned.
+        :return: list of {"score", "mod"}
+        :rtype: list
+        """
+        def run():
+            results = self.archive.search(query, limit, (page - 1) * limit)
+            if not results and page == 1:
+                results = self.archive.find(query, limit)
+            return results
+
+        terms = " ".join(tokenize(query))
+        key = "search\0{0}\0{1}\0{2}".format(terms, limit, page)
+        results = self._cached(key, run, False)
+        return [{"score": score, "mod": item_to_record(item)}
+                for score, item in results]
+
+    def update(self, modpack, since=None):
+        """
+        Find the mods installed in a modpack that were updated in the
+        archive after they were installed
+        :param modpack: modpack directory
+        :type modpack: str
+        :param since: only check the mods changed after this archive
+        generation, see :meth:`changes`
+        :type since: int
+        :return: list of {"mod", "installed"} for each outdated mod
+        :rtype: list
+        """
+        outdated = []
+        index = ModpackIndex(modpack).load()
+        mod_urls = sorted(index.mods)
+        if since is not None:
+            changed = set(change["mod_url"] for change in self.archive.changes(since))
+            mod_urls = [mod_url for mod_url in mod_urls if mod_url in changed]
+        for mod_url in mod_urls:
+            entry = index.mods[mod_url]
+            item = self.archive.get(mod_url, texts=False)
+            if item is None or not item.get("updated"):
+                continue
+            record = item_to_record(item)
+            if record["updated"] > (entry.get("updated") or ""):
+                outdated.append({"mod": record, "installed": entry})
+        return outdated
+
+    def changes(self, since=0):
+        """
+        Get the mods added, updated and removed after an archive generation
+        :param since: archive generation
+        :type since: int
+        :return: {"generation": current generation, "changes": list of
+        changes}, see :class:`changes.ChangeLog`
+        :rtype: dict
+        """
+        return {"generation": self.archive.generation,
+                "changes": self.archive.changes(since)}
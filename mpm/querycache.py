@@ -0,0 +1,131 @@
+"""
+Query result cache.
+
+The results of the ``search`` and ``show`` queries are cached as lists of
+(score, mod url), keyed by the normalized query. The cache belongs to one
+archive generation: it is emptied as soon as it is used with a newer
+generation, so a sync invalidates it without any bookkeeping. The cache
+is kept in memory by the daemon and saved to the mpm cache directory by
+the standalone cli.
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+import os
+import json
+import errno
+import logging
+
+from collections import OrderedDict
+
+from .locking import atomic_path
+
+__all__ = ("QueryCache",)
+
+logger = logging.getLogger(__name__)
+
+
+class QueryCache(object):
+    """
+    Least recently used cache of query results for an archive generation.
+    """
+
+    def __init__(self, path=None, size=1024):
+        """
+        :param path: cache file, the cache is not persistent if not given
+        :type path: str
+        :param size: maximum number of cached queries
+        :type size: int
+        """
+        self.path = path
+        self.size = size
+        self.generation = None
+        self._entries = OrderedDict()
+        self._dirty = False
+
+    @classmethod
+    def from_settings(cls, settings):
+        """
+        Create the persistent query cache configured in the mpm settings
+        :param settings: scrapy settings
+        :type settings: :class:`scrapy.settings.Settings`
+        """
+        cache_dir = os.path.expanduser(settings.get("MPM_CACHE_DIR"))
+        return cls(os.path.join(cache_dir, "queries.json"),
+                   settings.getint("MPM_QUERY_CACHE_SIZE"))
+
+    def __len__(self):
+        return len(self._entries)
+
+    def load(self):
+        """
+        Load the saved cache, a missing or corrupted cache is empty
+        """
+        try:
+            with open(self.path, "rb") as fd:
+                data = json.loads(fd.read().decode("utf-8"))
+            self.generation = data["generation"]
+            self._entries = OrderedDict((key, value) for key, value in data["entries"])
+        except IOError as err:
+            if err.errno != errno.ENOENT:
+                raise
+        except (ValueError, KeyError):
+            logger.warning("Discarding corrupted query cache %s", self.path)
+        self._dirty = False
+        return self
+
+    def save(self):
+        """
+        Save the cache if it changed
+        """
+        if self.path is None or not self._dirty:
+            return
+        data = json.dumps({"generation": self.generation,
+                           "entries": list(self._entries.items())})
+        with atomic_path(self.path) as tmp_path:
+            with open(tmp_path, "wb") as fd:
+                fd.write(data.encode("utf-8"))
+        self._dirty = False
+
+    def _check(self, generation):
+        if generation != self.generation:
+            self._entries.clear()
+            self.generation = generation
+            self._dirty = True
+
+    def get(self, key, generation):
+        """
+        Get cached results
+        :param key: normalized query
+        :type key: str
+        :param generation: generation of the queried archive
+        :type generation: int
+        :return: list of [score, mod url] or None if not cached
+        :rtype: list
+        """
+        self._check(generation)
+        value = self._entries.get(key)
+        if value is not None and next(reversed(self._entries)) != key:
+            # saved as well, the cli processes share the recency of hits
+            del self._entries[key]
+            self._entries[key] = value
+            self._dirty = True
+        return value
+
+    def put(self, key, generation, value):
+        """
+        Cache the results of a query, the least recently used query is
+        evicted when the cache is full
+        :param key: normalized query
+        :type key: str
+        :param generation: generation of the queried archive
+        :type generation: int
+        :param value: list of [score, mod url]
+        :type value: list
+        """
+        self._check(generation)
+        self._entries.pop(key, None)
+        self._entries[key] = value
+        while len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+        self._dirty = True
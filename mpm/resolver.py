@@ -0,0 +1,264 @@
+"""
+Download url resolution.
+
+Mod files are often published behind redirects and interactive pages,
+such as ad.fly like link shorteners, before reaching the actual file.
+The :class:`UrlResolver` follows these chains once and caches the direct
+url until it expires, so that installing the same file again does not
+resolve it again.
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+import os
+import re
+import json
+import time
+import errno
+import base64
+import logging
+
+from email.utils import parsedate_tz, mktime_tz
+from multiprocessing.pool import ThreadPool
+
+import six
+from six.moves.urllib.parse import urljoin
+from six.moves.urllib.request import build_opener, Request
+
+from .locking import atomic_path
+
+__all__ = ("UrlResolver", "next_hop")
+
+logger = logging.getLogger(__name__)
+
+INTERSTITIAL_PATTERNS = [
+    # <meta http-equiv="refresh" content="5; url=...">
+    r"""<meta[^>]+http-equiv=["']?refresh["']?[^>]+content=["']?\d+\s*;\s*url=([^"'>]+)""",
+    # window.location = "..."; window.location.href = '...'
+    r"""window\.location(?:\.href)?\s*=\s*["']([^"']+)["']""",
+    # skip ad / continue buttons
+    r"""<a[^>]+id=["']?(?:skip_button|skip-ad|continue)["']?[^>]+href=["']([^"']+)["']""",
+]
+
+
+def decode_ysmm(ysmm):
+    """
+    Decode the target url hidden in the ``ysmm`` variable of ad.fly pages
+    :param ysmm: the ysmm string
+    :type ysmm: str
+    :return: the decoded url
+    :rtype: str
+    """
+    left, right = "", ""
+    for i in range(0, len(ysmm) - 1, 2):
+        left += ysmm[i]
+        right = ysmm[i + 1] + right
+    return base64.b64decode((left + right).encode("ascii"))[2:].decode("utf-8")
+
+
+def next_hop(body, base_url):
+    """
+    Find the url an interstitial page leads to
+    :param body: html page
+    :type body: str
+    :param base_url: url of the page
+    :type base_url: str
+    :return: the next url or None if the page is not an interstitial
+    :rtype: str
+    """
+    match = re.search(r"""var\s+ysmm\s*=\s*["']([^"']+)["']""", body)
+    if match:
+        try:
+            return decode_ysmm(match.group(1))
+        except (ValueError, TypeError, UnicodeDecodeError):
+            logger.warning("Can not decode ysmm link at %s", base_url)
+    for pattern in INTERSTITIAL_PATTERNS:
+        match = re.search(pattern, body, re.I)
+        if match:
+            return urljoin(base_url, match.group(1).strip())
+    return None
+
+
+def response_expiry(headers, default_ttl, now):
+    """
+    Compute when a resolved url expires from the response cache headers
+    """
+    cache_control = headers.get("Cache-Control") or ""
+    match = re.search(r"max-age=(\d+)", cache_control)
+    if match:
+        return now + int(match.group(1))
+    expires = headers.get("Expires")
+    if expires:
+        parsed = parsedate_tz(expires)
+        if parsed:
+            return mktime_tz(parsed)
+    return now + default_ttl
+
+
+class UrlResolver(object):
+    """
+    Resolve download urls to direct file urls.
+
+    Http redirects are followed by urllib, interstitial html pages are
+    followed with :func:`next_hop` until a non html response is found.
+    The resolved urls are cached in a json file with their expiry.
+    """
+
+    MAX_BODY = 512 * 1024
+    """ Maximum number of bytes read from an interstitial page """
+
+    def __init__(self, cache_path=None, ttl=24 * 3600, workers=8, max_hops=8,
+                 timeout=30, user_agent="mpm"):
+        """
+        :param cache_path: resolved urls cache file, nothing is cached
+        if not given
+        :param ttl: seconds a resolved url is kept when the server does
+        not give an expiry
+        :param workers: number of urls resolved concurrently
+        :param max_hops: maximum number of interstitial pages followed
+        :param timeout: request timeout in seconds
+        """
+        self.cache_path = cache_path
+        self.ttl = ttl
+        self.workers = workers
+        self.max_hops = max_hops
+        self.timeout = timeout
+        self.user_agent = user_agent
+        self.opener = build_opener()
+        self.cache = {}
+        if cache_path:
+            try:
+                with open(cache_path, "rb") as fd:
+                    self.cache = json.loads(fd.read().decode("utf-8"))
+            except IOError as err:
+                if err.errno != errno.ENOENT:
+                    raise
+            except ValueError:
+                logger.warning("Discarding corrupted resolver cache %s", cache_path)
+
+    @classmethod
+    def from_settings(cls, settings):
+        """
+        Create the resolver configured in the mpm settings, the cache is
+        kept in the mpm cache directory
+        :param settings: scrapy settings
+        :type settings: :class:`scrapy.settings.Settings`
+        """
+        cache_dir = os.path.expanduser(settings.get("MPM_CACHE_DIR"))
+        return cls(os.path.join(cache_dir, "resolved.json"),
+                   ttl=settings.getint("MPM_RESOLVER_TTL"),
+                   workers=settings.getint("MPM_RESOLVER_WORKERS"),
+                   timeout=settings.getfloat("DOWNLOAD_TIMEOUT"),
+                   user_agent=settings.get("USER_AGENT"))
+
+    def _save(self):
+        now = time.time()
+        self.cache = dict((url, entry) for url, entry in six.iteritems(self.cache)
+                          if entry["expires"] > now)
+        with atomic_path(self.cache_path) as tmp_path:
+            with open(tmp_path, "wb") as fd:
+                fd.write(json.dumps(self.cache).encode("utf-8"))
+
+    def cached(self, url):
+        """
+        Get the cached direct url for a url, if it did not expire
+        """
+        entry = self.cache.get(url)
+        if entry and entry["expires"] > time.time():
+            return entry["url"]
+        return None
+
+    def follow(self, url):
+        """
+        Follow the redirects and interstitial pages starting at a url
+        :param url: download url
+        :type url: str
+        :return: (direct url, expiry time)
+        :rtype: tuple
+        """
+        current = url
+        for _ in range(self.max_hops):
+            request = Request(current, headers={"User-Agent": self.user_agent})
+            response = self.opener.open(request, timeout=self.timeout)
+            try:
+                final = response.geturl()
+                headers = response.info()
+                content_type = headers.get("Content-Type") or ""
+                if "html" not in content_type:
+                    return final, response_expiry(headers, self.ttl, time.time())
+                charset = re.search(r"charset=([\w-]+)", content_type)
+                body = response.read(self.MAX_BODY).decode(
+                    charset.group(1) if charset else "utf-8", "replace")
+            finally:
+                response.close()
+            hop = next_hop(body, final)
+            if hop is None:
+                # a plain html page, assume this is the file
+                return final, response_expiry(headers, self.ttl, time.time())
+            logger.debug("Interstitial page %s leads to %s", final, hop)
+            current = hop
+        raise ValueError("Too many interstitial pages resolving {0}".format(url))
+
+    def _resolve(self, url):
+        try:
+            return url, self.follow(url), None
+        except Exception as err:
+            return url, None, err
+
+    def resolve_all(self, urls):
+        """
+        Resolve many urls concurrently, the cached ones are not resolved
+        :param urls: iterable of download urls
+        :type urls: iterable
+        :return: (url to direct url, list of (url, error) for the urls
+        that could not be resolved)
+        :rtype: tuple
+        """
+        resolved = {}
+        pending = []
+        for url in urls:
+            direct = self.cached(url)
+            if direct is None:
+                pending.append(url)
+            else:
+                resolved[url] = direct
+        if not pending:
+            return resolved, []
+
+        errors = []
+        pool = ThreadPool(min(self.workers, len(pending)))
+        try:
+            for url, result, error in pool.imap_unordered(self._resolve, set(pending)):
+                if error is not None:
+                    errors.append((url, error))
+                    continue
+                direct, expires = result
+                self.cache[url] = {"url": direct, "expires": expires}
+                resolved[url] = direct
+        finally:
+            pool.close()
+            pool.join()
+        if self.cache_path:
+            self._save()
+        return resolved, errors
+
+    def resolve_many(self, urls):
+        """
+        Resolve many urls concurrently, see :meth:`resolve_all`
+        :param urls: iterable of download urls
+        :type urls: iterable
+        :return: url to direct url
+        :rtype: dict
+        :raise IOError: if an url can not be resolved
+        """
+        resolved, errors = self.resolve_all(urls)
+        if errors:
+            raise IOError("Can not resolve {0}".format(
+                ", ".join("{0} ({1})".format(url, error) for url, error in errors)))
+        return resolved
+
+    def resolve(self, url):
+        """
+        Resolve a download url to a direct file url
+        """
+        return self.resolve_many([url])[url]
@@ -0,0 +1,185 @@
+"""
+Local mods folder scanner.
+
+Find out which mods are installed in a modpack by reading the
+``mcmod.info`` metadata shipped in the mod jars. Only the zip central
+directory and the metadata entry are read from each jar, the jars are
+scanned in parallel and the results are cached by path, size and
+modification time so that unchanged jars are never opened again.
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+import os
+import re
+import json
+import errno
+import zipfile
+import logging
+
+from multiprocessing.pool import ThreadPool
+
+import six
+
+from .locking import atomic_path
+
+__all__ = ("ModScanner", "read_mod_info")
+
+logger = logging.getLogger(__name__)
+
+MOD_INFO = "mcmod.info"
+
+
+def parse_mod_info(data):
+    """
+    Parse the content of a ``mcmod.info`` file.
+    Both the plain list format and the ``modList`` format are accepted,
+    as many mods ship slightly broken json, trailing commas and raw
+    newlines in strings are tolerated.
+    :param data: file content
+    :type data: bytes
+    :return: list of mod metadata dicts, empty if the file holds no list
+    :rtype: list
+    """
+    text = data.decode("utf-8", "replace")
+    try:
+        info = json.loads(text, strict=False)
+    except ValueError:
+        info = json.loads(re.sub(r",(\s*[\]}])", r"\1", text), strict=False)
+    if isinstance(info, dict):
+        info = info.get("modList", [])
+    if not isinstance(info, list):
+        return []
+    return [mod for mod in info if isinstance(mod, dict)]
+
+
+def read_mod_info(path):
+    """
+    Read the mod metadata from a jar.
+    The zip central directory is read to find the ``mcmod.info``
+    entry, no other entry is decompressed.
+    :param path: jar path
+    :type path: str
+    :return: list of mod metadata dicts, empty if the jar has none
+    :rtype: list
+    """
+    try:
+        with zipfile.ZipFile(path) as jar:
+            try:
+                data = jar.read(MOD_INFO)
+            except KeyError:
+                return []
+        return parse_mod_info(data)
+    except (zipfile.BadZipfile, ValueError, IOError) as err:
+        logger.warning("Can not read mod info from %s: %s", path, err)
+        return []
+
+
+class ModScanner(object):
+    """
+    Scanner for a mods folder.
+
+    The scan results are cached in a json file, a jar is read again only
+    when its size or modification time change.
+    """
+
+    def __init__(self, cache_path=None, workers=8):
+        """
+        :param cache_path: scan cache file, no cache is kept if not given
+        :type cache_path: str
+        :param workers: number of jars read in parallel
+        :type workers: int
+        """
+        self.cache_path = cache_path
+        self.workers = workers
+        self.cache = {}
+        if cache_path:
+            try:
+                with open(cache_path, "rb") as fd:
+                    self.cache = json.loads(fd.read().decode("utf-8"))
+            except IOError as err:
+                if err.errno != errno.ENOENT:
+                    raise
+            except ValueError:
+                logger.warning("Discarding corrupted scan cache %s", cache_path)
+
+    def _save(self):
+        with atomic_path(self.cache_path) as tmp_path:
+            with open(tmp_path, "wb") as fd:
+                fd.write(json.dumps(self.cache).encode("utf-8"))
+
+    def scan(self, mods_dir):
+        """
+        Scan the jars in a mods folder
+        :param mods_dir: mods folder
+        :type mods_dir: str
+        :return: jar path to list of mod metadata dicts
+        :rtype: dict
+        """
+        mods_dir = os.path.abspath(mods_dir)
+        jars = {}
+        for name in os.listdir(mods_dir):
+            if not name.endswith((".jar", ".zip")):
+                continue
+            path = os.path.join(mods_dir, name)
+            stat = os.stat(path)
+            jars[path] = (stat.st_size, stat.st_mtime)
+
+        results = {}
+        stale = []
+        for path, (size, mtime) in six.iteritems(jars):
+            entry = self.cache.get(path)
+            if entry and entry["size"] == size and entry["mtime"] == mtime:
+                results[path] = entry["mods"]
+            else:
+                stale.append(path)
+
+        removed = [path for path in self.cache
+                   if os.path.dirname(path) == mods_dir and path not in jars]
+        for path in removed:
+            del self.cache[path]
+
+        if stale:
+            pool = ThreadPool(min(self.workers, len(stale)))
+            try:
+                infos = pool.map(read_mod_info, stale)
+            finally:
+                pool.close()
+                pool.join()
+            for path, mods in zip(stale, infos):
+                size, mtime = jars[path]
+                self.cache[path] = {"size": size, "mtime": mtime, "mods": mods}
+                results[path] = mods
+
+        if self.cache_path and (stale or removed):
+            self._save()
+        return results
+
+    def match(self, results, archive, threshold=0.6):
+        """
+        Map the scanned jars to the mods in the archive.
+        The mod url found in the metadata is used if it is an archive mod,
+        otherwise the mod is looked up by name.
+        :param results: scan results, see :meth:`scan`
+        :type results: dict
+        :param archive: the local mod archive
+        :type archive: :class:`archive.ModArchive`
+        :param threshold: minimum name similarity of a match
+        :type threshold: float
+        :return: jar path to :class:`ModItem` or None if not in the archive
+        :rtype: dict
+        """
+        matched = {}
+        for path, mods in six.iteritems(results):
+            matched[path] = None
+            for mod in mods:
+                url = mod.get("url")
+                if url and url in archive:
+                    matched[path] = archive.get(url)
+                    break
+                candidates = archive.find(mod.get("name") or mod.get("modid") or "",
+                                          limit=1)
+                if candidates and candidates[0][0] >= threshold:
+                    matched[path] = candidates[0][1]
+                    break
+        return matched
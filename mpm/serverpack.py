@@ -0,0 +1,283 @@
+"""
+Server pack builder.
+
+A server pack holds the mods of a modpack that must run on the server,
+the ones whose :class:`items.ModItem` ``smp`` flag is set, and the
+modpack configuration. The pack is built from the modpack index: the
+files are staged in the ``.mpm/server`` directory of the modpack, the
+mod jars are hardlinked there instead of being copied, and the staged
+tree is written to a zip or tar archive.
+
+A manifest of the staged files is kept next to the staging directory, so
+a rebuild only stages the files that changed since the last server pack
+and the archive is not written at all when nothing changed.
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+import os
+import json
+import errno
+import shutil
+import logging
+import tarfile
+import zipfile
+
+from multiprocessing.pool import ThreadPool
+
+import six
+
+from .locking import atomic_path, makedirs
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+__all__ = ("ServerPackBuilder", "pack_format")
+
+logger = logging.getLogger(__name__)
+
+FORMATS = {
+    ".zip": "zip",
+    ".tar": "tar",
+    ".tar.gz": "tar.gz",
+    ".tgz": "tar.gz",
+    ".tar.zst": "tar.zst",
+}
+""" Archive file extensions to archive format """
+
+CONFIG_DIRS = ("config",)
+""" Modpack directories copied to the server pack """
+
+
+def pack_format(path):
+    """
+    Archive format of a server pack path
+    :param path: server pack path
+    :type path: str
+    :return: "zip", "tar", "tar.gz" or "tar.zst"
+    :rtype: str
+    :raise ValueError: if the extension is not a known archive format
+    """
+    for extension in sorted(FORMATS, key=len, reverse=True):
+        if path.endswith(extension):
+            return FORMATS[extension]
+    raise ValueError("Unknown server pack format {0}, use one of {1}".format(
+        path, ", ".join(sorted(FORMATS))))
+
+
+def link_or_copy(source, target):
+    """
+    Hardlink a file, copy it when the link can not be made, for instance
+    across filesystems
+    """
+    try:
+        os.remove(target)
+    except OSError as err:
+        if err.errno != errno.ENOENT:
+            raise
+    makedirs(os.path.dirname(target))
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copy2(source, target)
+
+
+class ServerPackBuilder(object):
+    """
+    Build the server pack of a modpack.
+    """
+
+    STAGE = "server"
+    """ Staging directory, in the modpack metadata directory """
+
+    MANIFEST = "server.json"
+    """ Manifest of the staged files, in the modpack metadata directory """
+
+    def __init__(self, index, archive, workers=4, config_dirs=CONFIG_DIRS):
+        """
+        :param index: the loaded modpack index
+        :type index: :class:`modpack.ModpackIndex`
+        :param archive: the loaded mod archive, for the ``smp`` flags
+        :type archive: :class:`archive.ModArchive`
+        :param workers: number of files staged in parallel
+        :type workers: int
+        :param config_dirs: modpack directories included in the pack
+        :type config_dirs: tuple
+        """
+        self.index = index
+        self.archive = archive
+        self.workers = workers
+        self.config_dirs = config_dirs
+        self.stage_path = index.meta_path(self.STAGE)
+        self.manifest_path = index.meta_path(self.MANIFEST)
+
+    def server_mods(self):
+        """
+        Select the installed mods needed on the server. The ``smp`` flag of
+        the modpack index entry wins over the one of the archive; mods
+        with no known flag are included, a server missing a mod does not
+        start while a client only mod is at worst not loaded.
+        :return: list of (mod url, index entry)
+        :rtype: list
+        """
+        mods = []
+        for mod_url in sorted(self.index):
+            entry = self.index.get(mod_url)
+            smp = entry.get("smp")
+            if smp is None:
+                item = self.archive.get(mod_url, texts=False)
+                smp = item.get("smp") if item is not None else None
+            if smp is None:
+                logger.warning("Server support of %s is unknown, including it", mod_url)
+            if smp is False:
+                continue
+            mods.append((mod_url, entry))
+        return mods
+
+    def wanted(self, missing=None):
+        """
+        The files of the server pack, the mods whose file is missing from
+        the modpack are left out
+        :param missing: list the mods with a missing file are appended to
+        :type missing: list
+        :return: path in the pack to (source path, signature); the
+        signature of a mod is its hash, the one of a configuration file is
+        its size and modification time
+        :rtype: dict
+        """
+        files = {}
+        for mod_url, entry in self.server_mods():
+            source = os.path.join(self.index.path, entry["file"])
+            if not os.path.exists(source):
+                logger.warning("File %s of %s is missing, leaving it out of the server pack",
+                               entry["file"], mod_url)
+                if missing is not None:
+                    missing.append(mod_url)
+                continue
+            files[entry["file"]] = (source, entry.get("sha256"))
+        for config_dir in self.config_dirs:
+            top = os.path.join(self.index.path, config_dir)
+            for dirpath, _, filenames in os.walk(top):
+                for filename in filenames:
+                    source = os.path.join(dirpath, filename)
+                    name = os.path.relpath(source, self.index.path).replace(os.sep, "/")
+                    stat = os.stat(source)
+                    files[name] = (source, [stat.st_size, stat.st_mtime])
+        return files
+
+    def _read_manifest(self):
+        try:
+            with open(self.manifest_path, "rb") as fd:
+                return json.loads(fd.read().decode("utf-8"))
+        except IOError as err:
+            if err.errno != errno.ENOENT:
+                raise
+        except ValueError:
+            logger.warning("Discarding corrupted server pack manifest %s", self.manifest_path)
+        return {"files": {}}
+
+    def _staged(self, name):
+        return os.path.join(self.stage_path, *name.split("/"))
+
+    def _stage(self, args):
+        name, source = args
+        link_or_copy(source, self._staged(name))
+        return name
+
+    def stage(self, files, staged):
+        """
+        Update the staging directory
+        :param files: the wanted files, see :meth:`wanted`
+        :type files: dict
+        :param staged: name to signature of the files already staged
+        :type staged: dict
+        :return: (names staged, names removed)
+        :rtype: tuple
+        """
+        removed = sorted(name for name in staged if name not in files)
+        for name in removed:
+            try:
+                os.remove(self._staged(name))
+            except OSError as err:
+                if err.errno != errno.ENOENT:
+                    raise
+        changed = sorted(name for name, (_, signature) in six.iteritems(files)
+                         if staged.get(name) != signature or
+                         not os.path.exists(self._staged(name)))
+        if changed:
+            pool = ThreadPool(min(self.workers, len(changed)))
+            try:
+                for _ in pool.imap_unordered(self._stage, [(name, files[name][0])
+                                                           for name in changed]):
+                    pass
+            finally:
+                pool.close()
+                pool.join()
+        return changed, removed
+
+    def _write_zip(self, path, names):
+        with zipfile.ZipFile(path, "w", allowZip64=True) as pack:
+            for name in names:
+                # jars are already compressed
+                compression = zipfile.ZIP_STORED if name.endswith(".jar") \
+                    else zipfile.ZIP_DEFLATED
+                pack.write(self._staged(name), name, compression)
+
+    def _write_tar(self, path, names, fmt):
+        with open(path, "wb") as fd:
+            if fmt == "tar.zst":
+                if zstandard is None:
+                    raise ImportError("zstandard is needed to write tar.zst server packs")
+                writer = zstandard.ZstdCompressor(threads=-1).stream_writer(fd)
+                mode = "w|"
+            else:
+                writer = fd
+                mode = "w|gz" if fmt == "tar.gz" else "w|"
+            pack = tarfile.open(fileobj=writer, mode=mode)
+            try:
+                for name in names:
+                    pack.add(self._staged(name), name)
+            finally:
+                pack.close()
+            if writer is not fd:
+                writer.flush(zstandard.FLUSH_FRAME)
+
+    def build(self, output):
+        """
+        Build the server pack, only the changes since the last build are
+        staged and the pack is left alone when nothing changed
+        :param output: server pack path, the extension selects the format
+        :type output: str
+        :return: dict with the ``files`` in the pack, the ``staged`` and
+        ``removed`` files, whether the pack was ``written`` and the
+        server mods left out because their file is ``missing``
+        :rtype: dict
+        :raise ValueError: if the output format is not supported
+        """
+        output = os.path.abspath(output)
+        fmt = pack_format(output)
+        manifest = self._read_manifest()
+        missing = []
+        files = self.wanted(missing)
+        changed, removed = self.stage(files, manifest["files"])
+        names = sorted(files)
+        written = bool(changed or removed or manifest.get("output") != output or
+                       manifest.get("format") != fmt or not os.path.exists(output))
+        if written:
+            with atomic_path(output) as tmp_path:
+                if fmt == "zip":
+                    self._write_zip(tmp_path, names)
+                else:
+                    self._write_tar(tmp_path, names, fmt)
+            logger.info("Wrote server pack %s with %d files", output, len(names))
+        data = json.dumps({"output": output, "format": fmt,
+                           "files": dict((name, signature) for name, (_, signature)
+                                         in six.iteritems(files))},
+                          indent=2, sort_keys=True)
+        with atomic_path(self.manifest_path) as tmp_path:
+            with open(tmp_path, "wb") as fd:
+                fd.write(data.encode("utf-8"))
+        return {"files": names, "staged": changed, "removed": removed, "written": written,
+                "missing": missing}
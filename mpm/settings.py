@@ -26,3 +26,138 @@ USER_AGENT = 'mpm'
 DOWNLOAD_DELAY = 5
 
 RANDOMIZE_DOWNLOAD_DELAY = True
+
+# drop duplicate requests with a bloom filter instead of keeping
+# every request fingerprint in memory
+DUPEFILTER_CLASS = 'mpm.dupefilters.BloomDupeFilter'
+
+# keep a compressed cache of the crawled pages and revalidate it with
+# conditional requests, unchanged pages are served from the cache
+HTTPCACHE_ENABLED = True
+HTTPCACHE_POLICY = 'mpm.httpcache.RevalidatePolicy'
+HTTPCACHE_STORAGE = 'mpm.httpcache.CacheStorage'
+HTTPCACHE_DIR = '~/.mpm/cache/http'
+HTTPCACHE_GZIP = True
+
+ITEM_PIPELINES = {
+    'mpm.pipelines.ArchivePipeline': 800,
+    'mpm.pipelines.NdjsonExportPipeline': 900,
+}
+
+SPIDER_MIDDLEWARES = {
+    'mpm.middlewares.ModpackPriorityMiddleware': 600,
+}
+
+EXTENSIONS = {
+    'mpm.extensions.MemoryAccounting': 500,
+}
+
+# mpm settings
+
+# repository spiders synced by mpm sync, repository name to spider class
+MPM_REPOSITORIES = {
+    'curseforge': 'mpm.spiders.curseforge.CurseforgeSpider',
+}
+
+# per repository settings, each repository is crawled with its own
+# throttling budget
+MPM_REPOSITORY_SETTINGS = {
+    'curseforge': {
+        'DOWNLOAD_DELAY': 5,
+        'CONCURRENT_REQUESTS_PER_DOMAIN': 8,
+    },
+}
+
+# local mod archive directory
+MPM_ARCHIVE_DIR = '~/.mpm/archive'
+
+# compression of the mod descriptions and licenses in the archive, zlib or
+# zstd (needs the zstandard package)
+MPM_TEXT_COMPRESSION = 'zlib'
+
+# fill the mods from the mod list pages, mod pages are only fetched for
+# new or updated mods
+MPM_SYNC_SHALLOW = False
+
+# how the mod pages are found: 'pages' walks the mod lists, 'sitemap' reads
+# the repository sitemaps and skips the mods not modified since last sync
+MPM_SYNC_DISCOVERY = 'pages'
+
+# directory for the caches kept by mpm
+MPM_CACHE_DIR = '~/.mpm/cache'
+
+# directory of the columnar catalog export, see mpm export-columns
+MPM_COLUMNS_DIR = '~/.mpm/columns'
+
+# number of search and show queries whose results are cached, 0 disables
+# the cache
+MPM_QUERY_CACHE_SIZE = 1024
+
+# modpacks whose mods are refreshed first by a sync, in addition to the
+# modpacks mpm installed mods in
+MPM_PRIORITY_MODPACKS = []
+
+# registry of the modpacks mpm installed mods in
+MPM_MODPACK_REGISTRY = '~/.mpm/modpacks.json'
+
+# request priority added to the pages of the mods of the local modpacks
+MPM_PRIORITY_BOOST = 100
+
+# number of mod jars read in parallel when scanning a mods folder
+MPM_SCAN_WORKERS = 8
+
+# number of files hashed in parallel when verifying a modpack
+MPM_VERIFY_WORKERS = 4
+
+# number of download urls resolved in parallel
+MPM_RESOLVER_WORKERS = 8
+
+# seconds a resolved download url is cached when the server gives no expiry
+MPM_RESOLVER_TTL = 24 * 3600
+
+# number of mod files downloaded in parallel when installing
+MPM_INSTALL_WORKERS = 4
+
+# number of pages fetched in parallel when refreshing the mods of a modpack
+# without a full sync
+MPM_FETCH_WORKERS = 8
+
+# number of files staged in parallel when building a server pack
+MPM_SERVER_PACK_WORKERS = 4
+
+# gpg executable used to check signatures
+MPM_GPG = 'gpg'
+
+# number of request fingerprints the first bloom filter is sized for
+MPM_DUPEFILTER_CAPACITY = 100000
+
+# bloom filter false positive rate, false positives are confirmed
+# against the on-disk fingerprint set
+MPM_DUPEFILTER_ERROR_RATE = 0.001
+
+# stream the synced mods as newline delimited json to this path,
+# %(name)s is replaced by the spider name, '-' is the standard output
+# and paths ending in .gz are compressed
+MPM_EXPORT_PATH = None
+
+# flush and sync the export every n items
+MPM_EXPORT_FLUSH_ITEMS = 100
+
+# flush and sync the export every n seconds
+MPM_EXPORT_FLUSH_INTERVAL = 10
+
+# record the memory used by each crawl stage in the crawl stats and log
+MPM_MEMACCT_ENABLED = False
+
+# seconds between two memory snapshots
+MPM_MEMACCT_INTERVAL = 60
+
+# close the crawl cleanly once it uses more megabytes than this, 0 for no
+# budget
+MPM_MEMACCT_BUDGET_MB = 0
+
+# unix socket the mpm daemon listens on
+MPM_DAEMON_SOCKET = '~/.mpm/daemon.sock'
+
+# seconds between two syncs run by the mpm daemon, 0 disables them
+MPM_DAEMON_SYNC_INTERVAL = 6 * 3600
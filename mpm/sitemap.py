@@ -0,0 +1,93 @@
+"""
+Streaming sitemap parsing.
+
+Sitemaps list every page of a site with its last modification date, so
+they let a spider find the mod pages without walking the paginated mod
+lists. Sitemaps can be large: they are parsed incrementally and every
+parsed entry is dropped from the tree, so the parse tree stays small
+whatever the number of entries. The sitemap itself is read from a file
+object, which for a scrapy response holds the whole body.
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+import re
+import gzip
+
+from datetime import datetime, timedelta
+
+from lxml import etree
+
+__all__ = ("iter_sitemap", "parse_lastmod")
+
+SITEMAP_NS = "http://www.sitemaps.org/schemas/sitemap/0.9"
+
+GZIP_MAGIC = b"\x1f\x8b"
+
+W3C_DATETIME = re.compile(r"^(\d{4}-\d{2}-\d{2})(?:T(\d{2}):(\d{2})(?::(\d{2})(?:\.\d+)?)?"
+                          r"(Z|[+-]\d{2}:\d{2})?)?$")
+
+
+def parse_lastmod(value):
+    """
+    Parse a W3C datetime, such as ``2015-05-10T07:01:55+00:00`` or
+    ``2015-05-10``
+    :param value: lastmod text
+    :type value: str
+    :return: a naive UTC :class:`datetime.datetime` when the value has a
+    time, a :class:`datetime.date` when it is only a date, None if it can
+    not be parsed
+    :rtype: :class:`datetime.date`
+    """
+    match = W3C_DATETIME.match((value or "").strip())
+    if match is None:
+        return None
+    day, hour, minute, second, zone = match.groups()
+    try:
+        parsed = datetime.strptime(day, "%Y-%m-%d")
+    except ValueError:
+        return None
+    if hour is None:
+        return parsed.date()
+    parsed = parsed.replace(hour=int(hour), minute=int(minute), second=int(second or 0))
+    if zone and zone != "Z":
+        offset = timedelta(hours=int(zone[1:3]), minutes=int(zone[4:6]))
+        parsed = parsed - offset if zone[0] == "+" else parsed + offset
+    return parsed
+
+
+def _clear(element):
+    element.clear()
+    parent = element.getparent()
+    if parent is not None:
+        while element.getprevious() is not None:
+            del parent[0]
+
+
+def iter_sitemap(fileobj):
+    """
+    Iterate the entries of a sitemap or of a sitemap index
+    :param fileobj: binary file object, gzip compressed or not
+    :return: iterator of (kind, loc, lastmod); kind is "sitemap" for the
+    entries of a sitemap index and "url" for the pages of a sitemap,
+    lastmod is parsed by :func:`parse_lastmod`
+    :rtype: iterator
+    """
+    head = fileobj.read(2)
+    fileobj.seek(-len(head), 1)
+    if head == GZIP_MAGIC:
+        fileobj = gzip.GzipFile(fileobj=fileobj)
+    tags = ["{%s}url" % SITEMAP_NS, "{%s}sitemap" % SITEMAP_NS, "url", "sitemap"]
+    for _, element in etree.iterparse(fileobj, events=("end",), tag=tags,
+                                      resolve_entities=False, huge_tree=True):
+        kind = etree.QName(element).localname
+        loc = lastmod = None
+        for child in element:
+            name = etree.QName(child).localname
+            if name == "loc":
+                loc = (child.text or "").strip()
+            elif name == "lastmod":
+                lastmod = parse_lastmod(child.text)
+        _clear(element)
+        if loc:
+            yield kind, loc, lastmod
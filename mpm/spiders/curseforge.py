@@ -1,17 +1,43 @@
 # -*- coding: utf-8 -*-
 
+import re
+import calendar
+
+from io import BytesIO
 from urllib import urlencode
 from urlparse import urljoin, urlparse, parse_qs, urlsplit, urlunsplit
+from datetime import date, datetime
 
-from scrapy.spiders import Spider
 from scrapy.linkextractors.lxmlhtml import LxmlLinkExtractor
 from scrapy.http import Request
 
-from ..loaders import ModItemLoader
-from ..items import ModItem
+from ..loaders import ModItemLoader, ModFileItemLoader
+from ..items import ModItem, ModFileItem
+from ..sitemap import iter_sitemap
+from .modinfo import RepositorySpider
+
+
+def archived_after(lastmod, item):
+    """
+    Whether an archived mod was updated after the last modification of
+    its page listed in a sitemap. The times are compared when both are
+    known, the dates otherwise.
+    :param lastmod: sitemap lastmod, see :func:`sitemap.parse_lastmod`
+    :type lastmod: :class:`datetime.date`
+    :param item: the archived mod
+    :type item: :class:`ModItem`
+    :rtype: bool
+    """
+    if isinstance(lastmod, datetime) and item.get("updated_epoch") is not None:
+        return calendar.timegm(lastmod.utctimetuple()) < item["updated_epoch"]
+    if item.get("updated") is None:
+        return False
+    if isinstance(lastmod, datetime):
+        lastmod = lastmod.date()
+    return lastmod < item["updated"]
 
 
-class CurseforgeSpider(Spider):
+class CurseforgeSpider(RepositorySpider):
     """ Spider for the curseforge repository
     
     Generate :class:`ModItem` elements for mods in
@@ -33,6 +59,55 @@ class CurseforgeSpider(Spider):
     name = "curseforge"
     allowed_domains = ["minecraft.curseforge.com"]
     start_urls = ["http://minecraft.curseforge.com/mc-mods"]
+    sitemap_urls = ["http://minecraft.curseforge.com/sitemap.xml"]
+
+    mod_url_regex = r"^https?://[^/]+/mc-mods/\d+-[^/?#]+/?$"
+    """ Urls of the mod pages listed in the sitemaps """
+
+    def start_requests(self):
+        """
+        Start from the mod lists, or from the sitemaps when the
+        discovery is "sitemap"
+        """
+        if self.discovery == "sitemap":
+            return [Request(url=url, callback=self.parse_sitemap)
+                    for url in self.sitemap_urls]
+        if self.discovery != "pages":
+            raise ValueError("Unknown mod discovery {0}".format(self.discovery))
+        return super(CurseforgeSpider, self).start_requests()
+
+    def mod_request(self, mod_url):
+        """
+        Request the page of a mod, see :meth:`parse_mod_page`
+        """
+        return Request(url=mod_url, callback=self.parse_mod_page)
+
+    def parse_sitemap(self, response):
+        """
+        Extract the mod pages from a sitemap, or the sitemaps from a
+        sitemap index.
+
+        The entries are parsed one at a time, see
+        :func:`sitemap.iter_sitemap`, the response body is read in memory
+        by scrapy anyway. A mod page is skipped only if its last
+        modification is strictly older than the last update of the
+        archived mod, see :func:`archived_after`; the unchanged mods are
+        left as they are in the archive.
+        """
+        for kind, url, lastmod in iter_sitemap(BytesIO(response.body)):
+            url = urljoin(response.url, url)
+            if kind == "sitemap":
+                self.logger.info("Found sitemap {0}".format(url))
+                yield Request(url=url, callback=self.parse_sitemap)
+                continue
+            if not re.match(self.mod_url_regex, url):
+                continue
+            item = self.archived(url, texts=False)
+            if item is not None and lastmod is not None and archived_after(lastmod, item):
+                self.logger.debug("Unchanged Mod {0} @ {1}".format(item["name"], url))
+                continue
+            self.logger.info("Found mod URL {0}".format(url))
+            yield Request(url=url, callback=self.parse_mod_page)
 
     def parse(self, response):
         """
@@ -79,13 +154,58 @@ class CurseforgeSpider(Spider):
         
         For each page, the urls to the mod pages are parsed;
         the :meth:`parse_mod` method will be called to handle mod pages.
+        Mods listed under several categories are requested once, the
+        duplicates are dropped by :class:`dupefilters.BloomDupeFilter`.
+        In a shallow sync the mods are filled from the list entries, see
+        :meth:`parse_mod_list_entries`.
         """
+        if self.shallow:
+            for result in self.parse_mod_list_entries(response):
+                yield result
+            return
+
         mod_links = response.xpath("//ul[contains(@class, 'listing-project')]/li/div/a/@href")
         for url in mod_links.extract():
             full_url = urljoin(response.url, url)
             self.logger.info("Found mod URL {0}".format(full_url))
             yield Request(url=full_url, callback=self.parse_mod_page)
 
+    def parse_mod_list_entries(self, response):
+        """
+        Extract mods from the entries of a mod list page.
+
+        Each entry gives the name, summary, authors, categories, downloads
+        and last update of a mod. A mod already archived and not updated
+        since is returned from the archive with the fresh list data, the
+        page of a new or updated mod is requested; the list data is
+        passed to :meth:`parse_mod_page` in the ``listing`` meta key.
+        """
+        entries = response.xpath("//ul[contains(@class, 'listing-project')]/li")
+        for entry in entries:
+            url = entry.xpath(".//div[contains(@class,'name')]/a/@href").extract()
+            if not url:
+                continue
+            loader = ModItemLoader(item=ModItem(), selector=entry)
+            loader.add_xpath("name", ".//div[contains(@class,'name')]/a/text()")
+            loader.add_xpath("summary", ".//div[contains(@class,'description')]//text()")
+            loader.add_xpath("authors", ".//span[contains(@class,'byline')]/a/text()")
+            loader.add_xpath("categories", ".//div[contains(@class,'category-icons')]/a/@href")
+            loader.add_xpath("downloads", ".//div[contains(@class,'stats')]/span[1]/text()")
+            loader.add_xpath("updated", ".//div[contains(@class,'stats')]//abbr/text()")
+            listing = loader.load_item()
+            listing["mod_url"] = urljoin(response.url, url[0])
+
+            item = self.archived(listing["mod_url"])
+            if item is None or (listing.get("updated") or date.min) > (item.get("updated") or date.min):
+                self.logger.info("New or updated Mod {0}, request {1}".format(
+                    listing.get("name"), listing["mod_url"]))
+                yield Request(url=listing["mod_url"], callback=self.parse_mod_page,
+                              meta={"listing": listing})
+                continue
+            item.update(listing)
+            self.logger.info("Listed Mod {0} @ {1}".format(item["name"], item["mod_url"]))
+            yield item
+
     def parse_mod_page(self, response):
         """
         Extract mod informations from a response.
@@ -96,7 +216,21 @@ class CurseforgeSpider(Spider):
         A second request is generated to extract files for the mod,
         the files will be stored in a separate item that will be
         associated with the mod item in the item pipeline.
+
+        When the page was revalidated by the http cache, the mod is
+        unchanged since the last sync and the archived item is returned
+        without parsing the page again.
         """
+        listing = response.meta.get("listing")
+        if "cached" in response.flags:
+            item = self.archived(response.url)
+            if item is not None:
+                self.logger.info("Unchanged Mod {0} @ {1}".format(item["name"], response.url))
+                if listing is not None:
+                    item.update(listing)
+                yield item
+                return
+
         loader = ModItemLoader(item=ModItem(), response=response)
         loader.add_xpath("name", "//h1[@class='project-title']//span/text()")
         
@@ -114,6 +248,10 @@ class CurseforgeSpider(Spider):
                          "li[./div[@class='info-label' and text()='Last Released File']]/"\
                          "div[@class='info-data']//text()")
         
+        loader.add_xpath("updated_epoch", "//ul[contains(@class,'project-details')]/"\
+                         "li[./div[@class='info-label' and text()='Last Released File']]/"\
+                         "div[@class='info-data']//abbr/@data-epoch")
+
         loader.add_xpath("downloads", "//ul[contains(@class,'project-details')]/"\
                          "li[./div[@class='info-label' and text()='Total Downloads']]/"\
                          "div[@class='info-data']//text()")
@@ -135,6 +273,8 @@ class CurseforgeSpider(Spider):
         item = loader.load_item()
 
         item["mod_url"] = response.url
+        if listing is not None and listing.get("summary"):
+            item["summary"] = listing["summary"]
 
         self.logger.info("Created item Mod {0} @ {1}".format(item["name"], response.url))
 
@@ -172,5 +312,40 @@ class CurseforgeSpider(Spider):
              
     def parse_mod_files(self, response):
         """
+        Extract the files released for a mod from a files page.
+
+        A :class:`ModFileItem` is returned for each file. Files are listed
+        from the most recent, so the crawl of the following pages stops at
+        the first file already in the archive: an active mod costs one
+        files page per sync.
         """
-        pass
+        mod_url = response.meta["item"]["mod_url"]
+        known = self.archived_files(mod_url)
+        rows = response.xpath("//table[contains(@class, 'project-file-listing')]/"\
+                              "tbody/tr[contains(@class, 'project-file-list-item')]")
+        for row in rows:
+            loader = ModFileItemLoader(item=ModFileItem(), selector=row)
+            loader.add_xpath("file_id", ".//*[contains(@class,'project-file-name-container')]/a/@href")
+            loader.add_xpath("name", ".//*[contains(@class,'project-file-name-container')]/a/text()")
+            loader.add_xpath("release_type", ".//td[contains(@class,'project-file-release-type')]/div/@title")
+            loader.add_xpath("game_version", ".//*[contains(@class,'version-label')]/text()")
+            loader.add_xpath("size", ".//td[contains(@class,'project-file-size')]/text()")
+            loader.add_xpath("uploaded", ".//td[contains(@class,'project-file-date-uploaded')]//abbr/text()")
+            loader.add_xpath("downloads", ".//td[contains(@class,'project-file-downloads')]/text()")
+            loader.add_xpath("download_url", ".//*[contains(@class,'project-file-download-button')]/a/@href")
+            item = loader.load_item()
+            item["mod_url"] = mod_url
+            if "download_url" in item:
+                item["download_url"] = urljoin(response.url, item["download_url"])
+
+            if item.get("file_id") in known:
+                self.logger.info("Found known file {0} for Mod {1}, stop".format(item["name"], mod_url))
+                return
+            yield item
+
+        next_url = response.xpath("//ul[contains(@class, 'paging-list')]//a[@rel='next']/@href").extract()
+        if rows and next_url:
+            self.logger.info("Request mod files page {0} for Mod {1}".format(next_url[0], mod_url))
+            yield Request(url=urljoin(response.url, next_url[0]),
+                          callback=self.parse_mod_files,
+                          meta={"item":response.meta["item"]})
@@ -1,7 +1,17 @@
 # -*- coding: utf-8 -*-
 
+from __future__ import absolute_import
+
+import six
 import scrapy
 
+from six.moves.urllib.parse import urlsplit
+from scrapy.crawler import Crawler
+from scrapy.utils.misc import load_object
+
+from ..archive import ModArchive
+
+
 class RepositorySpider(scrapy.Spider):
     """ Base Spider class
     
@@ -9,14 +19,160 @@ class RepositorySpider(scrapy.Spider):
     and aggregation of mod description pages. An example could be curseforge.
     This spider does not actually download the mod data but just
     fills the :class:`ModItem`
+
+    Repository spiders are registered in the ``MPM_REPOSITORIES`` setting,
+    see :func:`load_repositories`.
     """
 
     # name = ""
     # allowed_domains = []
     # start_urls = []
 
+    archive = None
+    """ The local mod archive, see :meth:`archived` """
+
+    shallow = False
+    """ Shallow sync: fill the mods from the mod lists where the repository
+    supports it, and only fetch the pages of new or updated mods. Enabled
+    by the ``MPM_SYNC_SHALLOW`` setting or the ``shallow`` spider argument. """
+
+    discovery = "pages"
+    """ How mod pages are discovered, "pages" walks the mod lists and
+    "sitemap" reads the repository sitemaps where the repository supports
+    it. Set by the ``MPM_SYNC_DISCOVERY`` setting or the ``discovery``
+    spider argument. """
+
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super(RepositorySpider, cls).from_crawler(crawler, *args, **kwargs)
+        if isinstance(spider.shallow, six.string_types):
+            spider.shallow = spider.shallow.lower() in ("1", "true", "yes")
+        spider.shallow = spider.shallow or crawler.settings.getbool("MPM_SYNC_SHALLOW")
+        if "discovery" not in vars(spider):
+            spider.discovery = crawler.settings.get("MPM_SYNC_DISCOVERY", cls.discovery)
+        spider.archive = ModArchive.from_settings(crawler.settings)
+        spider._archive_loaded = False
+        return spider
+
+    @classmethod
+    def from_archive(cls, archive, *args, **kwargs):
+        """
+        Create the spider outside of a crawl, to run its callbacks on
+        pages fetched by :class:`fetch.DirectCrawl`
+        :param archive: the loaded mod archive
+        :type archive: :class:`archive.ModArchive`
+        """
+        spider = cls(*args, **kwargs)
+        spider.archive = archive
+        spider._archive_loaded = True
+        return spider
+
+    def _loaded_archive(self):
+        if self.archive is not None and not self._archive_loaded:
+            self.archive.load()
+            self._archive_loaded = True
+        return self.archive
+
+    def archived(self, mod_url, texts=True):
+        """
+        Get the mod extracted from a mod page in a previous sync.
+        The archive is loaded on first use.
+        :param mod_url: mod page url
+        :type mod_url: str
+        :param texts: whether to read the mod description and license
+        :type texts: bool
+        :return: the archived :class:`ModItem` or None
+        :rtype: :class:`ModItem`
+        """
+        archive = self._loaded_archive()
+        if archive is None:
+            return None
+        return archive.get(mod_url, texts)
+
+    def archived_files(self, mod_url):
+        """
+        Get the ids of the files of a mod found in previous syncs
+        :param mod_url: mod page url
+        :type mod_url: str
+        :rtype: set
+        """
+        archive = self._loaded_archive()
+        if archive is None:
+            return set()
+        return archive.file_ids(mod_url)
+
+    @classmethod
+    def serves(cls, url):
+        """
+        Whether a url belongs to the repository
+        :param url: page url
+        :type url: str
+        :rtype: bool
+        """
+        host = (urlsplit(url).hostname or "").lower()
+        return any(host == domain or host.endswith("." + domain)
+                   for domain in getattr(cls, "allowed_domains", None) or [])
+
+    def mod_request(self, mod_url):
+        """
+        Request extracting a single mod, used to refresh the mods of a
+        modpack without crawling the repository
+        :param mod_url: mod page url
+        :type mod_url: str
+        :return: the request, None if the repository can not refresh
+        single mods
+        :rtype: :class:`scrapy.http.Request`
+        """
+        return None
+
     def parse(self, response):
         """
         Extract mod informations from a response, if any
         """
         pass
+
+
+def load_repositories(settings):
+    """
+    Load the repository spiders registered in the settings.
+    ``MPM_REPOSITORIES`` maps each repository name to the import path
+    of its spider class, which must be a :class:`RepositorySpider`.
+    :param settings: mpm settings
+    :type settings: :class:`scrapy.settings.Settings`
+    :return: repository name to spider class
+    :rtype: dict
+    """
+    repositories = {}
+    for name, path in six.iteritems(settings.getdict("MPM_REPOSITORIES")):
+        spidercls = load_object(path)
+        if not issubclass(spidercls, RepositorySpider):
+            raise TypeError("Repository {0} spider {1} is not a "
+                            "RepositorySpider".format(name, path))
+        repositories[name] = spidercls
+    return repositories
+
+
+def repository_crawlers(settings, names=None):
+    """
+    Create a crawler for each repository to sync.
+    Every crawler gets its own downloader, so its own throttling budget;
+    the repository specific settings, such as ``DOWNLOAD_DELAY``, are
+    taken from ``MPM_REPOSITORY_SETTINGS``. All the crawlers write to the
+    same archive and can run concurrently in one reactor.
+    :param settings: mpm settings
+    :type settings: :class:`scrapy.settings.Settings`
+    :param names: names of the repositories to sync, all if not given
+    :type names: list
+    :return: list of :class:`scrapy.crawler.Crawler`
+    :rtype: list
+    """
+    repositories = load_repositories(settings)
+    overrides = settings.getdict("MPM_REPOSITORY_SETTINGS")
+    crawlers = []
+    for name in names or sorted(repositories):
+        if name not in repositories:
+            raise KeyError("Unknown repository {0}".format(name))
+        repo_settings = settings.copy()
+        repo_settings.setdict(overrides.get(name, {}), priority="spider")
+        crawlers.append(Crawler(repositories[name], repo_settings))
+    return crawlers
@@ -0,0 +1,227 @@
+"""
+Compressed text store.
+
+Mod descriptions and license texts make up most of the archive but are
+rarely read, so the archive keeps them out of the catalog. Each text is
+compressed and appended once to a pack file, keyed by the hash of its
+content: the many mods sharing the same license text share one copy.
+The catalog only holds the text hashes, and a text is decompressed when
+a mod is read from the archive.
+
+Texts are compressed with zlib, or with zstd and a dictionary trained on
+the first texts stored when the ``zstandard`` package is installed; the
+dictionary helps a lot with short texts that share most of their words.
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+import os
+import zlib
+import errno
+import hashlib
+import logging
+import threading
+
+import six
+
+from .locking import atomic_path
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+__all__ = ("TextStore",)
+
+logger = logging.getLogger(__name__)
+
+ZLIB = b"z"
+ZSTD = b"d"
+""" Codec tags, the first byte of each stored text """
+
+
+class TextStore(object):
+    """
+    Content addressed store of compressed texts.
+
+    The pack file is only ever appended to, under the archive lock, so the
+    offsets known by the readers of older catalogs stay valid. The offsets
+    of the stored texts, ``{hash: [offset, length]}``, are saved by the
+    archive in its catalog. The pack is opened once for reading and the
+    handle is kept, the texts appended later are read through it as well.
+    """
+
+    PACK = "texts.pack"
+    """ Pack file name """
+
+    DICT = "texts.dict"
+    """ Trained zstd dictionary file name """
+
+    DICT_SIZE = 64 * 1024
+    """ Size of the trained zstd dictionary """
+
+    DICT_SAMPLES = 500
+    """ Number of texts needed to train the zstd dictionary """
+
+    def __init__(self, path, compression="zlib"):
+        """
+        :param path: archive directory
+        :type path: str
+        :param compression: "zlib" or "zstd", zstd needs the zstandard
+        package and falls back to zlib without it
+        :type compression: str
+        """
+        if compression not in ("zlib", "zstd"):
+            raise ValueError("Unknown text compression {0}".format(compression))
+        if compression == "zstd" and zstandard is None:
+            logger.warning("zstandard is not installed, compressing texts with zlib")
+            compression = "zlib"
+        self.path = path
+        self.compression = compression
+        self.offsets = {}
+        """ Text hash to [offset, length] in the pack """
+
+        self._pending = {}
+        """ Texts stored since the last flush """
+
+        self._dict = None
+        self._dict_loaded = False
+        self._reader = None
+        self._reader_lock = threading.Lock()
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def load(self, offsets):
+        """
+        Set the texts available in the pack
+        :param offsets: text offsets, as saved in the catalog
+        :type offsets: dict
+        """
+        self.offsets = offsets
+        self._pending = {}
+
+    def __contains__(self, key):
+        return key in self._pending or key in self.offsets
+
+    def __len__(self):
+        return len(self.offsets) + len([key for key in self._pending
+                                        if key not in self.offsets])
+
+    def put(self, text):
+        """
+        Store a text, the text is written by :meth:`flush`
+        :param text: the text
+        :type text: str
+        :return: the text hash
+        :rtype: str
+        """
+        data = text.encode("utf-8")
+        key = hashlib.sha1(data).hexdigest()
+        if key not in self.offsets:
+            self._pending[key] = data
+        return key
+
+    def get(self, key):
+        """
+        Get a stored text
+        :param key: text hash
+        :type key: str
+        :return: the text
+        :rtype: str
+        :raise KeyError: if the text is not stored
+        """
+        data = self._pending.get(key)
+        if data is None:
+            offset, length = self.offsets[key]
+            with self._reader_lock:
+                if self._reader is None:
+                    self._reader = open(self._file(self.PACK), "rb")
+                self._reader.seek(offset)
+                blob = self._reader.read(length)
+            data = self._decompress(blob)
+        return data.decode("utf-8")
+
+    def close(self):
+        """
+        Close the pack read handle, it is opened again when needed
+        """
+        with self._reader_lock:
+            if self._reader is not None:
+                self._reader.close()
+                self._reader = None
+
+    @property
+    def dictionary(self):
+        """
+        The trained zstd dictionary, None if not trained yet
+        """
+        if not self._dict_loaded:
+            try:
+                with open(self._file(self.DICT), "rb") as fd:
+                    self._dict = zstandard.ZstdCompressionDict(fd.read())
+            except IOError as err:
+                if err.errno != errno.ENOENT:
+                    raise
+            self._dict_loaded = True
+        return self._dict
+
+    def _train(self):
+        samples = list(six.itervalues(self._pending))
+        if len(samples) < self.DICT_SAMPLES:
+            return None
+        self._dict = zstandard.train_dictionary(self.DICT_SIZE, samples)
+        with atomic_path(self._file(self.DICT)) as tmp_path:
+            with open(tmp_path, "wb") as fd:
+                fd.write(self._dict.as_bytes())
+        logger.info("Trained a text dictionary on %d texts", len(samples))
+        return self._dict
+
+    def _compress(self, data, dictionary):
+        if dictionary is not None:
+            compressor = zstandard.ZstdCompressor(level=19, dict_data=dictionary)
+            return ZSTD + compressor.compress(data)
+        return ZLIB + zlib.compress(data, 9)
+
+    def _decompress(self, blob):
+        codec, payload = blob[:1], blob[1:]
+        if codec == ZLIB:
+            return zlib.decompress(payload)
+        if codec == ZSTD:
+            if zstandard is None:
+                raise ImportError("zstandard is needed to read the texts of this archive")
+            decompressor = zstandard.ZstdDecompressor(dict_data=self.dictionary)
+            return decompressor.decompress(payload)
+        raise ValueError("Unknown text codec {0!r}".format(codec))
+
+    def flush(self, offsets):
+        """
+        Append the pending texts to the pack, to be called under the
+        archive lock. The pack is synced before the new offsets are
+        returned, so a catalog never refers to texts not on disk.
+        :param offsets: the text offsets of the current catalog on disk
+        :type offsets: dict
+        :return: the offsets of all the stored texts
+        :rtype: dict
+        """
+        self.offsets = dict(offsets)
+        pending = [(key, data) for key, data in six.iteritems(self._pending)
+                   if key not in self.offsets]
+        if pending:
+            dictionary = None
+            if self.compression == "zstd":
+                # another process may have trained the dictionary meanwhile
+                self._dict_loaded = False
+                dictionary = self.dictionary or self._train()
+            with open(self._file(self.PACK), "ab") as fd:
+                fd.seek(0, os.SEEK_END)
+                offset = fd.tell()
+                for key, data in pending:
+                    blob = self._compress(data, dictionary)
+                    fd.write(blob)
+                    self.offsets[key] = [offset, len(blob)]
+                    offset += len(blob)
+                fd.flush()
+                os.fsync(fd.fileno())
+        self._pending = {}
+        return self.offsets
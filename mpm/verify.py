@@ -0,0 +1,189 @@
+"""
+Integrity verification of installed modpacks.
+
+The files installed in a modpack are hashed and checked against the
+modpack index, detached gpg signatures are checked when present. Files
+are hashed in parallel and the hashes are cached by size and modification
+time, so only the files that changed since the last run are read.
+
+A signed modpack index covers the hashes of all the installed files with
+a single gpg check. gpg verifies one detached signature per run, so the
+per file signatures are checked by the worker pool, one gpg run each.
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+import os
+import mmap
+import json
+import errno
+import hashlib
+import logging
+import subprocess
+
+from multiprocessing.pool import ThreadPool
+
+from .locking import atomic_path
+
+__all__ = ("Verifier", "hash_file")
+
+logger = logging.getLogger(__name__)
+
+MMAP_THRESHOLD = 4 * 1024 * 1024
+""" Files larger than this are hashed through mmap """
+
+BUFFER_SIZE = 1024 * 1024
+
+
+def hash_file(path, algorithm="sha256"):
+    """
+    Hash a file, large files are mapped in memory instead of being read.
+    The hash functions release the GIL on large buffers so this can be
+    run in parallel from threads.
+    :param path: file path
+    :type path: str
+    :param algorithm: hashlib algorithm name
+    :type algorithm: str
+    :return: hex digest
+    :rtype: str
+    """
+    digest = hashlib.new(algorithm)
+    with open(path, "rb") as fd:
+        size = os.fstat(fd.fileno()).st_size
+        if size >= MMAP_THRESHOLD:
+            mapped = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                digest.update(mapped)
+            finally:
+                mapped.close()
+        else:
+            for chunk in iter(lambda: fd.read(BUFFER_SIZE), b""):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+def verify_signature(path, gpg="gpg"):
+    """
+    Check the detached signature ``<path>.sig`` of a file
+    :param path: signed file path
+    :type path: str
+    :param gpg: gpg executable
+    :type gpg: str
+    :return: True if the signature is good
+    :rtype: bool
+    """
+    with open(os.devnull, "wb") as devnull:
+        status = subprocess.call([gpg, "--batch", "--verify", path + ".sig", path],
+                                 stdout=devnull, stderr=devnull)
+    return status == 0
+
+
+class Verifier(object):
+    """
+    Verify the files installed in a modpack.
+
+    The computed hashes are stored in the modpack metadata directory with
+    the size and modification time of each file; a file whose size and
+    modification time did not change is not hashed again.
+    """
+
+    HASHES = "hashes.json"
+
+    def __init__(self, index, workers=4, gpg="gpg"):
+        """
+        :param index: the modpack index
+        :type index: :class:`modpack.ModpackIndex`
+        :param workers: number of files hashed in parallel
+        :type workers: int
+        :param gpg: gpg executable used to check signatures
+        :type gpg: str
+        """
+        self.index = index
+        self.workers = workers
+        self.gpg = gpg
+        self.hashes_path = index.meta_path(self.HASHES)
+        try:
+            with open(self.hashes_path, "rb") as fd:
+                self.hashes = json.loads(fd.read().decode("utf-8"))
+        except (IOError, ValueError):
+            self.hashes = {}
+
+    def _save(self):
+        with atomic_path(self.hashes_path) as tmp_path:
+            with open(tmp_path, "wb") as fd:
+                fd.write(json.dumps(self.hashes).encode("utf-8"))
+
+    def _check_file(self, task):
+        path, entry = task
+        try:
+            stat = os.stat(path)
+        except OSError as err:
+            if err.errno != errno.ENOENT:
+                raise
+            return path, None, "missing"
+        key = os.path.relpath(path, self.index.path)
+        cached = self.hashes.get(key)
+        state = (stat.st_size, stat.st_mtime)
+        if cached and (cached["size"], cached["mtime"]) == state:
+            digest = cached["sha256"]
+            cached = None
+        else:
+            digest = hash_file(path)
+            cached = {"size": state[0], "mtime": state[1], "sha256": digest}
+        if digest != entry["sha256"]:
+            return path, cached, "hash mismatch"
+        return path, cached, None
+
+    def _check_signature(self, path):
+        if not os.path.exists(path + ".sig") or verify_signature(path, self.gpg):
+            return path, None, None
+        return path, None, "bad signature"
+
+    def _run(self, function, tasks, fail_fast, chunksize=1):
+        failures = []
+        pool = ThreadPool(self.workers)
+        try:
+            for path, cached, error in pool.imap_unordered(function, tasks, chunksize):
+                if cached is not None:
+                    self.hashes[os.path.relpath(path, self.index.path)] = cached
+                if error:
+                    failures.append((path, error))
+                    if fail_fast:
+                        break
+        finally:
+            pool.terminate()
+            pool.join()
+        return failures
+
+    def verify(self, signatures=True, fail_fast=False, chunksize=16):
+        """
+        Verify the installed files
+        :param signatures: also check the detached signatures
+        :type signatures: bool
+        :param fail_fast: stop at the first failure
+        :type fail_fast: bool
+        :param chunksize: number of files handed to a worker at a time
+        to check their signatures
+        :type chunksize: int
+        :return: list of (file path, error message)
+        :rtype: list
+        """
+        failures = []
+        files = list(self.index.files())
+        if os.path.exists(self.index.index_path + ".sig"):
+            if not verify_signature(self.index.index_path, self.gpg):
+                failures.append((self.index.index_path, "bad signature"))
+                if fail_fast:
+                    return failures
+        failures.extend(self._run(self._check_file, files, fail_fast))
+        try:
+            self._save()
+        except IOError as err:
+            logger.warning("Can not save the hashes cache: %s", err)
+        if failures and fail_fast:
+            return failures
+        if signatures:
+            failures.extend(self._run(self._check_signature,
+                                      [path for path, _ in files],
+                                      fail_fast, chunksize))
+        return failures
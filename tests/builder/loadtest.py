@@ -0,0 +1,122 @@
+"""
+Offline crawl load test.
+
+Run a full :class:`CurseforgeSpider` crawl against a
+:class:`builder.synthetic.SyntheticSite` served on localhost and report
+the crawl throughput and peak memory. Run from the repository root with::
+
+    PYTHONPATH=tests python -m builder.loadtest --mods 5000 --latency 0.05
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import resource
+import tempfile
+
+from twisted.internet import reactor
+from twisted.web.server import Site
+from scrapy.crawler import Crawler, CrawlerProcess
+from scrapy.settings import Settings
+
+from mpm.spiders.curseforge import CurseforgeSpider
+
+from builder.synthetic import SyntheticSite
+
+
+def run_loadtest(site, settings=None):
+    """
+    Crawl a synthetic site, the reactor is started and stopped here so
+    this can only be called once per process.
+    :param site: the site to crawl
+    :type site: :class:`SyntheticSite`
+    :param settings: settings overriding the mpm ones
+    :type settings: dict
+    :return: crawl report
+    :rtype: dict
+    """
+    port = reactor.listenTCP(0, Site(site), interface="127.0.0.1")
+    base_url = "http://127.0.0.1:%d" % port.getHost().port
+    spidercls = type(str("LoadTestSpider"), (CurseforgeSpider,), {
+        "allowed_domains": ["127.0.0.1"],
+        "start_urls": [base_url + "/mc-mods"],
+    })
+
+    workdir = tempfile.mkdtemp(prefix="mpm-loadtest-")
+    crawl_settings = Settings()
+    crawl_settings.setmodule("mpm.settings", priority="project")
+    crawl_settings.setdict({
+        "MPM_ARCHIVE_DIR": workdir,
+        "MPM_MODPACK_REGISTRY": os.path.join(workdir, "modpacks.json"),
+        "HTTPCACHE_ENABLED": False,
+        "DOWNLOAD_DELAY": 0,
+        "LOG_LEVEL": "WARNING",
+    }, priority="cmdline")
+    crawl_settings.setdict(settings or {}, priority="cmdline")
+
+    process = CrawlerProcess(crawl_settings)
+    crawler = Crawler(spidercls, crawl_settings)
+    process.crawl(crawler)
+    start = time.time()
+    try:
+        process.start()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    elapsed = time.time() - start
+
+    stats = crawler.stats.get_stats()
+    requests = stats.get("downloader/request_count", 0)
+    items = stats.get("item_scraped_count", 0)
+    return {
+        "elapsed": elapsed,
+        "requests": requests,
+        "items": items,
+        "requests_per_sec": requests / elapsed,
+        "items_per_sec": items / elapsed,
+        "peak_memory_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "served": dict(site.served),
+        "dupefilter_filtered": stats.get("dupefilter/filtered", 0),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline curseforge crawl load test.")
+    parser.add_argument("--mods", type=int, default=1000, help="catalog size")
+    parser.add_argument("--per-page", type=int, default=20, help="mods per list page")
+    parser.add_argument("--latency", type=float, default=0.0, help="response latency (s)")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="fraction of requests answered with 500")
+    parser.add_argument("--burst-every", type=float, default=0.0,
+                        help="seconds between bursts of 429 responses")
+    parser.add_argument("--burst-length", type=float, default=0.0,
+                        help="seconds each burst of 429 responses lasts")
+    parser.add_argument("--delay", type=float, default=0.0, help="DOWNLOAD_DELAY")
+    parser.add_argument("--concurrency", type=int, default=16, help="CONCURRENT_REQUESTS")
+    parser.add_argument("--seed", type=int, default=0, help="random seed")
+    args = parser.parse_args(argv)
+    if args.mods <= args.per_page:
+        parser.error("the catalog must have more than one list page")
+
+    site = SyntheticSite(args.mods, args.per_page, args.latency, args.error_rate,
+                         args.burst_every, args.burst_length, args.seed)
+    report = run_loadtest(site, {
+        "DOWNLOAD_DELAY": args.delay,
+        "CONCURRENT_REQUESTS": args.concurrency,
+        "CONCURRENT_REQUESTS_PER_DOMAIN": args.concurrency,
+    })
+    print("elapsed        %.2f s" % report["elapsed"])
+    print("requests       %d (%.1f/s)" % (report["requests"], report["requests_per_sec"]))
+    print("items          %d (%.1f/s)" % (report["items"], report["items_per_sec"]))
+    print("peak memory    %d KiB" % report["peak_memory_kb"])
+    print("filtered dupes %d" % report["dupefilter_filtered"])
+    print("served         %s" % ", ".join("%s: %d" % entry
+                                          for entry in sorted(report["served"].items())))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,159 @@
+"""
+Synthetic curseforge site.
+
+Generate a curseforge-like site of arbitrary size from the html fixtures
+in ``tests/resources`` and serve it with twisted. The site can add latency
+to the responses, fail a fraction of the requests and answer 429 in
+bursts, so that crawls can be measured offline.
+"""
+
+from __future__ import absolute_import, division
+
+import os
+import re
+import random
+
+from twisted.internet import reactor
+from twisted.web.resource import Resource
+from twisted.web.server import NOT_DONE_YET
+
+RESOURCES = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                         os.pardir, "resources")
+
+TEMPLATE_URL = "/mc-mods/74072-tinkers-construct"
+TEMPLATE_NAME = "Tinkers Construct"
+
+EMPTY_PAGE = b"<html><body></body></html>"
+""" Body of error responses """
+
+
+def read_resource(name):
+    """ Read a fixture from the resources directory """
+    with open(os.path.join(RESOURCES, name), "rb") as fd:
+        return fd.read().decode("utf-8")
+
+
+class SyntheticSite(Resource):
+    """
+    Twisted resource serving a synthetic curseforge catalog.
+
+    The catalog is rooted at ``/mc-mods``, the mod list pages are
+    ``/mc-mods?page=N`` and each mod has a mod page and license and files
+    pages, as on curseforge.
+    """
+
+    isLeaf = True
+
+    def __init__(self, mods=1000, per_page=20, latency=0.0, error_rate=0.0,
+                 burst_every=0.0, burst_length=0.0, seed=0):
+        """
+        :param mods: number of mods in the catalog
+        :param per_page: number of mods in a mod list page
+        :param latency: seconds added to every response
+        :param error_rate: fraction of requests answered with a 500
+        :param burst_every: seconds between two bursts of 429 responses,
+        no bursts if 0
+        :param burst_length: seconds each burst of 429 responses lasts
+        :param seed: random seed for the generated catalog and errors
+        """
+        Resource.__init__(self)
+        self.mods = mods
+        self.per_page = per_page
+        self.latency = latency
+        self.error_rate = error_rate
+        self.burst_every = burst_every
+        self.burst_length = burst_length
+        self.random = random.Random(seed)
+        self.started = None
+        self.served = {}
+        """ Number of responses served by status code """
+
+        listing = read_resource("curseforge_mcmods_base.html")
+        items = re.findall(r'<li class="project-list-item">.*?</li>', listing, re.S)
+        self.list_head = listing[:listing.index(items[0])]
+        self.list_tail = listing[listing.index(items[-1]) + len(items[-1]):]
+        self.list_item = items[0]
+        self.mod_page = read_resource("curseforge_mod_base.html")
+        self.license_page = read_resource("curseforge_mod_license.html").encode("utf-8")
+        # a single files page per mod
+        self.files_page = re.sub(r'<ul class="b-pagination-list.*?</ul>', "",
+                                 read_resource("curseforge_mod_files.html"), flags=re.S)
+
+    @property
+    def pages(self):
+        return (self.mods + self.per_page - 1) // self.per_page
+
+    def mod_path(self, mod_id):
+        return "/mc-mods/%d-synthetic-mod-%d" % (mod_id, mod_id)
+
+    def mod_name(self, mod_id):
+        return "Synthetic Mod %d" % mod_id
+
+    def render_list_page(self, page):
+        first = (page - 1) * self.per_page
+        items = []
+        for mod_id in range(first, min(first + self.per_page, self.mods)):
+            item = self.list_item.replace(TEMPLATE_URL, self.mod_path(mod_id))
+            items.append(item.replace(TEMPLATE_NAME, self.mod_name(mod_id)))
+        paging = "".join('<li class="b-pagination-item"><a href="/mc-mods?page=%d">%d</a></li>'
+                         % (n, n) for n in sorted(set([2, 3, self.pages])) if 1 < n <= self.pages)
+        tail = re.sub(r'(<ul class="b-pagination-list[^>]*>).*?(</ul>)',
+                      lambda match: match.group(1) + paging + match.group(2),
+                      self.list_tail, flags=re.S)
+        return (self.list_head + "\n".join(items) + tail).encode("utf-8")
+
+    def render_mod_page(self, mod_id):
+        page = self.mod_page.replace(TEMPLATE_URL, self.mod_path(mod_id))
+        return page.replace(TEMPLATE_NAME, self.mod_name(mod_id)).encode("utf-8")
+
+    def render_files_page(self, mod_id):
+        return self.files_page.replace(TEMPLATE_URL, self.mod_path(mod_id)).encode("utf-8")
+
+    def render_path(self, path, args):
+        """
+        Render a page of the site
+        :param path: request path
+        :param args: request query arguments
+        :return: (status, body)
+        """
+        if path == b"/mc-mods":
+            page = int(args.get(b"page", [b"1"])[0])
+            if 1 <= page <= self.pages:
+                return 200, self.render_list_page(page)
+            return 404, EMPTY_PAGE
+        match = re.match(br"^/mc-mods/(\d+)-synthetic-mod-\d+(/license|/files)?$", path)
+        if not match or int(match.group(1)) >= self.mods:
+            return 404, EMPTY_PAGE
+        if match.group(2) == b"/license":
+            return 200, self.license_page
+        if match.group(2) == b"/files":
+            return 200, self.render_files_page(int(match.group(1)))
+        return 200, self.render_mod_page(int(match.group(1)))
+
+    def in_burst(self):
+        if not self.burst_every:
+            return False
+        if self.started is None:
+            self.started = reactor.seconds()
+        return (reactor.seconds() - self.started) % self.burst_every < self.burst_length
+
+    def render_GET(self, request):
+        if self.in_burst():
+            status, body = 429, EMPTY_PAGE
+        elif self.random.random() < self.error_rate:
+            status, body = 500, EMPTY_PAGE
+        else:
+            status, body = self.render_path(request.path, request.args)
+        self.served[status] = self.served.get(status, 0) + 1
+
+        def finish():
+            request.setResponseCode(status)
+            request.setHeader(b"content-type", b"text/html; charset=utf-8")
+            request.write(body)
+            request.finish()
+
+        if not self.latency:
+            finish()
+        else:
+            reactor.callLater(self.latency, finish)
+        return NOT_DONE_YET
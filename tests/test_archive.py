@@ -0,0 +1,187 @@
+"""
+Local mod archive tests.
+
+Tests for the archive and its indexes are marked as `archive`
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+import pytest
+
+from datetime import date
+
+from mpm.items import ModItem
+from mpm.archive import ModArchive
+from mpm.index import TrigramIndex, SearchIndex, mod_slug
+
+
+def make_mod(name, mod_url, **fields):
+    """ Build a :class:`ModItem` with the given name and url """
+    item = ModItem(name=name, mod_url=mod_url)
+    item.update(fields)
+    return item
+
+
+catalog = [make_mod("Tinkers Construct", "http://foo.org/mc-mods/74072-tinkers-construct"),
+           make_mod("CodeChickenCore", "http://foo.org/mc-mods/222213-codechickencore"),
+           make_mod("NotEnoughItems", "http://foo.org/mc-mods/222211-notenoughitems"),
+           make_mod("Thaumcraft", "http://foo.org/mc-mods/223628-thaumcraft")]
+
+
+@pytest.mark.archive
+def test_mod_slug():
+    """
+    Slugs are taken from the last component of the mod url
+    """
+    assert mod_slug("http://foo.org/mc-mods/74072-tinkers-construct") == "tinkers-construct"
+    assert mod_slug("http://foo.org/mc-mods/222211-notenoughitems/") == "notenoughitems"
+
+
+@pytest.mark.archive
+@pytest.mark.parametrize("query,expected", [
+    ("tinkers constuct", "http://foo.org/mc-mods/74072-tinkers-construct"),
+    ("notenough items", "http://foo.org/mc-mods/222211-notenoughitems"),
+    ("codechicken core", "http://foo.org/mc-mods/222213-codechickencore"),
+    ("thaumcraf", "http://foo.org/mc-mods/223628-thaumcraft"),
+])
+def test_trigram_lookup(query, expected):
+    """
+    :class:`TrigramIndex` ranks first the mod with the mistyped name
+    """
+    index = TrigramIndex.build(catalog)
+    candidates = index.lookup(query)
+    assert candidates[0][1] == expected
+
+
+@pytest.mark.archive
+def test_trigram_lookup_no_match():
+    """
+    Unrelated names give no candidates
+    """
+    index = TrigramIndex.build(catalog)
+    assert index.lookup("xyzzy") == []
+
+
+@pytest.mark.archive
+def test_archive_commit_and_find(tmpdir):
+    """
+    Committed mods are loaded back with their indexes
+    """
+    archive = ModArchive(str(tmpdir)).load()
+    archive.update(catalog + [make_mod("Mekanism", "http://foo.org/mc-mods/mekanism",
+                                       updated=date(2015, 5, 10),
+                                       categories=set(["technology"]))])
+    archive.commit()
+
+    archive = ModArchive(str(tmpdir)).load()
+    assert archive.generation == 1
+    assert len(archive) == 5
+    item = archive.get("http://foo.org/mc-mods/mekanism")
+    assert item["updated"] == date(2015, 5, 10)
+    assert item["categories"] == ["technology"]
+
+    score, item = archive.find("Thaumcraft")[0]
+    assert score == 1.0
+    assert item["name"] == "Thaumcraft"
+
+
+@pytest.mark.archive
+def test_search_top_k():
+    """
+    :class:`SearchIndex` ranks matches by relevance and popularity and
+    pages through them
+    """
+    records = [{"mod_url": "a", "name": "Magic Bees", "popularity": 4.0},
+               {"mod_url": "b", "name": "Ars Magica", "description": "magic mod",
+                "popularity": 6.0},
+               {"mod_url": "c", "name": "Thaumcraft", "categories": ["magic"],
+                "popularity": 6.5},
+               {"mod_url": "d", "name": "Botania", "description": "tech and magic",
+                "popularity": 1.0},
+               {"mod_url": "e", "name": "Mekanism", "popularity": 7.0}]
+    index = SearchIndex.build(records)
+    assert [url for _, url in index.search("magic", limit=10)] == ["c", "a", "b", "d"]
+    assert [url for _, url in index.search("magic", limit=2)] == ["c", "a"]
+    assert [url for _, url in index.search("magic", limit=2, offset=2)] == ["b", "d"]
+    assert [url for _, url in index.search("tech magic")] == ["d"]
+    assert index.search("magic nothing") == []
+
+
+@pytest.mark.archive
+def test_archive_texts(tmpdir, monkeypatch):
+    """
+    Descriptions and licenses are stored once compressed and read back
+    only with the mod
+    """
+    license = "Permission is hereby granted, free of charge, to any person " * 20
+    archive = ModArchive(str(tmpdir)).load()
+    archive.update([make_mod("Mod %d" % n, "http://foo.org/mc-mods/mod-%d" % n,
+                             description="A magic mod number %d" % n, mod_license=license)
+                    for n in range(10)])
+    archive.commit()
+
+    archive = ModArchive(str(tmpdir)).load()
+    assert len(archive.texts) == 11
+    assert tmpdir.join("texts.pack").size() < len(license)
+    assert "magic" not in tmpdir.join("catalog.json").read()
+    item = archive.get("http://foo.org/mc-mods/mod-3")
+    assert item["description"] == "A magic mod number 3"
+    assert item["mod_license"] == license
+    assert "description" not in archive.get("http://foo.org/mc-mods/mod-3", texts=False)
+    assert len(archive.search("magic number", limit=20)) == 10
+
+    # the unchanged mods are indexed from the previous generation, the
+    # texts of the others are read back from the pack after the flush
+    decompressed = []
+    decompress = archive.texts._decompress
+    monkeypatch.setattr(archive.texts, "_decompress",
+                        lambda blob: decompressed.append(blob) or decompress(blob))
+    archive.update([make_mod("Mod 3", "http://foo.org/mc-mods/mod-3",
+                             description="A wizard mod", mod_license=license)])
+    archive.commit()
+    assert len(decompressed) == 2  # the texts of mod 3 only
+    assert [item["name"] for _, item in archive.search("wizard")] == ["Mod 3"]
+    assert len(archive.search("magic number", limit=20)) == 9
+
+
+@pytest.mark.archive
+def test_archive_changes(tmpdir):
+    """
+    Each commit logs the mods it added, updated and removed, the changes
+    are read back from any generation
+    """
+    archive = ModArchive(str(tmpdir)).load()
+    archive.update(catalog)
+    archive.commit()
+    archive.update([make_mod("Thaumcraft", "http://foo.org/mc-mods/223628-thaumcraft",
+                             updated=date(2015, 6, 1), downloads=100),
+                    make_mod("Botania", "http://foo.org/mc-mods/botania")])
+    archive.remove(["http://foo.org/mc-mods/222211-notenoughitems"])
+    archive.commit()
+    archive.update([make_mod("Botania", "http://foo.org/mc-mods/botania", downloads=100)])
+    archive.commit()
+
+    archive = ModArchive(str(tmpdir)).load()
+    assert archive.generation == 3
+    assert len(archive.changes(0)) == 7
+    changes = archive.changes(1)
+    assert [(change["generation"], change["change"], change["mod_url"]) for change in changes] == [
+        (2, "removed", "http://foo.org/mc-mods/222211-notenoughitems"),
+        (2, "updated", "http://foo.org/mc-mods/223628-thaumcraft"),
+        (2, "added", "http://foo.org/mc-mods/botania")]
+    assert changes[1]["fields"] == ["updated"]
+    assert changes[1]["new_updated"] == "2015-06-01"
+    assert archive.changes(3) == []
+
+    botania = "http://foo.org/mc-mods/botania"
+    archive.update([make_mod("Botania", botania, description="Flowers", mod_license="MIT")])
+    archive.commit()
+    archive.update([make_mod("Botania", botania, description="Magic flowers",
+                             mod_license="MIT")])
+    archive.commit()
+    archive.update([make_mod("Botania", botania, description="Magic flowers",
+                             mod_license="MIT", downloads=200)])
+    archive.commit()
+    changes = archive.changes(3)
+    assert [change["fields"] for change in changes] == [["description", "mod_license"],
+                                                        ["description"]]
@@ -0,0 +1,96 @@
+"""
+Columnar export tests.
+
+The export needs numpy, tests for the columnar export are marked as
+`columnar`
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+import os
+import pytest
+
+from datetime import date
+
+from mpm.items import ModItem
+from mpm.archive import ModArchive
+from mpm.columnar import export_columns, load_columns
+
+numpy = pytest.importorskip("numpy")
+
+BASE = "http://foo.org/mc-mods/"
+
+
+@pytest.mark.columnar
+def test_export_columns(tmpdir):
+    """
+    The catalog is exported as columns mapped back in memory, list
+    fields are dictionary encoded
+    """
+    archive = ModArchive(str(tmpdir.join("archive")))
+    archive.update([
+        ModItem(name="Tinkers Construct", mod_url=BASE + "1-tinkers", downloads=1000,
+                created=date(2013, 1, 2), updated=date(2015, 10, 2),
+                categories=set(["armor-weapons-tools", "technology"]), authors=set(["mDiyo"])),
+        ModItem(name="Mantle", mod_url=BASE + "2-mantle", downloads=200,
+                categories=set(["library-api"]), authors=set(["mDiyo", "boni"])),
+        ModItem(name="JourneyMap", mod_url=BASE + "3-journeymap",
+                updated=date(2016, 1, 5), categories=set(["map-information"])),
+    ])
+    archive.commit()
+    path = str(tmpdir.join("columns"))
+    assert export_columns(archive, path) == 3
+
+    columns = load_columns(path)
+    assert columns.generation == 1
+    assert columns.mod_urls == [BASE + "1-tinkers", BASE + "2-mantle", BASE + "3-journeymap"]
+    assert isinstance(columns.downloads, numpy.memmap)
+    assert columns.downloads.tolist() == [1000, 200, -1]
+    assert columns.updated.tolist() == [date(2015, 10, 2).toordinal(), 0,
+                                        date(2016, 1, 5).toordinal()]
+    assert columns.mask("authors", "mDiyo").tolist() == [True, True, False]
+    assert not columns.mask("authors", "nobody").any()
+    assert columns.counts("authors") == {"boni": 1, "mDiyo": 2}
+    assert columns.counts("authors", numpy.maximum(columns.downloads, 0)) == \
+        {"boni": 200.0, "mDiyo": 1200.0}
+    assert load_columns(str(tmpdir.join("missing"))) is None
+
+
+@pytest.mark.columnar
+def test_export_columns_switch(tmpdir):
+    """
+    A new export does not touch the arrays of the loaded one, the
+    exports older than the previous one are removed
+    """
+    archive = ModArchive(str(tmpdir.join("archive")))
+    archive.update([ModItem(name="Mantle", mod_url=BASE + "2-mantle", downloads=200)])
+    archive.commit()
+    path = str(tmpdir.join("columns"))
+    export_columns(archive, path)
+    first = load_columns(path, mmap_mode=None)
+
+    archive.update([ModItem(name="Mantle", mod_url=BASE + "2-mantle", downloads=300)])
+    archive.commit()
+    export_columns(archive, path)
+    assert first.downloads.tolist() == [200]
+    assert load_columns(path).downloads.tolist() == [300]
+
+    export_columns(archive, path)
+    ids = set(name.split(".")[-2] for name in os.listdir(path) if name.endswith(".npy"))
+    assert len(ids) == 2 and first.export_id not in ids
+
+
+@pytest.mark.columnar
+def test_export_empty_columns(tmpdir):
+    """
+    An empty archive exports empty columns
+    """
+    archive = ModArchive(str(tmpdir.join("archive")))
+    path = str(tmpdir.join("columns"))
+    assert export_columns(archive, path) == 0
+    columns = load_columns(path)
+    assert len(columns) == 0
+    assert columns.downloads.tolist() == []
+    assert columns.counts("authors") == {}
+    assert columns.counts("categories", columns.downloads) == {}
+    assert columns.mask("authors", "mDiyo").tolist() == []
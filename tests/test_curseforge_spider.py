@@ -6,15 +6,20 @@ Tests for the curseforge crawling are marked as `crawl_curse`
 
 from __future__ import absolute_import
 
+import io
+import gzip
 import pytest
 import urlparse
 
-from datetime import date
+from datetime import date, datetime
 
-from mpm.items import ModItem
+from mpm.items import ModItem, ModFileItem
+from mpm.archive import ModArchive
+from mpm.sitemap import parse_lastmod
 from mpm.spiders.curseforge import CurseforgeSpider
 
-from helpers import mock_scrapy_response, assert_parse_requests, scrapy_response_from_file
+from helpers import mock_scrapy_response, assert_parse_requests, scrapy_response_from_file, \
+    build_scrapy_response
 
 
 expected_urls_index = ["/mc-mods/74072-tinkers-construct",
@@ -101,6 +106,7 @@ def test_curseforge_mod_page(response):
         "http://link_a Minefactory Reloaded end."
     assert item["created"] == date(2014, 2, 8)
     assert item["updated"] == date(2015, 5, 10)
+    assert item["updated_epoch"] == 1431259315
     assert item["downloads"] == 1000
     assert (sorted(item["categories"]) ==
             sorted(["armor", "weapons", "tools", "technology", "processing"]))
@@ -129,3 +135,120 @@ def test_curseforge_mod_license_and_finalization(response):
     
     item = list(parsed)[0]
     assert item["mod_license"] == "Creative Commons Full Text"
+
+
+@pytest.mark.crawl_curse
+@pytest.mark.parametrize("response", [
+    scrapy_response_from_file("http://foo.org/mc-mods/74072-tinkers-construct/files",
+                              "tests/resources/curseforge_mod_files.html"),
+])
+def test_curseforge_mod_files(response, tmpdir):
+    """
+    :class:`CurseforgeSpider` file items extraction from a sample
+    curseforge files page.
+    The next files page is requested only if no known file was found.
+    """
+    response.meta["item"] = ModItem(mod_url="http://foo.org/mc-mods/74072-tinkers-construct")
+    spider = CurseforgeSpider()
+    parsed = list(spider.parse_mod_files(response))
+    files = [el for el in parsed if isinstance(el, ModFileItem)]
+    assert_parse_requests(iter(parsed), [
+        "http://foo.org/mc-mods/74072-tinkers-construct/files?page=2"])
+    assert len(files) == 2
+    assert files[0]["file_id"] == "2242755"
+    assert files[0]["name"] == "TConstruct-1.7.10-1.8.5.jar"
+    assert files[0]["release_type"] == "release"
+    assert files[0]["game_version"] == ["1.7.10"]
+    assert files[0]["size"] == int(1.71 * 1024 ** 2)
+    assert files[0]["uploaded"] == date(2015, 5, 10)
+    assert files[0]["downloads"] == 123456
+    assert files[0]["download_url"] == \
+        "http://foo.org/mc-mods/74072-tinkers-construct/files/2242755/download"
+    assert files[1]["release_type"] == "beta"
+
+    # stop at the first file already archived
+    archive = ModArchive(str(tmpdir))
+    archive.update_files(files[1:])
+    spider.archive = archive
+    spider._archive_loaded = True
+    parsed = list(spider.parse_mod_files(response))
+    assert [el["file_id"] for el in parsed] == ["2242755"]
+
+
+@pytest.mark.crawl_curse
+@pytest.mark.parametrize("response", [
+    scrapy_response_from_file("http://foo.org", "tests/resources/curseforge_mcmods_base.html"),
+])
+def test_curseforge_shallow_list_page(response, tmpdir):
+    """
+    :class:`CurseforgeSpider` shallow sync fills archived mods from the
+    mod list entries and requests the pages of new or updated mods.
+    """
+    archive = ModArchive(str(tmpdir))
+    archive.update([ModItem(name="Tinkers Construct", description="Full description",
+                            mod_url="http://foo.org/mc-mods/74072-tinkers-construct",
+                            updated=date(2015, 5, 10), downloads=10),
+                    ModItem(name="CodeChickenCore", updated=date(2014, 1, 1),
+                            mod_url="http://foo.org/mc-mods/222213-codechickencore")])
+    archive.commit()
+    spider = CurseforgeSpider()
+    spider.shallow = True
+    spider.archive = archive
+    spider._archive_loaded = True
+    parsed = list(spider.parse_mod_list_page(response))
+
+    items = [el for el in parsed if isinstance(el, ModItem)]
+    assert len(items) == 1
+    item = items[0]
+    assert item["description"] == "Full description"
+    assert item["summary"] == "Modify all the things, then do it again!"
+    assert item["downloads"] == 3219651
+    assert item["authors"] == ["mDiyo"]
+    assert "technology" in item["categories"]
+
+    assert_parse_requests(iter(parsed), [
+        "http://foo.org/mc-mods/222213-codechickencore",
+        "http://foo.org/mc-mods/222211-notenoughitems"])
+    listing = [el for el in parsed if not isinstance(el, ModItem)][0].meta["listing"]
+    assert listing["name"] == "CodeChickenCore"
+
+
+@pytest.mark.crawl_curse
+def test_curseforge_sitemap(tmpdir):
+    """
+    :class:`CurseforgeSpider` sitemap discovery requests the mod pages
+    modified since the archived mods were updated, and the sitemaps of
+    a sitemap index. Times are compared when known, a page modified on
+    the day of the last update is requested.
+    """
+    assert parse_lastmod("2015-05-10T07:01:55-05:00") == datetime(2015, 5, 10, 12, 1, 55)
+    assert parse_lastmod("2015-05-10T07:01Z") == datetime(2015, 5, 10, 7, 1)
+    assert parse_lastmod("2015-05-10") == date(2015, 5, 10)
+    assert parse_lastmod("May 10") is None
+
+    archive = ModArchive(str(tmpdir))
+    # last released at 2015-05-10 12:01:55 UTC, after the sitemap lastmod
+    archive.update([ModItem(name="Tinkers Construct", updated=date(2015, 5, 10),
+                            updated_epoch=1431259315,
+                            mod_url="http://foo.org/mc-mods/74072-tinkers-construct"),
+                    ModItem(name="CodeChickenCore", updated=date(2015, 6, 1),
+                            mod_url="http://foo.org/mc-mods/222213-codechickencore")])
+    archive.commit()
+    spider = CurseforgeSpider()
+    spider.archive = archive
+    spider._archive_loaded = True
+    response = scrapy_response_from_file("http://foo.org/sitemap.xml",
+                                         "tests/resources/curseforge_sitemap.xml")
+    assert_parse_requests(spider.parse_sitemap(response), [
+        "http://foo.org/mc-mods/222213-codechickencore",
+        "http://foo.org/mc-mods/222211-notenoughitems"])
+
+    body = (b'<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+            b'<sitemap><loc>/sitemap-1.xml</loc></sitemap>'
+            b'<sitemap><loc>/sitemap-2.xml</loc></sitemap></sitemapindex>')
+    buf = io.BytesIO()
+    with gzip.GzipFile(fileobj=buf, mode="wb") as fd:
+        fd.write(body)
+    response = build_scrapy_response("http://foo.org/sitemap.xml.gz", buf.getvalue())
+    assert_parse_requests(spider.parse_sitemap(response), [
+        "http://foo.org/sitemap-1.xml", "http://foo.org/sitemap-2.xml"])
@@ -0,0 +1,109 @@
+"""
+Dependency graph tests.
+
+Tests for the mod dependencies are marked as `dependencies`
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+import pytest
+
+from mpm.items import ModItem
+from mpm.archive import ModArchive
+from mpm.install import Installer
+from mpm.modpack import ModpackIndex
+from mpm.dependencies import DependencyGraph, mod_requirements
+
+BASE = "http://foo.org/mc-mods/"
+
+
+@pytest.mark.dependencies
+def test_mod_requirements():
+    """
+    Mod ids are read from the mcmod.info entries, versions and the mod
+    loader are dropped
+    """
+    mods = [{"modid": "TConstruct", "requiredMods": ["Mantle@[0.3.2,)", "Forge"],
+             "dependencies": ["mantle", "NotEnoughItems"]},
+            {"modid": "TConstruct|Smeltery", "requiredMods": ["TConstruct"]}]
+    assert mod_requirements(mods) == (["tconstruct", "tconstruct|smeltery"],
+                                      ["mantle", "notenoughitems"])
+
+
+@pytest.mark.dependencies
+def test_dependency_graph():
+    """
+    Dependents are found by url and by mod id, transitively; orphans are
+    the dependencies nothing else needs
+    """
+    graph = DependencyGraph()
+    graph.add(BASE + "mantle", provides=["mantle"])
+    graph.add(BASE + "tconstruct", provides=["tconstruct"], requires=["mantle"])
+    graph.add(BASE + "iguana-tweaks", dependencies=[BASE + "tconstruct"])
+    graph.add(BASE + "codechicken-core", provides=["codechickencore"])
+    graph.add(BASE + "nei", requires=["codechickencore"])
+    graph.add(BASE + "chickenchunks", requires=["codechickencore"])
+
+    assert graph.dependents([BASE + "mantle"]) == set([BASE + "tconstruct",
+                                                       BASE + "iguana-tweaks"])
+    assert graph.orphans([BASE + "iguana-tweaks"]) == set([BASE + "tconstruct",
+                                                           BASE + "mantle"])
+    assert graph.orphans([BASE + "nei"]) == set()
+    assert graph.orphans([BASE + "nei", BASE + "chickenchunks"]) == \
+        set([BASE + "codechicken-core"])
+    assert graph.orphans([BASE + "iguana-tweaks"], keep=[BASE + "tconstruct"]) == set()
+
+    graph.remove(BASE + "tconstruct")
+    assert graph.dependents([BASE + "mantle"]) == set()
+    assert graph.dependents([BASE + "tconstruct"]) == set([BASE + "iguana-tweaks"])
+
+
+@pytest.mark.dependencies
+def test_modpack_and_archive_dependents(tmpdir):
+    """
+    The modpack index keeps its graph across saves, removing a mod
+    removes its file and updates the graph; the archive graph follows
+    its updates
+    """
+    modpack = tmpdir.mkdir("modpack")
+    index = ModpackIndex(str(modpack))
+    for name, entry in (("mantle", {"modids": ["mantle"], "explicit": False}),
+                        ("tconstruct", {"requires": ["mantle"]}),
+                        ("jei", {"requires": ["mantle"], "explicit": False})):
+        modpack.join("mods", name + ".jar").write_binary(b"jar", ensure=True)
+        entry["file"] = "mods/{0}.jar".format(name)
+        index.add(BASE + name, entry)
+    index.save()
+
+    index = ModpackIndex(str(modpack)).load()
+    assert index.dependents([BASE + "mantle"]) == set([BASE + "tconstruct", BASE + "jei"])
+    assert index.orphans([BASE + "tconstruct", BASE + "jei"]) == set([BASE + "mantle"])
+    # explicitly installed mods are kept
+    index.mods[BASE + "mantle"]["explicit"] = True
+    assert index.orphans([BASE + "tconstruct", BASE + "jei"]) == set()
+
+    other = ModpackIndex(str(modpack)).load()
+    other.add(BASE + "jei", {"file": "mods/jei.jar", "explicit": False})
+    other.save()
+    index.remove(BASE + "tconstruct")
+    index.save()
+    # the graph follows the mods changed by the other save
+    assert index.dependents([BASE + "mantle"]) == set()
+
+    Installer(str(modpack)).remove([BASE + "mantle"])
+    index = ModpackIndex(str(modpack)).load()
+    assert sorted(index) == [BASE + "jei"]
+    assert not modpack.join("mods", "mantle.jar").check()
+
+    archive = ModArchive(str(tmpdir.join("archive")))
+    archive.update([ModItem(name="Mantle", mod_url=BASE + "mantle"),
+                    ModItem(name="Tinkers", mod_url=BASE + "tconstruct",
+                            dependencies=[BASE + "mantle"])])
+    assert archive.dependents(BASE + "mantle") == set([BASE + "tconstruct"])
+    archive.update([ModItem(name="Tinkers", mod_url=BASE + "tconstruct")])
+    assert archive.dependents(BASE + "mantle") == set()
+    archive.update([ModItem(name="Tinkers", mod_url=BASE + "tconstruct",
+                            dependencies=[BASE + "mantle"])])
+    archive.commit()
+    assert ModArchive(str(tmpdir.join("archive"))).load().dependents(BASE + "mantle") == \
+        set([BASE + "tconstruct"])
@@ -0,0 +1,73 @@
+"""
+Duplicate request filter tests.
+
+Tests for the dupefilters are marked as `dupefilter`
+"""
+
+from __future__ import absolute_import
+
+import os
+import pytest
+
+from scrapy.http import Request
+
+from mpm.dupefilters import ScalableBloomFilter, BloomDupeFilter
+
+
+@pytest.mark.dupefilter
+def test_scalable_bloom_filter_grows(tmpdir):
+    """
+    :class:`ScalableBloomFilter` stacks filters when full and survives
+    a save and load round trip
+    """
+    bloom = ScalableBloomFilter(capacity=100, error_rate=0.01)
+    digests = ["%040x" % (i * 2654435761) for i in range(1000)]
+    for digest in digests:
+        bloom.add(digest)
+    assert len(bloom.filters) > 1
+    assert all(digest in bloom for digest in digests)
+
+    path = str(tmpdir.join("bloom"))
+    bloom.save(path)
+    loaded = ScalableBloomFilter.load(path)
+    assert all(digest in loaded for digest in digests)
+    assert len(loaded) == 1000
+
+
+@pytest.mark.dupefilter
+def test_bloom_dupefilter_resume(tmpdir):
+    """
+    :class:`BloomDupeFilter` drops duplicates, keeps them across a
+    paused crawl and forgets them when the crawl finishes
+    """
+    requests = [Request("http://foo.org/mc-mods/%d-mod" % i) for i in range(50)]
+    dupefilter = BloomDupeFilter(str(tmpdir), capacity=10)
+    assert not any(dupefilter.request_seen(request) for request in requests)
+    assert all(dupefilter.request_seen(request) for request in requests)
+    dupefilter.close("shutdown")
+
+    dupefilter = BloomDupeFilter(str(tmpdir), capacity=10)
+    assert all(dupefilter.request_seen(request) for request in requests)
+    dupefilter.close("finished")
+    assert os.listdir(str(tmpdir)) == []
+
+
+@pytest.mark.dupefilter
+def test_bloom_dupefilter_crash(tmpdir):
+    """
+    The fingerprints committed after the bloom filter was saved are
+    still seen when the crawl resumes from a crash
+    """
+    requests = [Request("http://foo.org/mc-mods/%d-mod" % i) for i in range(40)]
+    dupefilter = BloomDupeFilter(str(tmpdir), capacity=10)
+    assert not any(dupefilter.request_seen(request) for request in requests[:20])
+    dupefilter.close("shutdown")
+
+    dupefilter = BloomDupeFilter(str(tmpdir), capacity=10)
+    dupefilter.COMMIT_INTERVAL = 10
+    assert not any(dupefilter.request_seen(request) for request in requests[20:])
+    # killed, not closed
+
+    dupefilter = BloomDupeFilter(str(tmpdir), capacity=10)
+    assert all(dupefilter.request_seen(request) for request in requests)
+    dupefilter.close("finished")
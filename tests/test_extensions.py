@@ -0,0 +1,63 @@
+"""
+Crawl extension tests.
+
+Tests for the extensions are marked as `extensions`
+"""
+
+from __future__ import absolute_import
+
+import pytest
+
+from scrapy.http import Request, HtmlResponse
+from scrapy.spiders import Spider
+from scrapy.exceptions import NotConfigured
+from scrapy.utils.test import get_crawler
+
+from mpm.items import ModItem
+from mpm.extensions import MemoryAccounting
+
+
+class MemorySpider(Spider):
+    name = "memory"
+
+    def parse_mod_page(self, response):
+        pass
+
+
+@pytest.mark.extensions
+def test_memory_accounting_snapshot():
+    """
+    :class:`MemoryAccounting` counts the live objects by crawl stage,
+    attributes their memory to the spider callbacks and records them in
+    the stats
+    """
+    with pytest.raises(NotConfigured):
+        MemoryAccounting.from_crawler(get_crawler(MemorySpider))
+
+    crawler = get_crawler(MemorySpider, {"MPM_MEMACCT_ENABLED": True})
+    spider = crawler._create_spider("memory")
+    crawler.stats.open_spider(spider)
+    ext = MemoryAccounting.from_crawler(crawler)
+    ext.spider = spider
+
+    item = ModItem(name="Test")
+    requests = [Request("http://example.com/{0}".format(n),
+                        callback=spider.parse_mod_page, meta={"item": item})
+                for n in range(3)]
+    requests.append(Request("http://example.com/list"))
+    response = HtmlResponse("http://example.com/list", body=b"x" * 1000,
+                            request=Request("http://example.com/list",
+                                            callback=spider.parse_mod_page))
+
+    values = ext.snapshot()
+    stats = crawler.stats.get_stats(spider)
+    assert values["memory/live/ModItem"] >= 1
+    assert values["memory/requests/parse_mod_page"] >= 3
+    assert values["memory/requests/with_item"] >= 3
+    assert values["memory/responses/body_bytes"] >= len(response.body)
+    assert values["memory/callbacks/parse_mod_page_bytes"] >= len(response.body) + \
+        3 * len(requests[0].url)
+    assert values["memory/callbacks/parse_bytes"] > 0
+    assert stats["memory/rss"] > 0
+    assert stats["memory/requests/parse_mod_page"] == values["memory/requests/parse_mod_page"]
+    assert "memory/budget_exceeded" not in stats
@@ -0,0 +1,140 @@
+"""
+Direct fetching tests.
+
+The synthetic site is served by a plain http server, tests for the
+direct fetching are marked as `fetch`
+"""
+
+from __future__ import absolute_import
+
+import threading
+import pytest
+
+from six.moves import BaseHTTPServer, socketserver
+from six.moves.urllib.parse import urlsplit, parse_qs
+
+from scrapy.http import Request
+from scrapy.settings import Settings
+
+from mpm.archive import ModArchive
+from mpm.fetch import ConnectionPool, DirectCrawl, refresh_mods
+from mpm.spiders.modinfo import RepositorySpider
+from mpm.spiders.curseforge import CurseforgeSpider
+
+from builder.synthetic import SyntheticSite
+
+
+class SyntheticSpider(CurseforgeSpider):
+    """ Curseforge spider serving the synthetic site """
+    name = "synthetic"
+    allowed_domains = ["127.0.0.1"]
+
+
+class ListOnlySpider(RepositorySpider):
+    """ Repository that can not refresh single mods """
+    name = "list-only"
+    allowed_domains = ["example.org"]
+
+
+class SiteServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+def serve(site):
+    """ Serve a synthetic site with keep-alive connections """
+    clients = set()
+
+    class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            clients.add(self.client_address)
+            parts = urlsplit(self.path)
+            args = dict((key.encode("ascii"), [value.encode("ascii") for value in values])
+                        for key, values in parse_qs(parts.query).items())
+            status, body = site.render_path(parts.path.encode("ascii"), args)
+            self.send_response(status)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = SiteServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server, clients
+
+
+@pytest.mark.fetch
+def test_direct_crawl_synthetic_site(tmpdir):
+    """
+    :class:`DirectCrawl` runs the spider callbacks on the mod, files and
+    license pages, reusing the connections of the pool; failing pages and
+    callbacks are reported
+    """
+    server, clients = serve(SyntheticSite(mods=10))
+    base = "http://127.0.0.1:%d" % server.server_address[1]
+    try:
+        archive = ModArchive(str(tmpdir.join("archive"))).load()
+        spider = CurseforgeSpider.from_archive(archive)
+        pool = ConnectionPool(timeout=10)
+        urls = [base + "/mc-mods/%d-synthetic-mod-%d" % (n, n) for n in range(3)]
+        urls.append(base + "/mc-mods/99-synthetic-mod-99")
+        broken = base + "/mc-mods/5-synthetic-mod-5"
+
+        def broken_callback(response):
+            yield {"mod_url": response.url}
+            raise ValueError("broken page")
+
+        requests = [spider.mod_request(url) for url in urls]
+        requests.append(Request(broken, callback=broken_callback))
+        items, errors = DirectCrawl(spider, pool, workers=2).crawl(requests)
+        pool.close()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert sorted(url for url, _ in errors) == [broken, base + "/mc-mods/99-synthetic-mod-99"]
+    assert {"mod_url": broken} in items
+    mods = dict((item["mod_url"], item) for item in items if "mod_license" in item)
+    assert sorted(mods) == urls[:3]
+    assert mods[urls[0]]["name"] == "Synthetic Mod 0"
+    assert any(item.get("file_id") for item in items)
+    # 4 mod pages, 3 files pages, 3 licenses and a 404 over at most 2 connections
+    assert len(clients) <= 2
+
+
+@pytest.mark.fetch
+def test_refresh_mods(tmpdir):
+    """
+    :func:`refresh_mods` commits the refreshed mods in the archive, urls
+    of unknown repositories and of repositories that can not refresh
+    single mods are reported
+    """
+    server, _ = serve(SyntheticSite(mods=10))
+    base = "http://127.0.0.1:%d" % server.server_address[1]
+    settings = Settings()
+    settings.setmodule("mpm.settings")
+    settings.set("MPM_REPOSITORIES", {"synthetic": "test_fetch.SyntheticSpider",
+                                      "list-only": "test_fetch.ListOnlySpider"})
+    try:
+        archive = ModArchive(str(tmpdir.join("archive"))).load()
+        mod_url = base + "/mc-mods/4-synthetic-mod-4"
+        errors = refresh_mods(settings, archive, [mod_url, "http://example.com/mod",
+                                                  "http://example.org/mod"])
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert sorted(url for url, _ in errors) == ["http://example.com/mod",
+                                                "http://example.org/mod"]
+    archive = ModArchive(str(tmpdir.join("archive"))).load()
+    assert archive.get(mod_url)["name"] == "Synthetic Mod 4"
+    assert archive.files(mod_url)
+
+    generation = archive.generation
+    assert refresh_mods(settings, archive, ["http://example.com/mod"])
+    assert ModArchive(str(tmpdir.join("archive"))).load().generation == generation
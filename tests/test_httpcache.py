@@ -0,0 +1,66 @@
+"""
+HTTP cache tests.
+
+Tests for the http cache and the cached page handling are marked as `httpcache`
+"""
+
+from __future__ import absolute_import
+
+import pytest
+
+from scrapy.http import Request, HtmlResponse
+from scrapy.settings import Settings
+
+from mpm.items import ModItem
+from mpm.archive import ModArchive
+from mpm.httpcache import RevalidatePolicy
+from mpm.spiders.curseforge import CurseforgeSpider
+
+from helpers import scrapy_response_from_file
+
+
+@pytest.mark.httpcache
+def test_revalidate_policy():
+    """
+    :class:`RevalidatePolicy` stores only responses with validators
+    and always sends a conditional request
+    """
+    policy = RevalidatePolicy(Settings())
+    request = Request("http://foo.org/mc-mods/74072-tinkers-construct")
+    plain = HtmlResponse(request.url, body=b"<html></html>")
+    cached = HtmlResponse(request.url, body=b"<html></html>",
+                          headers={"ETag": '"abc"',
+                                   "Last-Modified": "Sun, 10 May 2015 07:01:55 GMT",
+                                   "Cache-Control": "max-age=3600"})
+    assert not policy.should_cache_response(plain, request)
+    assert policy.should_cache_response(cached, request)
+    assert not policy.is_cached_response_fresh(cached, request)
+    assert request.headers["If-None-Match"] == b'"abc"'
+    assert request.headers["If-Modified-Since"] == b"Sun, 10 May 2015 07:01:55 GMT"
+
+
+@pytest.mark.httpcache
+def test_cached_mod_page_not_parsed(tmpdir):
+    """
+    :class:`CurseforgeSpider` returns the archived item for a mod page
+    that did not change since the last sync
+    """
+    response = scrapy_response_from_file("http://foo.org",
+                                         "tests/resources/curseforge_mod_base.html")
+    response.flags.append("cached")
+    archive = ModArchive(str(tmpdir))
+    archive.update([ModItem(name="Tinkers Construct", mod_url="http://foo.org",
+                            mod_license="MIT")])
+    archive.commit()
+
+    spider = CurseforgeSpider()
+    spider.archive = archive
+    spider._archive_loaded = False
+    parsed = list(spider.parse_mod_page(response))
+    assert len(parsed) == 1
+    assert parsed[0]["mod_license"] == "MIT"
+
+    spider.archive = ModArchive(str(tmpdir.join("empty")))
+    spider._archive_loaded = False
+    parsed = list(spider.parse_mod_page(response))
+    assert all(isinstance(request, Request) for request in parsed)
@@ -0,0 +1,105 @@
+"""
+Mod installation tests.
+
+Tests for the installation and the lockfile are marked as `install`
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+import hashlib
+import pytest
+
+from datetime import date
+
+from mpm.items import ModItem, ModFileItem
+from mpm.archive import ModArchive
+from mpm.install import Installer
+from mpm.lockfile import Lockfile
+from mpm.resolver import UrlResolver
+
+MOD_URL = "http://foo.org/mc-mods/74072-tinkers-construct"
+
+
+class NoResolver(object):
+    """ Fail if anything is resolved """
+
+    def resolve_all(self, urls):
+        raise AssertionError("locked installs do not resolve urls")
+
+
+class FailingResolver(object):
+    """ Fail to resolve every url """
+
+    def resolve_all(self, urls):
+        return {}, [(url, IOError("offline")) for url in urls]
+
+
+def make_archive(tmpdir, files):
+    """ Archive with a mod whose files are served from the local disk """
+    archive = ModArchive(str(tmpdir.join("archive")))
+    archive.update([ModItem(name="Tinkers Construct", mod_url=MOD_URL,
+                            updated=date(2015, 10, 2))])
+    repo = tmpdir.mkdir("repo")
+    items = []
+    for file_id, (name, release_type, data) in files.items():
+        repo.join(name).write_binary(data)
+        items.append(ModFileItem(mod_url=MOD_URL, file_id=file_id, name=name,
+                                 release_type=release_type, uploaded=date(2015, 10, int(file_id)),
+                                 download_url="file://" + str(repo.join(name))))
+    archive.update_files(items)
+    archive.commit()
+    return archive, repo
+
+
+@pytest.mark.install
+def test_install_and_locked_install(tmpdir):
+    """
+    Installing locks the latest release, a locked install downloads and
+    verifies the pinned files without resolving anything
+    """
+    data = b"tconstruct" * 1000
+    archive, repo = make_archive(tmpdir, {
+        "1": ("TConstruct-1.8.7.jar", "release", data),
+        "2": ("TConstruct-1.8.8-beta.jar", "beta", b"beta"),
+    })
+    modpack = tmpdir.mkdir("modpack")
+    installer = Installer(str(modpack), UrlResolver())
+    assert installer.install(archive, [MOD_URL], explicit=False) == []
+
+    entry = Lockfile(str(modpack)).load().get(MOD_URL)
+    assert entry["explicit"] is False
+    assert entry["file_id"] == "1"
+    assert entry["file"] == "mods/TConstruct-1.8.7.jar"
+    assert entry["sha256"] == hashlib.sha256(data).hexdigest()
+    assert entry["updated"] == "2015-10-02"
+    assert modpack.join("mods", "TConstruct-1.8.7.jar").read_binary() == data
+
+    modpack.join("mods").remove()
+    modpack.join(".mpm").remove()
+    assert Installer(str(modpack), NoResolver()).install_locked() == []
+    assert modpack.join("mods", "TConstruct-1.8.7.jar").read_binary() == data
+    assert Installer(str(modpack)).index.get(MOD_URL)["sha256"] == entry["sha256"]
+    assert not Installer(str(modpack)).index.explicit(MOD_URL)
+
+    modpack.join("mods").remove()
+    repo.join("TConstruct-1.8.7.jar").write_binary(b"tampered")
+    errors = Installer(str(modpack), NoResolver()).install_locked()
+    assert [mod_url for mod_url, _ in errors] == [MOD_URL]
+    assert not modpack.join("mods", "TConstruct-1.8.7.jar").check()
+
+
+@pytest.mark.install
+def test_install_errors(tmpdir):
+    """
+    Mods with no known file or with an unresolvable download url are
+    reported, the other mods are installed
+    """
+    archive, repo = make_archive(tmpdir, {"1": ("TConstruct-1.8.7.jar", "release", b"jar")})
+    missing = "http://foo.org/mc-mods/1234-not-synced"
+    modpack = tmpdir.mkdir("modpack")
+    errors = Installer(str(modpack), UrlResolver()).install(archive, [missing, MOD_URL])
+    assert [(mod_url, type(error)) for mod_url, error in errors] == [(missing, LookupError)]
+    assert modpack.join("mods", "TConstruct-1.8.7.jar").check()
+
+    errors = Installer(str(tmpdir.mkdir("other")), FailingResolver()).install(archive, [MOD_URL])
+    assert [(mod_url, type(error)) for mod_url, error in errors] == [(MOD_URL, IOError)]
@@ -0,0 +1,82 @@
+"""
+Concurrent access tests.
+
+Tests for the concurrent access to the archive and the modpacks are
+marked as `locking`
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+import os
+import pytest
+
+from mpm.items import ModItem
+from mpm.archive import ModArchive
+from mpm.modpack import ModpackIndex
+from mpm.locking import atomic_path
+
+
+@pytest.mark.locking
+def test_atomic_path_failure(tmpdir):
+    """
+    A failed write leaves the previous file and no temporary file
+    """
+    path = str(tmpdir.join("state.json"))
+    tmpdir.join("state.json").write("old")
+    with pytest.raises(RuntimeError):
+        with atomic_path(path) as tmp_path:
+            with open(tmp_path, "w") as fd:
+                fd.write("partial")
+            raise RuntimeError("crash")
+    assert os.listdir(str(tmpdir)) == ["state.json"]
+    assert tmpdir.join("state.json").read() == "old"
+
+
+@pytest.mark.locking
+def test_archive_concurrent_commits(tmpdir):
+    """
+    Two writers loading the same generation both keep their changes,
+    readers of the old generation still see a consistent archive
+    """
+    path = str(tmpdir)
+    reader = ModArchive(path).load()
+    first = ModArchive(path).load()
+    second = ModArchive(path).load()
+    first.update([ModItem(name="Thaumcraft", mod_url="http://foo.org/mc-mods/thaumcraft")])
+    second.update([ModItem(name="Botania", mod_url="http://foo.org/mc-mods/botania")])
+    first.commit()
+    second.commit()
+    assert second.generation == 2
+    archive = ModArchive(path).load()
+    assert sorted(item["name"] for item in archive) == ["Botania", "Thaumcraft"]
+    assert archive.find("botania")[0][1]["name"] == "Botania"
+    assert len(reader) == 0 and reader.find("botania") == []
+
+    for generation in range(3, 6):
+        archive.update([ModItem(name="Botania", mod_url="http://foo.org/mc-mods/botania",
+                                downloads=generation)])
+        assert archive.commit()
+    names = sorted(name for name in os.listdir(path) if name.startswith("names."))
+    assert names == ["names.4.idx", "names.5.idx"]
+    # nothing changed, no new generation
+    assert not archive.commit()
+    assert ModArchive(path).load().generation == 5
+
+
+@pytest.mark.locking
+def test_modpack_concurrent_saves(tmpdir):
+    """
+    Concurrent installs and removals in a modpack are all kept
+    """
+    index = ModpackIndex(str(tmpdir))
+    index.add("http://foo.org/mc-mods/a", {"file": "mods/a.jar"})
+    index.add("http://foo.org/mc-mods/b", {"file": "mods/b.jar"})
+    index.save()
+    first = ModpackIndex(str(tmpdir)).load()
+    second = ModpackIndex(str(tmpdir)).load()
+    first.add("http://foo.org/mc-mods/c", {"file": "mods/c.jar"})
+    second.remove("http://foo.org/mc-mods/a")
+    first.save()
+    second.save()
+    assert sorted(ModpackIndex(str(tmpdir)).load()) == ["http://foo.org/mc-mods/b",
+                                                        "http://foo.org/mc-mods/c"]
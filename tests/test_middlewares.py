@@ -0,0 +1,73 @@
+"""
+Spider middleware tests.
+
+Tests for the spider middlewares are marked as `middlewares`
+"""
+
+from __future__ import absolute_import
+
+import pytest
+
+from scrapy.http import Request, HtmlResponse
+from scrapy.utils.test import get_crawler
+
+from mpm.items import ModItem
+from mpm.modpack import ModpackIndex, ModpackRegistry
+from mpm.middlewares import ModpackPriorityMiddleware
+from mpm.spiders.curseforge import CurseforgeSpider
+
+INSTALLED = "http://minecraft.curseforge.com/mc-mods/74072-tinkers-construct"
+OTHER = "http://minecraft.curseforge.com/mc-mods/222880-journeymap"
+
+
+@pytest.mark.middlewares
+def test_modpack_priority(tmpdir):
+    """
+    The mods of the registered modpacks are requested first and their
+    pages are boosted, the other mod pages are lowered; unreadable
+    modpacks are skipped, mods are matched whatever the spelling of their
+    url and through redirects
+    """
+    modpack = tmpdir.mkdir("modpack")
+    index = ModpackIndex(str(modpack))
+    index.add(INSTALLED, {"file": "mods/TConstruct.jar"})
+    index.add("http://example.com/mods/other-repository", {"file": "mods/Other.jar"})
+    index.save()
+    registry = str(tmpdir.join("modpacks.json"))
+    ModpackRegistry(registry).register(str(modpack))
+    ModpackRegistry(registry).register(str(modpack))
+    assert ModpackRegistry(registry).modpacks() == [str(modpack)]
+
+    corrupted = tmpdir.mkdir("corrupted")
+    corrupted.join(ModpackIndex.DIR, ModpackIndex.INDEX).write_binary(b"{", ensure=True)
+    ModpackRegistry(registry).register(str(corrupted))
+
+    crawler = get_crawler(CurseforgeSpider, {"MPM_MODPACK_REGISTRY": registry,
+                                             "MPM_PRIORITY_BOOST": 50})
+    spider = CurseforgeSpider()
+    middleware = ModpackPriorityMiddleware.from_crawler(crawler)
+
+    start = list(middleware.process_start_requests(spider.start_requests(), spider))
+    assert [(request.url, request.priority) for request in start] == [
+        (INSTALLED, 50), ("http://minecraft.curseforge.com/mc-mods", 0)]
+
+    item = ModItem(mod_url=INSTALLED)
+    output = [Request(OTHER, callback=spider.parse_mod_page),
+              Request(INSTALLED + "/files", callback=spider.parse_mod_files, meta={"item": item}),
+              Request("http://minecraft.curseforge.com/mc-mods?page=2",
+                      callback=spider.parse_mod_list_page),
+              item]
+    result = list(middleware.process_spider_output(None, output, spider))
+    assert [element.priority for element in result[:3]] == [-1, 50, 0]
+    assert result[3] is item
+
+    # other spellings of the url and redirects keep the boost
+    moved = "http://minecraft.curseforge.com/projects/tconstruct"
+    response = HtmlResponse(moved, body=b"", request=Request(
+        moved, meta={"redirect_urls": [INSTALLED]}))
+    output = [Request(INSTALLED.replace("http:", "https:") + "/",
+                      callback=spider.parse_mod_page),
+              Request(moved + "/files", callback=spider.parse_mod_files,
+                      meta={"item": ModItem(mod_url=moved)})]
+    result = list(middleware.process_spider_output(response, output, spider))
+    assert [element.priority for element in result] == [50, 50]
@@ -0,0 +1,52 @@
+"""
+Item pipelines tests.
+
+Tests for the item pipelines are marked as `pipeline`
+"""
+
+from __future__ import absolute_import
+
+import gzip
+import zlib
+import json
+import pytest
+
+from datetime import date
+
+from mpm.items import ModItem
+from mpm.pipelines import NdjsonExportPipeline
+
+
+class FakeSpider(object):
+    name = "curseforge"
+
+
+@pytest.mark.pipeline
+@pytest.mark.parametrize("filename,opener", [
+    ("%(name)s.ndjson", open),
+    ("%(name)s.ndjson.gz", gzip.open),
+])
+def test_ndjson_export_flush(tmpdir, filename, opener):
+    """
+    :class:`NdjsonExportPipeline` records are readable as soon as
+    the flush threshold is reached, before the spider is closed
+    """
+    spider = FakeSpider()
+    pipeline = NdjsonExportPipeline(str(tmpdir.join(filename)), 2, 0)
+    pipeline.open_spider(spider)
+    for i in range(3):
+        pipeline.process_item(ModItem(name="mod%d" % i, mod_url="http://foo.org/%d" % i,
+                                      updated=date(2015, 5, 10)), spider)
+
+    path = str(tmpdir.join(filename % {"name": "curseforge"}))
+    with open(path, "rb") as fd:
+        partial = fd.read()
+    if opener is gzip.open:
+        partial = zlib.decompressobj(16 + zlib.MAX_WBITS).decompress(partial)
+    records = [json.loads(line) for line in partial.decode("utf-8").splitlines()]
+    assert [record["name"] for record in records] == ["mod0", "mod1"]
+    assert records[0]["updated"] == "2015-05-10"
+
+    pipeline.close_spider(spider)
+    with opener(path, "rb") as fd:
+        assert len(fd.read().splitlines()) == 3
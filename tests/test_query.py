@@ -0,0 +1,178 @@
+"""
+Archive queries and daemon tests.
+
+Tests for the queries and the daemon protocol are marked as `query`
+"""
+
+from __future__ import absolute_import
+
+import json
+import socket
+import threading
+import pytest
+
+from datetime import date
+
+from twisted.test.proto_helpers import StringTransport
+from scrapy.settings import Settings
+
+from mpm.items import ModItem
+from mpm.archive import ModArchive
+from mpm.modpack import ModpackIndex
+from mpm.query import QueryEngine
+from mpm.querycache import QueryCache
+from mpm.daemon import QueryFactory, DaemonClient, MpmDaemon
+
+
+@pytest.fixture
+def engine(tmpdir):
+    archive = ModArchive(str(tmpdir.join("archive")))
+    archive.update([
+        ModItem(name="Thaumcraft", mod_url="http://foo.org/mc-mods/223628-thaumcraft",
+                description="magic research", downloads=1000000,
+                updated=date(2015, 5, 10)),
+        ModItem(name="Botania", mod_url="http://foo.org/mc-mods/225643-botania",
+                description="tech magic", downloads=10, updated=date(2015, 4, 1))])
+    archive.commit()
+    return QueryEngine(ModArchive(archive.path).load())
+
+
+@pytest.mark.query
+def test_query_engine(engine, tmpdir):
+    """
+    :class:`QueryEngine` answers show, search and update queries
+    """
+    assert engine.run("show", {"name": "thaumcarft"})[0]["mod"]["name"] == "Thaumcraft"
+    results = engine.run("search", {"query": "magic"})
+    assert [result["mod"]["name"] for result in results] == ["Thaumcraft", "Botania"]
+
+    index = ModpackIndex(str(tmpdir.join("pack")))
+    index.add("http://foo.org/mc-mods/223628-thaumcraft", {"updated": "2015-01-01"})
+    index.add("http://foo.org/mc-mods/225643-botania", {"updated": "2015-04-01"})
+    index.save()
+    outdated = engine.run("update", {"modpack": index.path})
+    assert [result["mod"]["name"] for result in outdated] == ["Thaumcraft"]
+
+    with pytest.raises(ValueError):
+        engine.run("remove", {})
+
+
+@pytest.mark.query
+def test_query_cache(engine, tmpdir, monkeypatch):
+    """
+    Repeated queries are answered from the cache until the archive
+    generation changes, the cache is saved and bounded
+    """
+    path = str(tmpdir.join("queries.json"))
+    engine.cache = QueryCache(path, size=2)
+    first = engine.run("search", {"query": "Magic "})
+
+    def fail(*args):
+        raise AssertionError("cached queries do not search the archive")
+    monkeypatch.setattr(engine.archive, "search", fail)
+    assert engine.run("search", {"query": "magic"}) == first
+    engine.cache.save()
+
+    engine.cache = QueryCache(path, size=2).load()
+    assert engine.run("search", {"query": "MAGIC"}) == first
+    engine.run("show", {"name": "botania"})
+    engine.run("show", {"name": "thaumcraft"})
+    assert len(engine.cache) == 2
+
+    engine.archive.generation += 1
+    with pytest.raises(AssertionError):
+        engine.run("search", {"query": "magic"})
+    assert len(engine.cache) == 0
+
+
+@pytest.mark.query
+def test_query_cache_recency(tmpdir):
+    """
+    The recency of hits is saved, the least recently used query is
+    evicted by the next process
+    """
+    path = str(tmpdir.join("queries.json"))
+    cache = QueryCache(path, size=2)
+    cache.put("a", 1, [[1.0, "a"]])
+    cache.put("b", 1, [[1.0, "b"]])
+    cache.save()
+
+    cache = QueryCache(path, size=2).load()
+    assert cache.get("a", 1) == [[1.0, "a"]]
+    cache.save()
+
+    cache = QueryCache(path, size=2).load()
+    cache.put("c", 1, [[1.0, "c"]])
+    assert cache.get("a", 1) is not None
+    assert cache.get("b", 1) is None
+
+
+@pytest.mark.query
+def test_daemon_protocol(engine):
+    """
+    The daemon protocol answers one json line per request
+    """
+    class FakeDaemon(object):
+        def query(self, command, args):
+            return engine.run(command, args)
+
+    protocol = QueryFactory(FakeDaemon()).buildProtocol(None)
+    transport = StringTransport()
+    protocol.makeConnection(transport)
+    protocol.dataReceived(b'{"command": "show", "args": {"name": "botania"}}\n'
+                          b'{"command": "format", "args": {}}\n')
+    first, second = transport.value().splitlines()
+    assert json.loads(first.decode("utf-8"))["result"][0]["mod"]["name"] == "Botania"
+    assert json.loads(second.decode("utf-8"))["ok"] is False
+
+
+@pytest.mark.query
+def test_daemon_client_fallback(tmpdir):
+    """
+    :class:`DaemonClient` reports that no daemon is running
+    """
+    client = DaemonClient(str(tmpdir.join("daemon.sock")))
+    assert client.query("status") is None
+    assert not client.ping()
+
+    # a daemon closing the connection or too slow to answer
+    path = str(tmpdir.join("mute.sock"))
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(path)
+    server.listen(1)
+    closer = threading.Thread(target=lambda: server.accept()[0].close())
+    closer.start()
+    try:
+        client = DaemonClient(path, timeout=1)
+        assert client.query("status") is None
+        closer.join()
+        client.timeout = 0.1
+        assert client.query("status") is None
+    finally:
+        server.close()
+
+
+@pytest.mark.query
+def test_daemon_sync_failure(tmpdir, monkeypatch):
+    """
+    A failed scheduled sync is logged and the next one still runs
+    """
+    settings = Settings()
+    settings.setmodule("mpm.settings")
+    settings.set("MPM_ARCHIVE_DIR", str(tmpdir.join("archive")))
+    settings.set("MPM_REPOSITORIES", {})
+    daemon = MpmDaemon(settings)
+    loads = []
+
+    def load():
+        loads.append(True)
+        if len(loads) == 1:
+            raise ValueError("corrupted catalog")
+        return daemon.archive
+    monkeypatch.setattr(daemon.archive, "load", load)
+
+    results = []
+    daemon._scheduled_sync().addBoth(results.append)
+    assert results == [None] and daemon.syncing is None
+    daemon._scheduled_sync().addBoth(results.append)
+    assert results == [None, None] and len(loads) == 2
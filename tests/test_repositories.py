@@ -0,0 +1,54 @@
+"""
+Repository registry tests.
+
+Tests for the repository spiders registry are marked as `repository`
+"""
+
+from __future__ import absolute_import
+
+import pytest
+
+from scrapy.settings import Settings
+
+from mpm.spiders.curseforge import CurseforgeSpider
+from mpm.spiders.modinfo import load_repositories, repository_crawlers
+
+
+def mpm_settings(**overrides):
+    settings = Settings()
+    settings.setmodule("mpm.settings", priority="project")
+    settings.setdict(overrides, priority="cmdline")
+    return settings
+
+
+@pytest.mark.repository
+def test_load_repositories():
+    """
+    The curseforge spider is registered by default
+    """
+    assert load_repositories(mpm_settings()) == {"curseforge": CurseforgeSpider}
+
+
+@pytest.mark.repository
+def test_load_repositories_rejects_plain_spiders():
+    """
+    Only :class:`RepositorySpider` subclasses can be registered
+    """
+    settings = mpm_settings(MPM_REPOSITORIES={"other": "scrapy.spiders.Spider"})
+    with pytest.raises(TypeError):
+        load_repositories(settings)
+
+
+@pytest.mark.repository
+def test_repository_crawlers_settings():
+    """
+    Each repository crawler gets its own throttling settings
+    """
+    settings = mpm_settings(MPM_REPOSITORIES={
+        "curseforge": "mpm.spiders.curseforge.CurseforgeSpider",
+        "mirror": "mpm.spiders.curseforge.CurseforgeSpider"},
+        MPM_REPOSITORY_SETTINGS={"mirror": {"DOWNLOAD_DELAY": 1}})
+    crawlers = repository_crawlers(settings)
+    assert [crawler.settings.getfloat("DOWNLOAD_DELAY") for crawler in crawlers] == [5, 1]
+    with pytest.raises(KeyError):
+        repository_crawlers(settings, ["missing"])
@@ -0,0 +1,98 @@
+"""
+Download url resolution tests.
+
+Tests for the url resolver are marked as `resolver`
+"""
+
+from __future__ import absolute_import
+
+import base64
+import pytest
+
+from mpm.resolver import UrlResolver, next_hop
+
+
+class FakeResponse(object):
+
+    def __init__(self, url, content_type, body=b"", headers=None):
+        self.url = url
+        self.headers = dict(headers or {}, **{"Content-Type": content_type})
+        self.body = body
+
+    def geturl(self):
+        return self.url
+
+    def info(self):
+        return self.headers
+
+    def read(self, size=-1):
+        return self.body
+
+    def close(self):
+        pass
+
+
+class FakeOpener(object):
+    """ Serve canned responses and count the requests """
+
+    def __init__(self, responses):
+        self.responses = responses
+        self.opened = []
+
+    def open(self, request, timeout=None):
+        self.opened.append(request.get_full_url())
+        return self.responses[request.get_full_url()]
+
+
+def encode_ysmm(url):
+    """ Inverse of :func:`mpm.resolver.decode_ysmm` """
+    data = base64.b64encode(b"00" + url.encode("ascii")).decode("ascii")
+    half = (len(data) + 1) // 2
+    left, right = data[:half], data[half:][::-1]
+    return "".join(a + b for a, b in zip(left, right))
+
+
+@pytest.mark.resolver
+@pytest.mark.parametrize("body,expected", [
+    ('<meta http-equiv="refresh" content="5; url=/file.jar">', "http://foo.org/file.jar"),
+    ('<script>window.location.href = "http://cdn.org/a.jar";</script>', "http://cdn.org/a.jar"),
+    ('<a id="skip_button" href="http://cdn.org/b.jar">Skip</a>', "http://cdn.org/b.jar"),
+    ("<script>var ysmm = '%s';</script>" % encode_ysmm("http://cdn.org/c.jar"),
+     "http://cdn.org/c.jar"),
+    ("<html><body>nothing here</body></html>", None),
+])
+def test_next_hop(body, expected):
+    """
+    Interstitial pages lead to the next url
+    """
+    assert next_hop(body, "http://foo.org/adpage") == expected
+
+
+@pytest.mark.resolver
+def test_resolver_cache(tmpdir):
+    """
+    Interstitial chains are followed once and the direct url is cached
+    """
+    cache = str(tmpdir.join("cache", "resolved.json"))
+    opener = FakeOpener({
+        "http://adf.ly/abc": FakeResponse(
+            "http://adf.ly/abc", "text/html; charset=utf-8",
+            b'<meta http-equiv="refresh" content="0; url=http://cdn.org/mod.jar">'),
+        "http://cdn.org/mod.jar": FakeResponse(
+            "http://cdn.org/mod.jar", "application/java-archive",
+            headers={"Cache-Control": "public, max-age=3600"}),
+    })
+    resolver = UrlResolver(cache)
+    resolver.opener = opener
+    assert resolver.resolve("http://adf.ly/abc") == "http://cdn.org/mod.jar"
+    assert opener.opened == ["http://adf.ly/abc", "http://cdn.org/mod.jar"]
+
+    resolver = UrlResolver(cache)
+    resolver.opener = opener
+    assert resolver.resolve_many(["http://adf.ly/abc"]) == {
+        "http://adf.ly/abc": "http://cdn.org/mod.jar"}
+    assert len(opener.opened) == 2
+
+    resolver.cache["http://adf.ly/abc"]["expires"] = 0
+    resolver.resolve("http://adf.ly/abc")
+    assert len(opener.opened) == 4
@@ -0,0 +1,85 @@
+"""
+Mods folder scanner tests.
+
+Tests for the scanner are marked as `scanner`
+"""
+
+from __future__ import absolute_import
+
+import os
+import json
+import zipfile
+import pytest
+
+from mpm import scanner
+from mpm.items import ModItem
+from mpm.archive import ModArchive
+from mpm.scanner import ModScanner, parse_mod_info
+
+
+def make_jar(path, info):
+    """ Write a mod jar with the given mcmod.info content """
+    with zipfile.ZipFile(path, "w") as jar:
+        jar.writestr("assets/big.bin", b"\0" * 4096)
+        if info is not None:
+            jar.writestr("mcmod.info", info)
+
+
+@pytest.mark.scanner
+def test_parse_mod_info_formats():
+    """
+    Both mcmod.info formats are parsed, broken json is tolerated
+    """
+    assert parse_mod_info(b'[{"modid": "a", "name": "A",}]')[0]["modid"] == "a"
+    assert parse_mod_info(b'{"modListVersion": 2, "modList": [{"modid": "b"}]}') == [{"modid": "b"}]
+    assert parse_mod_info(b'42') == []
+    assert parse_mod_info(b'{"modList": null}') == []
+
+
+@pytest.mark.scanner
+def test_scan_cached(tmpdir, monkeypatch):
+    """
+    :class:`ModScanner` reads each jar once and matches it to the archive
+    """
+    mods = tmpdir.mkdir("mods")
+    make_jar(str(mods.join("tconstruct.jar")),
+             json.dumps([{"modid": "TConstruct", "name": "Tinkers' Construct",
+                          "version": "1.8.5"}]))
+    make_jar(str(mods.join("nometa.jar")), None)
+    make_jar(str(mods.join("scalar.jar")), "42")
+    cache = str(tmpdir.join("cache", "scan.json"))
+
+    results = ModScanner(cache).scan(str(mods))
+    assert results[str(mods.join("tconstruct.jar"))][0]["version"] == "1.8.5"
+    assert results[str(mods.join("nometa.jar"))] == []
+    assert results[str(mods.join("scalar.jar"))] == []
+
+    def fail(path):
+        raise AssertionError("jar %s read again" % path)
+    monkeypatch.setattr(scanner, "read_mod_info", fail)
+    rescanner = ModScanner(cache)
+    assert rescanner.scan(str(mods)) == results
+
+    archive = ModArchive(str(tmpdir.join("archive")))
+    archive.update([ModItem(name="Tinkers Construct",
+                            mod_url="http://foo.org/mc-mods/74072-tinkers-construct")])
+    matched = rescanner.match(results, archive)
+    assert matched[str(mods.join("tconstruct.jar"))]["name"] == "Tinkers Construct"
+    assert matched[str(mods.join("nometa.jar"))] is None
+
+
+@pytest.mark.scanner
+def test_scan_same_second_rewrite(tmpdir):
+    """
+    A jar rewritten with the same size within the same second as the
+    cached scan is read again
+    """
+    mods = tmpdir.mkdir("mods")
+    path = str(mods.join("mod.jar"))
+    make_jar(path, json.dumps([{"modid": "a"}]))
+    os.utime(path, (1000000000.25, 1000000000.25))
+    cache = str(tmpdir.join("scan.json"))
+    assert ModScanner(cache).scan(str(mods))[path] == [{"modid": "a"}]
+    make_jar(path, json.dumps([{"modid": "b"}]))
+    os.utime(path, (1000000000.75, 1000000000.75))
+    assert ModScanner(cache).scan(str(mods))[path] == [{"modid": "b"}]
@@ -0,0 +1,97 @@
+"""
+Server pack tests.
+
+Tests for the server pack builder are marked as `serverpack`
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+import os
+import tarfile
+import zipfile
+import hashlib
+import pytest
+
+from mpm.items import ModItem
+from mpm.archive import ModArchive
+from mpm.modpack import ModpackIndex
+from mpm.serverpack import ServerPackBuilder, pack_format
+
+SERVER_URL = "http://foo.org/mc-mods/74072-tinkers-construct"
+CLIENT_URL = "http://foo.org/mc-mods/222880-journeymap"
+
+
+def make_modpack(tmpdir):
+    """ Modpack with a server mod, a client only mod and a config file """
+    archive = ModArchive(str(tmpdir.join("archive")))
+    archive.update([ModItem(name="Tinkers Construct", mod_url=SERVER_URL, smp=True),
+                    ModItem(name="JourneyMap", mod_url=CLIENT_URL, smp=False)])
+    archive.commit()
+    modpack = tmpdir.mkdir("modpack")
+    index = ModpackIndex(str(modpack))
+    for mod_url, name in ((SERVER_URL, "TConstruct.jar"), (CLIENT_URL, "JourneyMap.jar")):
+        data = name.encode("ascii") * 100
+        modpack.join("mods", name).write_binary(data, ensure=True)
+        index.add(mod_url, {"file": "mods/" + name, "size": len(data),
+                            "sha256": hashlib.sha256(data).hexdigest()})
+    index.save()
+    modpack.join("config", "tconstruct.cfg").write_binary(b"B:enabled=true\n", ensure=True)
+    return archive, modpack
+
+
+@pytest.mark.serverpack
+def test_server_pack_zip(tmpdir):
+    """
+    The server pack holds the server mods, hardlinked in the staging
+    directory, and the configs; it is only rewritten when files change
+    """
+    archive, modpack = make_modpack(tmpdir)
+    output = str(tmpdir.join("server.zip"))
+    builder = ServerPackBuilder(ModpackIndex(str(modpack)).load(), archive)
+    result = builder.build(output)
+    assert result["written"]
+    assert result["files"] == ["config/tconstruct.cfg", "mods/TConstruct.jar"]
+
+    with zipfile.ZipFile(output) as pack:
+        infos = dict((info.filename, info) for info in pack.infolist())
+        assert sorted(infos) == result["files"]
+        assert infos["mods/TConstruct.jar"].compress_type == zipfile.ZIP_STORED
+        assert infos["config/tconstruct.cfg"].compress_type == zipfile.ZIP_DEFLATED
+        assert pack.read("mods/TConstruct.jar") == b"TConstruct.jar" * 100
+    staged = os.path.join(builder.stage_path, "mods", "TConstruct.jar")
+    assert os.stat(staged).st_ino == modpack.join("mods", "TConstruct.jar").stat().ino
+
+    result = builder.build(output)
+    assert not result["written"]
+    assert result["staged"] == []
+
+    config = modpack.join("config", "tconstruct.cfg")
+    config.write_binary(b"B:enabled=false\n")
+    config.setmtime(config.mtime() + 10)
+    result = builder.build(output)
+    assert result["written"]
+    assert result["staged"] == ["config/tconstruct.cfg"]
+    with zipfile.ZipFile(output) as pack:
+        assert pack.read("config/tconstruct.cfg") == b"B:enabled=false\n"
+
+    tar_output = str(tmpdir.join("server.tar.gz"))
+    assert pack_format(tar_output) == "tar.gz"
+    assert builder.build(tar_output)["written"]
+    with tarfile.open(tar_output) as pack:
+        assert sorted(pack.getnames()) == result["files"]
+
+
+@pytest.mark.serverpack
+def test_server_pack_missing_file(tmpdir):
+    """
+    A server mod whose file was deleted is left out and reported, an
+    unsupported output format is refused
+    """
+    archive, modpack = make_modpack(tmpdir)
+    modpack.join("mods", "TConstruct.jar").remove()
+    builder = ServerPackBuilder(ModpackIndex(str(modpack)).load(), archive)
+    result = builder.build(str(tmpdir.join("server.zip")))
+    assert result["files"] == ["config/tconstruct.cfg"]
+    assert result["missing"] == [SERVER_URL]
+    with pytest.raises(ValueError):
+        builder.build(str(tmpdir.join("server.rar")))
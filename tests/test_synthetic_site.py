@@ -0,0 +1,42 @@
+"""
+Synthetic site tests.
+
+The pages of the load test site must be understood by the spider, tests
+for the synthetic site are marked as `loadtest`
+"""
+
+from __future__ import absolute_import
+
+import pytest
+
+from mpm.spiders.curseforge import CurseforgeSpider
+
+from builder.synthetic import SyntheticSite
+from helpers import build_scrapy_response, assert_parse_requests
+
+
+@pytest.mark.loadtest
+def test_synthetic_list_page():
+    """
+    The first list page links its mods and the other list pages
+    """
+    site = SyntheticSite(mods=45, per_page=20)
+    status, body = site.render_path(b"/mc-mods", {})
+    assert status == 200
+    response = build_scrapy_response("http://127.0.0.1/mc-mods", body)
+    urls = ["http://127.0.0.1/mc-mods/%d-synthetic-mod-%d" % (i, i) for i in range(20)]
+    urls += ["http://127.0.0.1/mc-mods?page=2", "http://127.0.0.1/mc-mods?page=3"]
+    assert_parse_requests(CurseforgeSpider().parse(response), urls)
+
+
+@pytest.mark.loadtest
+def test_synthetic_mod_page():
+    """
+    Mod pages are generated for every mod in the catalog
+    """
+    site = SyntheticSite(mods=45, per_page=20)
+    status, body = site.render_path(b"/mc-mods/44-synthetic-mod-44", {})
+    response = build_scrapy_response("http://127.0.0.1/mc-mods/44-synthetic-mod-44", body)
+    parsed = list(CurseforgeSpider().parse_mod_page(response))
+    assert parsed[0].meta["item"]["name"] == "Synthetic Mod 44"
+    assert site.render_path(b"/mc-mods/45-synthetic-mod-45", {})[0] == 404
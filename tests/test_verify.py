@@ -0,0 +1,74 @@
+"""
+Modpack verification tests.
+
+Tests for the modpack verification are marked as `verify`
+"""
+
+from __future__ import absolute_import
+
+import os
+import hashlib
+import pytest
+
+from mpm import verify
+from mpm.modpack import ModpackIndex
+from mpm.verify import Verifier, hash_file
+
+
+def make_modpack(tmpdir, files):
+    """ Create a modpack with the given files installed """
+    index = ModpackIndex(str(tmpdir))
+    mods = tmpdir.mkdir("mods")
+    for name, data in files.items():
+        mods.join(name).write_binary(data)
+        index.add("http://foo.org/mc-mods/" + name,
+                  {"file": "mods/" + name, "size": len(data),
+                   "sha256": hashlib.sha256(data).hexdigest()})
+    index.save()
+    return index
+
+
+@pytest.mark.verify
+def test_hash_file_mmap(tmpdir, monkeypatch):
+    """
+    Mapped and buffered hashing give the same digest
+    """
+    path = tmpdir.join("big.jar")
+    path.write_binary(b"mod" * 100000)
+    buffered = hash_file(str(path))
+    monkeypatch.setattr(verify, "MMAP_THRESHOLD", 1)
+    assert hash_file(str(path)) == buffered == hashlib.sha256(b"mod" * 100000).hexdigest()
+
+
+@pytest.mark.verify
+def test_verify_incremental(tmpdir, monkeypatch):
+    """
+    :class:`Verifier` only hashes changed files and reports corrupted ones
+    """
+    index = make_modpack(tmpdir, {"a.jar": b"a" * 1000, "b.jar": b"b" * 1000})
+    assert Verifier(index).verify(signatures=False) == []
+
+    def fail(path):
+        raise AssertionError("%s hashed again" % path)
+    monkeypatch.setattr(verify, "hash_file", fail)
+    assert Verifier(index).verify(signatures=False) == []
+
+    monkeypatch.undo()
+    tmpdir.join("mods", "b.jar").write_binary(b"corrupted")
+    failures = Verifier(index).verify(signatures=False, fail_fast=True)
+    assert failures == [(str(tmpdir.join("mods", "b.jar")), "hash mismatch")]
+
+
+@pytest.mark.verify
+def test_verify_same_second_rewrite(tmpdir):
+    """
+    A file rewritten with the same size within the same second as the
+    cached hash is hashed again
+    """
+    index = make_modpack(tmpdir, {"a.jar": b"a" * 1000})
+    path = str(tmpdir.join("mods", "a.jar"))
+    os.utime(path, (1000000000.25, 1000000000.25))
+    assert Verifier(index).verify(signatures=False) == []
+    tmpdir.join("mods", "a.jar").write_binary(b"b" * 1000)
+    os.utime(path, (1000000000.75, 1000000000.75))
+    assert Verifier(index).verify(signatures=False) == [(path, "hash mismatch")]